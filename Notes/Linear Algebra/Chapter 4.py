@@ -10,6 +10,7 @@ Table of Contents:
 3. Part C: Visualization of K-Means Process
 4. Part D: Real-World Applications
 5. Part E: Advanced Topics (Elbow Method, Silhouette Score)
+6. Part F: Scaling K-Means to Large Data
 
 ================================================================================
 WHY DO WE NEED CLUSTERING?
@@ -43,7 +44,21 @@ PART A: IMPLEMENTATION FROM SCRATCH
 ================================================================================
 """
 
+import collections
+import contextlib
+import heapq
+import io
+import multiprocessing
+import os
 import random
+import sys
+import time
+
+# The default 'python' backend does its distance math with plain lists and
+# loops (see euclidean_distance). NumPy powers the fast backend
+# (backend='numpy') and the shared bookkeeping: weights, inertia sums and
+# chunked out-of-core data.
+import numpy as np
 
 # First, let's implement helper functions we need
 def euclidean_distance(point1, point2):
@@ -66,6 +81,26 @@ def euclidean_distance(point1, point2):
     return sum_squared ** 0.5
 
 
+def squared_euclidean_distance(point1, point2):
+    """
+    Squared Euclidean distance between two points (no square root).
+    
+    Why we need this:
+    -----------------
+    Finding the NEAREST centroid only needs to compare distances, and
+    d₁ < d₂ exactly when d₁² < d₂². Inertia needs d² anyway - so skipping
+    the square root saves work AND avoids squaring it again later.
+    """
+    if len(point1) != len(point2):
+        raise ValueError("Points must have same dimensions")
+    
+    sum_squared = 0
+    for i in range(len(point1)):
+        sum_squared += (point1[i] - point2[i]) ** 2
+    
+    return sum_squared
+
+
 def calculate_centroid(points):
     """
     Calculate the centroid (mean position) of a group of points.
@@ -98,10 +133,652 @@ def calculate_centroid(points):
     return centroid
 
 
+def squared_distances_numpy(X, centroids, X_norms=None, centroid_norms=None):
+    """
+    Squared Euclidean distances from EVERY point to EVERY centroid at once.
+    
+    Why we need this:
+    -----------------
+    Calling euclidean_distance() once per (point, centroid) pair means
+    n × k trips through the Python interpreter every iteration.
+    
+    The trick: expand the square!
+        ‖x - c‖² = ‖x‖² - 2·x·c + ‖c‖²
+    
+    - The middle term for all pairs is ONE matrix multiply (X @ C.T)
+    - ‖x‖² never changes during fit, so it can be computed once and reused
+    - ‖c‖² is only k numbers
+    
+    Parameters:
+    -----------
+    X : np.ndarray, shape (n, d)
+        Data points
+    centroids : np.ndarray, shape (k, d)
+        Cluster centers
+    X_norms : np.ndarray, shape (n,), optional
+        Cached ‖x‖² for every point (computed here if not given)
+    centroid_norms : np.ndarray, shape (k,), optional
+        Cached ‖c‖² for every centroid (computed here if not given)
+        
+    Returns:
+    --------
+    np.ndarray, shape (n, k)
+        Squared distance from point i to centroid j
+    """
+    if X_norms is None:
+        X_norms = np.einsum('ij,ij->i', X, X)
+    if centroid_norms is None:
+        centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    
+    distances_sq = X_norms[:, np.newaxis] - 2 * (X @ centroids.T)
+    distances_sq += centroid_norms[np.newaxis, :]
+    
+    # Rounding can make distances of (almost) identical points slightly negative
+    np.maximum(distances_sq, 0, out=distances_sq)
+    return distances_sq
+
+
+def cluster_sums_numpy(X, labels, k, sample_weight=None):
+    """
+    Per-cluster coordinate sums and point counts in ONE pass over the data.
+    
+    Why not a mask per cluster?
+    ---------------------------
+    X[labels == j] for every cluster j scans all n labels k times: O(n·k).
+    np.bincount adds every point straight into its cluster's bucket,
+    so the cost is O(n·d) no matter how many clusters there are.
+    
+    Parameters:
+    -----------
+    X : np.ndarray, shape (n, d)
+        Data points
+    labels : np.ndarray of int, shape (n,)
+        Cluster of each point
+    k : int
+        Number of clusters
+    sample_weight : np.ndarray, shape (n,), optional
+        Weight of each point (a point of weight w counts as w copies)
+        
+    Returns:
+    --------
+    tuple of (np.ndarray (k, d), np.ndarray (k,))
+        (Weighted) sum of the points in each cluster, and the number
+        (total weight) of points
+    """
+    counts = np.bincount(labels, weights=sample_weight, minlength=k)
+    sums = np.empty((k, X.shape[1]))
+    for dim in range(X.shape[1]):
+        column = X[:, dim] if sample_weight is None else X[:, dim] * sample_weight
+        sums[:, dim] = np.bincount(labels, weights=column, minlength=k)
+    return sums, counts
+
+
+def kmeans_plusplus_numpy(X, k, rng, X_norms=None, sample_weight=None):
+    """
+    Pick k initial centroids with K-Means++ (D² sampling).
+    
+    Why not just random points?
+    ---------------------------
+    Random seeds often land two centroids in the same cluster and none in
+    another. K-Means then needs many iterations (or restarts) to recover.
+    
+    The K-Means++ idea:
+    -------------------
+    1. First centroid: a random point
+    2. Every next centroid: a random point chosen with probability
+       proportional to D(x)², its squared distance to the nearest
+       centroid picked so far
+    Far-away points are likely picks, so the seeds spread over the data.
+    
+    Parameters:
+    -----------
+    X : np.ndarray, shape (n, d)
+        Data points
+    k : int
+        Number of centroids to pick
+    rng : np.random.Generator
+        Source of randomness
+    X_norms : np.ndarray, shape (n,), optional
+        Cached ‖x‖² for every point
+    sample_weight : np.ndarray, shape (n,), optional
+        How many points each row stands for (default: 1 each)
+        
+    Returns:
+    --------
+    np.ndarray, shape (k, d)
+        The chosen centroids
+    """
+    n = len(X)
+    weights = np.ones(n) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+    
+    first = rng.choice(n, p=weights / weights.sum())
+    chosen = [first]
+    closest_d2 = squared_distances_numpy(X, X[first:first + 1], X_norms)[:, 0]
+    
+    for _ in range(1, k):
+        # D² sampling: one cumulative sum and one binary search
+        probabilities = weights * closest_d2
+        total = probabilities.sum()
+        if total == 0:
+            # Every point sits on a centroid already - any pick will do
+            index = rng.integers(n)
+        else:
+            index = np.searchsorted(np.cumsum(probabilities), rng.random() * total)
+            index = min(index, n - 1)
+        
+        chosen.append(index)
+        new_d2 = squared_distances_numpy(X, X[index:index + 1], X_norms)[:, 0]
+        np.minimum(closest_d2, new_d2, out=closest_d2)
+    
+    return X[chosen].copy()
+
+
+def kmeans_parallel_numpy(X, k, rng, X_norms=None, oversampling=None, rounds=5,
+                          chunk_size=65536, sample_weight=None):
+    """
+    Pick k initial centroids with K-Means|| ("scalable K-Means++").
+    
+    Why do we need this?
+    --------------------
+    K-Means++ makes k passes over the data - one per centroid. With
+    millions of points and hundreds of clusters, seeding alone gets slow.
+    
+    The K-Means|| idea:
+    -------------------
+    1. Start with one random point
+    2. For a few rounds, sample ~ℓ points AT ONCE, each with probability
+       ℓ · D(x)² / Σ D²  (ℓ = oversampling factor, default 2k)
+    3. Weight each candidate by how many points are closest to it
+    4. Run weighted K-Means++ on the small candidate set to get k seeds
+    Only rounds + 1 passes over the data, regardless of k!
+    
+    Parameters:
+    -----------
+    X : np.ndarray, shape (n, d)
+        Data points
+    k : int
+        Number of centroids to pick
+    rng : np.random.Generator
+        Source of randomness
+    X_norms : np.ndarray, shape (n,), optional
+        Cached ‖x‖² for every point
+    oversampling : float, optional
+        Expected candidates per round (default 2k)
+    rounds : int
+        Number of oversampling passes
+    chunk_size : int
+        Rows per block when measuring distances to the candidates
+    sample_weight : np.ndarray, shape (n,), optional
+        Weight of each point (sampling uses weight × D²)
+        
+    Returns:
+    --------
+    np.ndarray, shape (k, d)
+        The chosen centroids
+    """
+    n = len(X)
+    if X_norms is None:
+        X_norms = np.einsum('ij,ij->i', X, X)
+    oversampling = 2 * k if oversampling is None else oversampling
+    
+    if sample_weight is None:
+        first = rng.integers(n)
+    else:
+        sample_weight = np.asarray(sample_weight, dtype=float)
+        first = rng.choice(n, p=sample_weight / sample_weight.sum())
+    candidates = [first]
+    closest_d2 = squared_distances_numpy(X, X[first:first + 1], X_norms)[:, 0]
+    
+    for _ in range(rounds):
+        cost = closest_d2 if sample_weight is None else sample_weight * closest_d2
+        total = cost.sum()
+        if total == 0:
+            break
+        
+        # Each point is picked independently - many centroids per pass
+        probabilities = np.minimum(oversampling * cost / total, 1.0)
+        new = np.flatnonzero(rng.random(n) < probabilities)
+        if len(new) == 0:
+            continue
+        
+        candidates.extend(new.tolist())
+        for start in range(0, n, chunk_size):
+            block = slice(start, start + chunk_size)
+            new_d2 = squared_distances_numpy(X[block], X[new], X_norms[block]).min(axis=1)
+            np.minimum(closest_d2[block], new_d2, out=closest_d2[block])
+    
+    candidates = np.unique(candidates)
+    if len(candidates) <= k:
+        # Too few candidates - top up with random points
+        extra = rng.choice(np.setdiff1d(np.arange(n), candidates),
+                           size=k - len(candidates), replace=False)
+        return X[np.concatenate([candidates, extra])].copy()
+    
+    # Weight = number of points for which the candidate is closest
+    candidate_points = X[candidates]
+    weights = np.zeros(len(candidates))
+    for start in range(0, n, chunk_size):
+        block = slice(start, start + chunk_size)
+        nearest = squared_distances_numpy(X[block], candidate_points, X_norms[block]).argmin(axis=1)
+        block_weight = None if sample_weight is None else sample_weight[block]
+        weights += np.bincount(nearest, weights=block_weight, minlength=len(candidates))
+    
+    return kmeans_plusplus_numpy(candidate_points, k, rng, sample_weight=weights)
+
+
+def nearest_centroids_numpy(X, centroids, X_norms=None, chunk_size=None):
+    """
+    Brute-force nearest centroid for every point, in bounded blocks.
+    
+    Why blocks?
+    -----------
+    The full (n, k) distance block for 1M points and k=4096 would need
+    32 GB! Processing chunk_size rows at a time keeps memory bounded
+    (by default about 4 million distances per block).
+    
+    Returns:
+    --------
+    tuple of (np.ndarray of int, np.ndarray of float)
+        Nearest centroid of each point, and the squared distance to it
+    """
+    n = len(X)
+    if chunk_size is None:
+        chunk_size = max(1, 4_000_000 // max(len(centroids), 1))
+    
+    labels = np.empty(n, dtype=np.intp)
+    min_distances_sq = np.empty(n)
+    for start in range(0, n, chunk_size):
+        block = slice(start, start + chunk_size)
+        block_norms = None if X_norms is None else X_norms[block]
+        distances_sq = squared_distances_numpy(X[block], centroids, block_norms)
+        labels[block] = np.argmin(distances_sq, axis=1)
+        min_distances_sq[block] = distances_sq[np.arange(len(distances_sq)), labels[block]]
+    
+    return labels, min_distances_sq
+
+
+def group_centroids(centroids, n_groups, rng, iterations=5):
+    """
+    Split the centroids into n_groups groups of nearby centroids.
+    
+    Used by Yinyang K-Means: a few Lloyd iterations on the CENTROIDS
+    themselves (k points, so this is cheap), seeded with K-Means++.
+    
+    Returns:
+    --------
+    np.ndarray of int, shape (k,)
+        Group of each centroid, numbered 0 .. (number of groups - 1)
+    """
+    centroids = np.asarray(centroids, dtype=np.float64)
+    n_groups = min(n_groups, len(centroids))
+    group_centers = kmeans_plusplus_numpy(centroids, n_groups, rng)
+    for _ in range(iterations):
+        groups, _ = nearest_centroids_numpy(centroids, group_centers)
+        sums, counts = cluster_sums_numpy(centroids, groups, n_groups)
+        filled = counts > 0
+        group_centers[filled] = sums[filled] / counts[filled, np.newaxis]
+    
+    groups, _ = nearest_centroids_numpy(centroids, group_centers)
+    # Renumber so that no group is empty
+    _, groups = np.unique(groups, return_inverse=True)
+    return groups.ravel()
+
+
+class CentroidKDTree:
+    """
+    KD-tree over the centroids, for fast nearest-centroid queries.
+    
+    Why do we need this?
+    --------------------
+    In production predict() runs far more often than fit(): every new
+    customer needs a segment. Brute force compares each point with ALL k
+    centroids - with k in the thousands that is the latency floor.
+    
+    How it works:
+    -------------
+    Build (once): split the centroids in half along the dimension with the
+    largest spread, and repeat on each half until only a few are left.
+    
+    Query (many points at once): descend into the half containing each
+    point first. The other half is only searched by points whose best
+    distance so far crosses the splitting plane - all others skip it.
+    In low dimensions (2-10) most points check only a few leaves.
+    """
+    
+    def __init__(self, centroids, leaf_size=8):
+        """
+        Parameters:
+        -----------
+        centroids : np.ndarray, shape (k, d)
+            Cluster centers to index
+        leaf_size : int
+            Most centroids kept in one leaf (checked by brute force)
+        """
+        self.centroids = np.asarray(centroids)
+        self.leaf_size = leaf_size
+        self.n_distance_evaluations = 0
+        self.root = self._build(np.arange(len(self.centroids)))
+    
+    def _build(self, indices):
+        """Leaves are index arrays; inner nodes are (dim, split, left, right)."""
+        if len(indices) <= self.leaf_size:
+            return indices
+        
+        points = self.centroids[indices]
+        dim = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        order = np.argsort(points[:, dim], kind='stable')
+        middle = len(indices) // 2
+        
+        # Everything left is ≤ split, everything right is ≥ split
+        split = points[order[middle], dim]
+        return (dim, split,
+                self._build(indices[order[:middle]]),
+                self._build(indices[order[middle:]]))
+    
+    def query(self, X):
+        """
+        Nearest centroid for every row of X.
+        
+        Returns:
+        --------
+        tuple of (np.ndarray of int, np.ndarray of float)
+            Nearest centroid of each point, and the squared distance to it
+        """
+        X = np.asarray(X, dtype=self.centroids.dtype)
+        labels = np.zeros(len(X), dtype=np.intp)
+        best_distances_sq = np.full(len(X), np.inf)
+        self._search(self.root, X, np.arange(len(X)), labels, best_distances_sq)
+        return labels, best_distances_sq
+    
+    def _search(self, node, X, query_ids, labels, best_distances_sq):
+        """Update the best centroid of the given queries from one subtree."""
+        if len(query_ids) == 0:
+            return
+        
+        if isinstance(node, np.ndarray):
+            # Leaf: brute force over its few centroids
+            distances_sq = squared_distances_numpy(X[query_ids], self.centroids[node])
+            self.n_distance_evaluations += distances_sq.size
+            nearest = np.argmin(distances_sq, axis=1)
+            nearest_sq = distances_sq[np.arange(len(query_ids)), nearest]
+            
+            better = nearest_sq < best_distances_sq[query_ids]
+            labels[query_ids[better]] = node[nearest[better]]
+            best_distances_sq[query_ids[better]] = nearest_sq[better]
+            return
+        
+        dim, split, left, right = node
+        gap = X[query_ids, dim] - split
+        on_left = gap <= 0
+        left_ids, right_ids = query_ids[on_left], query_ids[~on_left]
+        
+        # Near side first: it usually contains the nearest centroid
+        self._search(left, X, left_ids, labels, best_distances_sq)
+        self._search(right, X, right_ids, labels, best_distances_sq)
+        
+        # Far side: only if the best distance so far reaches across the split
+        crosses_left = gap[on_left] ** 2 < best_distances_sq[left_ids]
+        crosses_right = gap[~on_left] ** 2 < best_distances_sq[right_ids]
+        self._search(right, X, left_ids[crosses_left], labels, best_distances_sq)
+        self._search(left, X, right_ids[crosses_right], labels, best_distances_sq)
+
+
+class ChunkedDataset:
+    """
+    Data that is read in fixed-size chunks instead of loaded all at once.
+    
+    Why do we need this?
+    --------------------
+    Segmentation tables can be far larger than RAM. K-Means only ever
+    needs ONE chunk of points at a time (plus the k centroids), so we read
+    the data piece by piece and never hold all of it.
+    
+    Supported sources:
+    ------------------
+    - Path to a .npy file     → opened memory-mapped (np.load(mmap_mode='r'))
+    - np.memmap               → sliced chunk by chunk
+    - function returning an iterator of chunks → called once per pass
+    - plain iterator of chunks → can be read only ONCE (fine for predict)
+    """
+    
+    def __init__(self, source, chunk_size=65536, dtype=np.float64):
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+        self._array = None
+        self._make_chunks = None
+        self._iterator = None
+        
+        if isinstance(source, (str, os.PathLike)):
+            source = np.load(source, mmap_mode='r')
+        
+        if isinstance(source, np.ndarray):
+            self._array = source
+        elif callable(source):
+            self._make_chunks = source
+        elif iter(source) is source:
+            self._iterator = source
+        else:
+            raise TypeError(f"Can't read chunks from {type(source).__name__}")
+    
+    @property
+    def reusable(self):
+        """Can the data be read more than once (needed for fit)?"""
+        return self._iterator is None
+    
+    def chunks(self):
+        """Yield the data as dtype arrays of at most chunk_size rows."""
+        if self._array is not None:
+            for start in range(0, len(self._array), self.chunk_size):
+                yield np.asarray(self._array[start:start + self.chunk_size], dtype=self.dtype)
+            return
+        
+        if self._make_chunks is not None:
+            chunk_source = self._make_chunks()
+        else:
+            if self._iterator is None:
+                raise ValueError("This iterator was already read - pass a function "
+                                 "that returns a fresh iterator instead")
+            chunk_source, self._iterator = self._iterator, None
+        
+        for chunk in chunk_source:
+            yield np.asarray(chunk, dtype=self.dtype)
+
+
+def is_out_of_core(data):
+    """True if data should be streamed in chunks rather than loaded whole."""
+    if isinstance(data, (str, os.PathLike, np.memmap)):
+        return True
+    if isinstance(data, (list, tuple, np.ndarray)):
+        return False
+    return callable(data) or iter(data) is data
+
+
+def lightweight_coreset(data, size, random_state=0, chunk_size=65536):
+    """
+    Build a small WEIGHTED sample whose K-Means cost matches the full data.
+    
+    Why do we need this?
+    --------------------
+    An elbow sweep over a 100M-row table fits K-Means once per K - each
+    fit dozens of passes over the data. A coreset of a few thousand
+    weighted points stands in for the table: every fit takes milliseconds.
+    
+    How it works (lightweight coreset, Bachem et al. 2018):
+    -------------------------------------------------------
+    1. Pass 1: the mean μ and the total squared distance to it
+    2. Pass 2: draw `size` points, point x with probability
+           q(x) = 1/2 · 1/n  +  1/2 · d(x, μ)² / Σ d(·, μ)²
+       (half uniform, half "far from the mean" - outliers are not missed)
+    3. Weight every draw by 1 / (size · q(x))
+    For ANY set of k centroids, the weighted cost of the sample is an
+    unbiased estimate of the full cost. With size = O(d·k·log k / ε²) the
+    error is at most ε·(cost + cost of the single mean), with high
+    probability - whatever the centroids.
+    
+    Streaming draw: each chunk gets a Binomial share of the remaining
+    draws, then picks its points - an exact sample, one chunk in memory.
+    
+    Parameters:
+    -----------
+    data : 2D array, .npy path, np.memmap or chunk iterator function
+        The data (read twice, so iterators must be re-creatable)
+    size : int
+        Number of draws in the coreset
+    random_state : int
+        Random seed
+    chunk_size : int
+        Rows per chunk
+        
+    Returns:
+    --------
+    tuple of (np.ndarray (m, d), np.ndarray (m,))
+        Coreset points and their weights (draws of the same point are merged)
+    """
+    dataset = ChunkedDataset(data if is_out_of_core(data) else np.asarray(data, dtype=float),
+                             chunk_size)
+    if not dataset.reusable:
+        raise ValueError("The coreset needs two passes - pass a .npy path, a memmap, an array "
+                         "or a function that returns a fresh chunk iterator")
+    rng = np.random.default_rng(random_state)
+    
+    # Pass 1: n, Σx and Σ‖x‖² give the mean and Σ d(x, μ)² = Σ‖x‖² - n‖μ‖²
+    n, total, total_sq = 0, 0.0, 0.0
+    for chunk in dataset.chunks():
+        n += len(chunk)
+        total = total + chunk.sum(axis=0)
+        total_sq += float(np.einsum('ij,ij->', chunk, chunk))
+    mean = total / n
+    spread = max(total_sq - n * float(mean @ mean), 0.0)
+    
+    # Pass 2: exact multinomial draw, chunk by chunk
+    points, weights = [], []
+    remaining_draws, remaining_mass = size, 1.0
+    for chunk in dataset.chunks():
+        distances_sq = ((chunk - mean) ** 2).sum(axis=1)
+        q = 0.5 / n + (0.5 * distances_sq / spread if spread > 0 else 0.5 / n)
+        chunk_mass = float(q.sum())
+        if remaining_draws > 0:
+            share = min(chunk_mass / remaining_mass, 1.0) if remaining_mass > 0 else 1.0
+            n_draws = rng.binomial(remaining_draws, share)
+            if n_draws > 0:
+                drawn, counts = np.unique(rng.choice(len(chunk), size=n_draws, p=q / chunk_mass),
+                                          return_counts=True)
+                points.append(chunk[drawn])
+                weights.append(counts / (size * q[drawn]))
+            remaining_draws -= n_draws
+        remaining_mass -= chunk_mass
+    
+    return np.vstack(points), np.concatenate(weights)
+
+
+def kmeans_cost(data, centroids, chunk_size=65536, sample_weight=None):
+    """
+    Exact K-Means cost Σ w·min_c ‖x - c‖² of any centroids, in one streaming pass.
+    
+    Used to CHECK a coreset: the weighted cost of some centroids on the
+    coreset should match the cost of the SAME centroids on the full data.
+    sample_weight (one weight per row, in order) defaults to all 1.
+    """
+    dataset = ChunkedDataset(data if is_out_of_core(data) else np.asarray(data, dtype=float),
+                             chunk_size)
+    centroids = np.asarray(centroids, dtype=float)
+    if sample_weight is not None:
+        sample_weight = np.asarray(sample_weight, dtype=float)
+    
+    cost = 0.0
+    start = 0
+    for chunk in dataset.chunks():
+        distances_sq = nearest_centroids_numpy(chunk, centroids)[1]
+        if sample_weight is None:
+            cost += float(distances_sq.sum(dtype=np.float64))
+        else:
+            cost += float(np.dot(sample_weight[start:start + len(chunk)], distances_sq))
+        start += len(chunk)
+    return cost
+
+
+def check_sample_weight(sample_weight, n, k):
+    """
+    Validate point weights for fitting k clusters to n points.
+    
+    Returns:
+    --------
+    np.ndarray or None
+        The weights as floats (None stays None: every weight is 1)
+    """
+    if sample_weight is None:
+        return None
+    
+    sample_weight = np.asarray(sample_weight, dtype=float)
+    if sample_weight.shape != (n,):
+        raise ValueError(f"sample_weight must have shape ({n},), got {sample_weight.shape}")
+    if np.any(sample_weight < 0) or sample_weight.sum() <= 0:
+        raise ValueError("sample_weight must be non-negative with a positive sum")
+    n_positive = np.count_nonzero(sample_weight)
+    if n_positive < k:
+        raise ValueError(f"Need at least k={k} points with positive weight, got {n_positive}")
+    return sample_weight
+
+
 # =============================================================================
 # THE K-MEANS ALGORITHM FROM SCRATCH
 # =============================================================================
 
+class KMeansHistory:
+    """
+    Compact record of how the centroids moved during fit().
+    
+    Why not a list of dicts?
+    ------------------------
+    Copying every centroid list AND all n labels on every iteration costs
+    hundreds of MB on a 5M-point fit - just to draw a few plots.
+    Instead:
+    - Centroids go into ONE preallocated (snapshots × k × d) float array
+    - Labels are kept only at the iterations you ask for, as int32
+    
+    It still behaves like the old list: history[i] gives
+    {'centroids': ..., 'labels': ... or None}, so plotting code keeps working.
+    Missing labels can be recomputed from the centroids (nearest centroid).
+    """
+    
+    def __init__(self, max_snapshots, k, n_dimensions, label_iterations=()):
+        """
+        Parameters:
+        -----------
+        max_snapshots : int
+            Most snapshots that will be recorded (max_iterations + 1)
+        k, n_dimensions : int
+            Shape of one centroid snapshot
+        label_iterations : iterable of int
+            Snapshot numbers whose labels should also be kept
+        """
+        self.centroids = np.empty((max_snapshots, k, n_dimensions))
+        self.label_iterations = set(label_iterations)
+        self.labels = {}  # snapshot number → int32 labels
+        self.n_snapshots = 0
+    
+    def record(self, centroids, labels=None):
+        """Store one snapshot (snapshot 0 is the initialization)."""
+        snapshot = self.n_snapshots
+        self.centroids[snapshot] = centroids
+        if labels is not None and snapshot in self.label_iterations:
+            self.labels[snapshot] = np.asarray(labels, dtype=np.int32)
+        self.n_snapshots += 1
+    
+    def __len__(self):
+        return self.n_snapshots
+    
+    def __getitem__(self, snapshot):
+        if snapshot < 0:
+            snapshot += self.n_snapshots
+        if not 0 <= snapshot < self.n_snapshots:
+            raise IndexError(f"snapshot {snapshot} out of range")
+        return {
+            'centroids': self.centroids[snapshot],
+            'labels': self.labels.get(snapshot)
+        }
+
+
 class KMeansFromScratch:
     """
     K-Means Clustering implemented from scratch.
@@ -117,9 +794,95 @@ class KMeansFromScratch:
     -------------------
     We're minimizing the total distance from points to their centroids!
     Each iteration improves the clustering.
+    
+    Backends:
+    ---------
+    - 'python': Pure Python lists, one euclidean_distance() call per
+      (point, centroid) pair. Easy to follow, slow for large data.
+    - 'numpy':  Same algorithm on NumPy arrays. The whole n × k distance
+      block is computed at once (see squared_distances_numpy).
+    Both backends use the same random choices, so their results can be
+    compared directly.
+    
+    Algorithms (assignment step):
+    -----------------------------
+    - 'lloyd': Compute every point-to-centroid distance, every iteration.
+    - 'elkan': Keep distance bounds per point and use the triangle
+      inequality to skip distances that cannot change the label
+      (numpy backend only). Same labels as 'lloyd', far fewer distances.
+    - 'hamerly': Like 'elkan' but with ONE lower bound per point instead
+      of k, so the extra memory is O(n). Best for low-dimensional data.
+    - 'yinyang': The middle ground for large k: centroids are grouped
+      (about k/10 groups) with one lower bound per GROUP, so whole groups
+      of centroids - and then single centroids - are skipped at once.
+    
+    Initialization:
+    ---------------
+    - 'random':     k random data points (simple, often poor seeds)
+    - 'k-means++':  D² sampling - seeds spread over the data
+    - 'k-means||':  K-Means++ in a few passes, for large n
+    - array of shape (k, d): start from these exact centroids
+    
+    Multiple restarts:
+    ------------------
+    K-Means only finds a LOCAL optimum. With n_init > 1, fit() runs several
+    independent restarts (in parallel worker processes with n_jobs) and
+    keeps the one with the lowest inertia.
+    
+    Mini-batch mode:
+    ----------------
+    With batch_size set, fit() updates centroids from small random batches
+    instead of full passes, and partial_fit() learns from data that arrives
+    in chunks (numpy backend only).
+    
+    Out-of-core data:
+    -----------------
+    fit() and predict() also accept a .npy path, a np.memmap, or a chunk
+    iterator (see ChunkedDataset). The data is streamed in chunk_size rows,
+    so memory stays at one chunk plus O(k·d) however big the data is.
+    
+    Precision:
+    ----------
+    dtype=np.float32 halves the memory traffic of the numpy backend
+    (distances, centroids, point storage). Sums, counts and inertia are
+    always accumulated in float64 so they stay accurate.
+    
+    Convergence:
+    ------------
+    fit() stops when no centroid moved more than tol (with
+    relative_tol=True: tol × the data's typical spread), or when at most
+    max_label_changes points changed cluster in the last iteration.
+    With incremental_update=True (numpy backend) the centroid sums are
+    adjusted using only the points that changed cluster, so late
+    iterations - where few points move - update in O(moved · d).
+    
+    Weighted points:
+    ----------------
+    fit(data, sample_weight=w) treats a point of weight w like w copies of
+    it. Duplicates can then be collapsed into one weighted point first
+    (see quantize_colors): the work depends on the DISTINCT points only.
+    
+    Prediction index:
+    -----------------
+    With predict_index='kdtree', predict() answers nearest-centroid queries
+    with a CentroidKDTree, built once after fitting and then reused.
+    
+    History:
+    --------
+    With record_history=True, fit() keeps a KMeansHistory of centroid
+    positions (for plot_kmeans_animation). Off by default - it costs memory.
     """
     
-    def __init__(self, k=3, max_iterations=100, random_state=42):
+    BACKENDS = ('python', 'numpy')
+    ALGORITHMS = ('lloyd', 'elkan', 'hamerly', 'yinyang')
+    INITS = ('random', 'k-means++', 'k-means||')
+    PREDICT_INDEXES = (None, 'kdtree')
+    
+    def __init__(self, k=3, max_iterations=100, random_state=42, backend='python',
+                 algorithm='lloyd', batch_size=None, init='random', n_init=1,
+                 n_jobs=1, record_history=False, history_label_iterations=(),
+                 predict_index=None, chunk_size=65536, dtype=np.float64, tol=1e-6,
+                 relative_tol=False, max_label_changes=None, incremental_update=False):
         """
         Initialize K-Means.
         
@@ -131,15 +894,128 @@ class KMeansFromScratch:
             Maximum iterations before stopping
         random_state : int
             Random seed for reproducibility
+        backend : str
+            'python' (lists, educational) or 'numpy' (vectorized, fast)
+        algorithm : str
+            'lloyd' (plain K-Means), 'elkan', 'hamerly' or 'yinyang'
+            (triangle-inequality pruning)
+        batch_size : int or None
+            Points per mini-batch (None = use all data every iteration)
+        init : str or array
+            'random', 'k-means++' or 'k-means||' (seeding strategy),
+            or a (k, d) array of starting centroids
+        n_init : int
+            Number of independent restarts; the best one is kept
+        n_jobs : int
+            Worker processes for the restarts (1 = serial, -1 = all CPUs)
+        record_history : bool
+            Keep centroid snapshots of every iteration (for visualization)
+        history_label_iterations : iterable of int
+            Iterations whose labels are also kept in the history
+        predict_index : str or None
+            None (brute force) or 'kdtree' (spatial index for predict)
+        chunk_size : int
+            Rows per chunk when streaming out-of-core data
+        dtype : np.float32 or np.float64
+            Floating-point type for points and centroids (numpy backend)
+        tol : float
+            Converged when no centroid moves more than this
+        relative_tol : bool
+            Measure tol in units of the data's spread (root of the mean
+            per-feature variance) instead of absolute units
+        max_label_changes : int or None
+            Also converged when at most this many points changed cluster
+            (0 = as soon as the labels are stable; None = don't check)
+        incremental_update : bool
+            Update centroid sums from the moved points only (numpy backend)
         """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"backend must be one of {self.BACKENDS}, got {backend!r}")
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"algorithm must be one of {self.ALGORITHMS}, got {algorithm!r}")
+        if algorithm != 'lloyd' and backend != 'numpy':
+            raise ValueError(f"algorithm={algorithm!r} requires backend='numpy'")
+        if isinstance(init, str):
+            if init not in self.INITS:
+                raise ValueError(f"init must be one of {self.INITS}, got {init!r}")
+        else:
+            init = np.array(init, dtype=float)
+            if init.ndim != 2 or len(init) != k:
+                raise ValueError(f"init array must have shape (k={k}, d), got {init.shape}")
+        if predict_index not in self.PREDICT_INDEXES:
+            raise ValueError(f"predict_index must be one of {self.PREDICT_INDEXES}, "
+                             f"got {predict_index!r}")
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            raise ValueError(f"dtype must be float32 or float64, got {dtype}")
+        if dtype != np.float64 and backend != 'numpy':
+            raise ValueError(f"dtype={dtype} requires backend='numpy'")
+        if n_init < 1:
+            raise ValueError(f"n_init must be at least 1, got {n_init}")
+        if batch_size is not None and (backend != 'numpy' or algorithm != 'lloyd'):
+            raise ValueError("batch_size requires backend='numpy' and algorithm='lloyd'")
+        if tol < 0:
+            raise ValueError(f"tol must be non-negative, got {tol}")
+        if incremental_update and backend != 'numpy':
+            raise ValueError("incremental_update requires backend='numpy'")
+        
         self.k = k
         self.max_iterations = max_iterations
         self.random_state = random_state
+        self.backend = backend
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+        self.init = init
+        self.n_init = n_init
+        self.n_jobs = n_jobs
+        self.record_history = record_history
+        self.history_label_iterations = tuple(history_label_iterations)
+        self.predict_index = predict_index
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+        self.tol = tol
+        self.relative_tol = relative_tol
+        self.max_label_changes = max_label_changes
+        self.incremental_update = incremental_update
         self.centroids = None
         self.labels = None
-        self.history = []  # Store history for visualization
+        self.history = []  # KMeansHistory for visualization (if recorded)
+        self._point_norms = None  # Cached ‖x‖² (numpy backend only)
+        self._sample_weight = None  # Point weights of the current fit (None = all 1)
+        
+        # Point-to-centroid distance computations made by the last fit()
+        self.n_distance_evaluations = 0
+        # Iterations the last fit() needed (compare seeding strategies!)
+        self.n_iterations = 0
+        # Inertia: final labels against the final centroids (see _inertia_from)
+        self.inertia = None
+        # Final inertia of every restart (only filled when n_init > 1)
+        self.restart_inertias = []
+        # Points that changed cluster in each iteration of the last fit()
+        self.label_changes = []
+        # Centroid shift below which fit() has converged (set per fit)
+        self._tolerance = tol
+        
+        # Elkan/Hamerly state: bounds on each point's distance to the centroids
+        self._upper_bounds = None   # shape (n,): ≥ distance to own centroid
+        self._lower_bounds = None   # Elkan (n, k): ≤ distance to each centroid
+                                    # Hamerly (n,): ≤ distance to 2nd-closest
+                                    # Yinyang (n, groups): ≤ distance to any
+                                    #   other centroid of the group
+        self._bounds_centroids = None  # Centroids the bounds refer to
+        self._centroid_groups = None   # Yinyang: group of each centroid
+        
+        # Mini-batch state: points seen so far by each centroid
+        self._cluster_counts = None
+        
+        # Incremental update state: per-cluster sums and sizes of the last update
+        self._cluster_sums = None
+        self._cluster_sizes = None
+        
+        # Spatial index over the fitted centroids (built on first predict)
+        self._centroid_index = None
     
-    def fit(self, data):
+    def fit(self, data, sample_weight=None):
         """
         Fit K-Means to the data.
         
@@ -150,13 +1026,51 @@ class KMeansFromScratch:
         
         Parameters:
         -----------
-        data : list of lists
+        data : list of lists (or 2D array)
             Each inner list is a data point (can be any dimension)
+        sample_weight : list or array of float, optional
+            Weight of each point (default: all 1). Centroids become
+            weighted means and inertia a weighted sum.
         """
+        # Centroids are about to change - any prediction index is stale
+        self._centroid_index = None
+        self._sample_weight = None
+        
+        if is_out_of_core(data):
+            if sample_weight is not None:
+                raise ValueError("sample_weight is not supported for out-of-core data")
+            return self._fit_out_of_core(ChunkedDataset(data, self.chunk_size, self.dtype))
+        
+        sample_weight = check_sample_weight(sample_weight, len(data), self.k)
+        
+        if self.n_init > 1:
+            return self._fit_restarts(data, sample_weight)
+        
         # Set random seed for reproducibility
         random.seed(self.random_state)
         
-        # Step 1: Initialize centroids randomly
+        # Start every fit from a clean slate
+        self.labels = None
+        self.n_distance_evaluations = 0
+        self.n_iterations = 0
+        self.inertia = None
+        self.history = []
+        self._upper_bounds = None
+        self._lower_bounds = None
+        self._cluster_counts = None
+        self._cluster_sums = None
+        self.label_changes = []
+        
+        if self.backend == 'numpy':
+            # Convert once, and cache ‖x‖² - it never changes during fit
+            data = np.asarray(data, dtype=self.dtype)
+            self._point_norms = np.einsum('ij,ij->i', data, data)
+            self._sample_weight = sample_weight
+        elif sample_weight is not None:
+            self._sample_weight = sample_weight.tolist()
+        self._tolerance = self._absolute_tolerance(data)
+        
+        # Step 1: Initialize centroids (randomly, or with K-Means++ / K-Means||)
         self.centroids = self._initialize_centroids(data)
         
         print(f"🎯 Starting K-Means with k={self.k}")
@@ -165,806 +1079,4512 @@ class KMeansFromScratch:
         print()
         
         # Store initial state
-        self.history.append({
-            'centroids': [c[:] for c in self.centroids],
-            'labels': None
-        })
+        if self.record_history:
+            self.history = KMeansHistory(self.max_iterations + 1, self.k, len(data[0]),
+                                         self.history_label_iterations)
+            self.history.record(self.centroids)
+        
+        # Mini-batch mode: small random batches instead of full passes
+        if self.batch_size is not None:
+            return self._fit_minibatch(data)
         
         # Iterate until convergence or max iterations
         for iteration in range(self.max_iterations):
+            self.n_iterations = iteration + 1
+            
             # Step 2: Assign each point to nearest centroid
+            # (the distances found here give the progress inertia for free)
             old_labels = self.labels
-            self.labels = self._assign_clusters(data)
+            self.labels, min_distances_sq = self._assign_clusters(data)
+            self.inertia = self._inertia_from(min_distances_sq, data)
+            n_changed = self._count_label_changes(old_labels, self.labels)
+            self.label_changes.append(n_changed)
             
             # Store iteration state
-            self.history.append({
-                'centroids': [c[:] for c in self.centroids],
-                'labels': self.labels[:]
-            })
+            if self.record_history:
+                self.history.record(self.centroids, self.labels)
             
             # Step 3: Update centroids
-            old_centroids = [c[:] for c in self.centroids]
-            self.centroids = self._update_centroids(data)
+            old_centroids = self._copy_centroids(self.centroids)
+            self.centroids = self._update_centroids(data, old_labels)
             
-            # Check convergence (did centroids stop moving?)
+            # Check convergence (did centroids stop moving? labels stop changing?)
             if self._has_converged(old_centroids, self.centroids):
                 print(f"✅ Converged after {iteration + 1} iterations!")
                 break
+            if (old_labels is not None and self.max_label_changes is not None
+                    and n_changed <= self.max_label_changes):
+                print(f"✅ Converged after {iteration + 1} iterations "
+                      f"({n_changed} points changed cluster)!")
+                break
             
             if iteration % 10 == 0:
-                inertia = self._calculate_inertia(data)
-                print(f"Iteration {iteration}: Inertia = {inertia:.2f}")
+                print(f"Iteration {iteration}: Inertia = {self._current_inertia(data):.2f}")
         else:
             print(f"⚠️  Reached max iterations ({self.max_iterations})")
         
-        # Final inertia
-        final_inertia = self._calculate_inertia(data)
-        print(f"🎉 Final Inertia: {final_inertia:.2f}")
+        # Final inertia: the final labels against the FINAL (updated) centroids
+        self.inertia = None
+        self.inertia = self._current_inertia(data)
+        print(f"🎉 Final Inertia: {self.inertia:.2f}")
         print()
         
         return self
     
-    def _initialize_centroids(self, data):
+    def _fit_out_of_core(self, dataset):
         """
-        Initialize centroids randomly from the data points.
+        Lloyd's algorithm streaming over chunks: one pass per iteration.
         
-        Why from data points?
-        ---------------------
-        Ensures centroids start in reasonable locations
-        (within the range of actual data)
-        """
-        # Randomly select k data points as initial centroids
-        indices = random.sample(range(len(data)), self.k)
-        return [data[i][:] for i in indices]  # Copy to avoid reference issues
-    
-    def _assign_clusters(self, data):
+        Each pass accumulates, chunk by chunk:
+        - per-cluster coordinate sums and counts → new centroids
+        - squared distances to the nearest centroid → inertia
+        Nothing of size n is kept, so self.labels stays None;
+        call predict() on the data to get the labels.
         """
-        Assign each point to the nearest centroid.
+        if self.backend != 'numpy' or self.algorithm != 'lloyd' or self.batch_size is not None:
+            raise ValueError("Out-of-core fit requires backend='numpy', algorithm='lloyd' "
+                             "and no batch_size (use partial_fit() for mini-batches)")
+        if self.n_init > 1:
+            raise ValueError("n_init > 1 is not supported for out-of-core data")
+        if not dataset.reusable:
+            raise ValueError("fit() reads the data many times - pass a .npy path, a memmap "
+                             "or a function that returns a fresh chunk iterator")
         
-        Returns:
-        --------
-        list of int
-            Cluster label (0 to k-1) for each point
-        """
-        labels = []
+        random.seed(self.random_state)
+        rng = np.random.default_rng(random.randrange(2 ** 32))
+        self.labels = None
+        self.n_distance_evaluations = 0
+        self.n_iterations = 0
+        self.inertia = None
+        self.history = []
         
-        for point in data:
-            # Calculate distance to each centroid
-            distances = [euclidean_distance(point, centroid) 
-                        for centroid in self.centroids]
-            
-            # Assign to nearest centroid
-            nearest_cluster = distances.index(min(distances))
-            labels.append(nearest_cluster)
+        # Step 1: Initialize from a uniform sample of rows (one pass)
+        sample, n_rows = self._sample_rows(dataset, max(10 * self.k, 1000), rng)
+        self._point_norms = None
+        self._tolerance = self._absolute_tolerance(sample)
+        self.centroids = self._initialize_centroids(sample)
         
-        return labels
-    
-    def _update_centroids(self, data):
-        """
-        Recalculate centroids as the mean of points in each cluster.
+        print(f"🎯 Starting out-of-core K-Means with k={self.k}")
+        print(f"📊 Data points: {n_rows} (streamed in chunks of {dataset.chunk_size})")
+        print(f"📏 Dimensions: {sample.shape[1]}")
+        print()
         
-        Why recalculate?
-        ----------------
-        The centroid should be at the CENTER of its cluster!
-        As points move between clusters, centroids must move too.
-        """
-        new_centroids = []
+        if self.record_history:
+            self.history = KMeansHistory(self.max_iterations + 1, self.k, sample.shape[1])
+            self.history.record(self.centroids)
         
-        for cluster_id in range(self.k):
-            # Get all points in this cluster
-            cluster_points = [data[i] for i in range(len(data)) 
-                            if self.labels[i] == cluster_id]
+        for iteration in range(self.max_iterations):
+            self.n_iterations = iteration + 1
             
-            if cluster_points:
-                # Calculate mean position
-                new_centroid = calculate_centroid(cluster_points)
-            else:
-                # Empty cluster - reinitialize randomly
-                new_centroid = random.choice(data)[:]
-                print(f"⚠️  Cluster {cluster_id} is empty, reinitializing")
+            # Steps 2 + 3 in one streaming pass: assign, accumulate sums
+            sums = np.zeros(self.centroids.shape)  # float64 accumulators
+            counts = np.zeros(self.k)
+            inertia = 0.0
+            for chunk in dataset.chunks():
+                labels, min_distances_sq = nearest_centroids_numpy(chunk, self.centroids)
+                chunk_sums, chunk_counts = cluster_sums_numpy(chunk, labels, self.k)
+                sums += chunk_sums
+                counts += chunk_counts
+                inertia += float(min_distances_sq.sum(dtype=np.float64))
+                self.n_distance_evaluations += len(chunk) * self.k
+            self.inertia = inertia
             
-            new_centroids.append(new_centroid)
+            old_centroids = self.centroids
+            self.centroids = self._centroids_from_sums(sums, counts, sample)
+            
+            if self.record_history:
+                self.history.record(self.centroids)
+            
+            if self._has_converged(old_centroids, self.centroids):
+                print(f"✅ Converged after {iteration + 1} iterations!")
+                break
+            
+            if iteration % 10 == 0:
+                print(f"Iteration {iteration}: Inertia = {self.inertia:.2f}")
+        else:
+            print(f"⚠️  Reached max iterations ({self.max_iterations})")
         
-        return new_centroids
+        print(f"🎉 Final Inertia: {self.inertia:.2f}")
+        print()
+        
+        return self
     
-    def _has_converged(self, old_centroids, new_centroids, tolerance=1e-6):
+    def fit_shards(self, shard_paths):
         """
-        Check if centroids have stopped moving (converged).
+        Distributed (map-reduce) fit over data split into .npy shard files.
         
-        Why check convergence?
+        Why do we need this?
+        --------------------
+        When the data is already sharded across files (or machines), no
+        single process should have to read all of it. K-Means only needs
+        per-cluster SUMS and COUNTS, and those simply add up across shards.
+        
+        One iteration:
+        --------------
+        - Broadcast: the coordinator sends the current centroids (k × d)
+        - Map:    each worker streams ITS shard, assigns every point and
+                  returns only per-cluster sums, counts and its inertia
+        - Reduce: the coordinator adds them up → new centroids
+        Only O(k·d) numbers travel per shard per iteration, never the data.
+        
+        Here the "nodes" are local worker processes (n_jobs of them); on a
+        cluster the same map and reduce steps would run on other machines.
+        
+        Parameters:
+        -----------
+        shard_paths : list of str
+            .npy files, each holding some rows of the data
+        """
+        if self.backend != 'numpy' or self.algorithm != 'lloyd' or self.batch_size is not None:
+            raise ValueError("fit_shards() requires backend='numpy', algorithm='lloyd' "
+                             "and no batch_size")
+        if self.n_init > 1:
+            raise ValueError("n_init > 1 is not supported by fit_shards()")
+        
+        self._centroid_index = None
+        random.seed(self.random_state)
+        rng = np.random.default_rng(random.randrange(2 ** 32))
+        self.labels = None
+        self.n_distance_evaluations = 0
+        self.n_iterations = 0
+        self.inertia = None
+        self.history = []
+        self._sample_weight = None
+        
+        # Step 1: Initialize from a uniform sample across all shards (one pass)
+        def all_shard_chunks():
+            for path in shard_paths:
+                yield from ChunkedDataset(path, self.chunk_size, self.dtype).chunks()
+        
+        sample, n_rows = self._sample_rows(
+            ChunkedDataset(all_shard_chunks, self.chunk_size, self.dtype),
+            max(10 * self.k, 1000), rng)
+        self._point_norms = None
+        self._tolerance = self._absolute_tolerance(sample)
+        self.centroids = self._initialize_centroids(sample)
+        
+        n_workers = count_workers(self.n_jobs, len(shard_paths))
+        print(f"🎯 Starting distributed K-Means with k={self.k}")
+        print(f"📊 Data points: {n_rows} in {len(shard_paths)} shards "
+              f"({n_workers} worker process(es))")
+        print()
+        
+        pool = multiprocessing.get_context('fork').Pool(n_workers) if n_workers > 1 else None
+        try:
+            for iteration in range(self.max_iterations):
+                self.n_iterations = iteration + 1
+                
+                # Map: every shard → (sums, counts, inertia), in the workers
+                tasks = [(path, self.centroids, self.k, self.chunk_size, self.dtype)
+                         for path in shard_paths]
+                if pool is not None:
+                    results = pool.starmap(_shard_statistics, tasks)
+                else:
+                    results = [_shard_statistics(*task) for task in tasks]
+                
+                # Reduce: add up the per-shard statistics
+                sums = sum(shard_sums for shard_sums, _, _ in results)
+                counts = sum(shard_counts for _, shard_counts, _ in results)
+                self.inertia = sum(shard_inertia for _, _, shard_inertia in results)
+                self.n_distance_evaluations += n_rows * self.k
+                
+                old_centroids = self.centroids
+                self.centroids = self._centroids_from_sums(sums, counts, sample)
+                
+                if self._has_converged(old_centroids, self.centroids):
+                    print(f"✅ Converged after {iteration + 1} iterations!")
+                    break
+                
+                if iteration % 10 == 0:
+                    print(f"Iteration {iteration}: Inertia = {self.inertia:.2f}")
+            else:
+                print(f"⚠️  Reached max iterations ({self.max_iterations})")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        
+        print(f"🎉 Final Inertia: {self.inertia:.2f}")
+        print()
+        
+        return self
+    
+    def _centroids_from_sums(self, sums, counts, sample):
+        """New centroids = sums / counts; empty clusters restart from the sample."""
+        centroids = self.centroids.copy()
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+        for cluster_id in np.flatnonzero(~filled):
+            # Empty cluster - reinitialize from the sample
+            centroids[cluster_id] = random.choice(sample)
+            print(f"⚠️  Cluster {cluster_id} is empty, reinitializing")
+        return centroids
+    
+    def _sample_rows(self, dataset, sample_size, rng):
+        """
+        Uniform random sample of rows in a single streaming pass.
+        
+        Trick: give every row a random key and keep the sample_size rows
+        with the smallest keys - a uniform sample, chunk by chunk.
+        
+        Returns:
+        --------
+        tuple of (np.ndarray, int)
+            The sampled rows, and the total number of rows seen
+        """
+        sample, keys = None, None
+        n_rows = 0
+        
+        for chunk in dataset.chunks():
+            n_rows += len(chunk)
+            chunk_keys = rng.random(len(chunk))
+            if sample is None:
+                sample, keys = chunk[:0], chunk_keys[:0]
+            sample = np.concatenate([sample, chunk])
+            keys = np.concatenate([keys, chunk_keys])
+            
+            if len(keys) > sample_size:
+                keep = np.argpartition(keys, sample_size)[:sample_size]
+                sample, keys = sample[keep], keys[keep]
+        
+        if n_rows < self.k:
+            raise ValueError(f"Need at least k={self.k} rows, got {n_rows}")
+        return sample, n_rows
+    
+    def _inertia_from(self, min_distances_sq, data):
+        """
+        Inertia from the squared distances the assignment step just found.
+        
+        Elkan/Hamerly skip most distances, so they return None instead;
+        their inertia is computed only when someone asks for it.
+        
+        Which centroids?
+        ----------------
+        These distances are to the centroids BEFORE the update that
+        follows, so they are only used for progress messages. The inertia
+        reported after fit() is always the final labels against the final
+        (updated) centroids - for every algorithm - so restarts and elbow
+        sweeps compare like with like. (Streaming fits - out-of-core and
+        fit_shards - report the cost of their last pass instead: a second
+        look at the data would cost another full pass.)
+        """
+        if min_distances_sq is None:
+            return None
+        if self._sample_weight is not None:
+            return float(np.dot(self._sample_weight, min_distances_sq))
+        return float(np.sum(min_distances_sq, dtype=np.float64))
+    
+    def _current_inertia(self, data):
+        """Inertia of the current labels - reused if already known."""
+        if self.inertia is None:
+            # Bound-based algorithms: one O(n·d) pass, only when requested
+            self.n_distance_evaluations += len(data)
+            self.inertia = self._calculate_inertia(data)
+        return self.inertia
+    
+    def _fit_restarts(self, data, sample_weight=None):
+        """
+        Run n_init independent fits and keep the one with the lowest inertia.
+        
+        How the work is shared:
+        -----------------------
+        - Seeds: one independent seed per restart, derived from random_state,
+          so the whole run is reproducible.
+        - Data: stored in a module-level variable BEFORE the worker processes
+          are forked. Forked workers inherit it (copy-on-write), so the data
+          is never pickled and sent with each task.
+        - Results: each worker sends back only centroids and a few numbers
+          (plus its history, if record_history is on).
+        
+        n_distance_evaluations counts the work of ALL restarts; history,
+        n_iterations and inertia come from the kept one.
+        """
+        if self.backend == 'numpy':
+            data = np.asarray(data, dtype=self.dtype)
+        
+        seed_sequence = np.random.SeedSequence(self.random_state)
+        seeds = [int(seed) for seed in seed_sequence.generate_state(self.n_init)]
+        params = self._restart_params()
+        
+        print(f"🔁 Running {self.n_init} restarts with k={self.k} "
+              f"({count_workers(self.n_jobs, self.n_init)} worker process(es))")
+        
+        results = run_on_shared_data(_fit_restart, [(params, seed) for seed in seeds],
+                                     (data, sample_weight), self.n_jobs)
+        
+        # Keep the restart with the lowest inertia
+        self.restart_inertias = [inertia for inertia, _, _, _, _ in results]
+        best = self.restart_inertias.index(min(self.restart_inertias))
+        _, self.centroids, self.n_iterations, _, self.history = results[best]
+        self.n_distance_evaluations = sum(n_distances for _, _, _, n_distances, _ in results)
+        self.labels = self.predict(data)
+        self.inertia = self.restart_inertias[best]
+        self._sample_weight = sample_weight
+        
+        print(f"🎉 Best of {self.n_init} restarts: Inertia = {self.restart_inertias[best]:.2f} "
+              f"(worst: {max(self.restart_inertias):.2f})")
+        print()
+        
+        return self
+    
+    def _restart_params(self):
+        """Constructor arguments for one single-restart model."""
+        return {
+            'k': self.k,
+            'max_iterations': self.max_iterations,
+            'backend': self.backend,
+            'algorithm': self.algorithm,
+            'batch_size': self.batch_size,
+            'init': self.init,
+            'dtype': self.dtype,
+            'tol': self.tol,
+            'relative_tol': self.relative_tol,
+            'max_label_changes': self.max_label_changes,
+            'incremental_update': self.incremental_update,
+            'record_history': self.record_history,
+            'history_label_iterations': self.history_label_iterations,
+        }
+    
+    def partial_fit(self, batch):
+        """
+        Update the centroids with one chunk of data (mini-batch K-Means).
+        
+        Why do we need this?
+        --------------------
+        fit() needs the whole dataset in memory. When tens of millions of
+        rows arrive in chunks, we instead nudge the centroids toward each
+        chunk and then throw the chunk away - memory stays constant.
+        
+        Each chunk is processed in slices of batch_size points, so the
+        distance block never exceeds batch_size × k.
+        
+        self.labels is left alone: after fit() it still holds the labels of
+        the data fit() saw (None if the model was built from chunks only).
+        Call predict() for labels under the updated centroids.
+        
+        Parameters:
+        -----------
+        batch : list of lists (or 2D array)
+            The next chunk of data points
+        """
+        if self.backend != 'numpy':
+            raise ValueError("partial_fit() requires backend='numpy'")
+        
+        batch = np.asarray(batch, dtype=self.dtype)
+        
+        if self.centroids is None:
+            # First chunk: seed the centroids from it
+            if len(batch) < self.k:
+                raise ValueError(f"The first chunk seeds the centroids: it needs at least "
+                                 f"k={self.k} rows, got {len(batch)}")
+            random.seed(self.random_state)
+            self.centroids = self._initialize_centroids(batch)
+        if self._cluster_counts is None:
+            self._cluster_counts = np.zeros(self.k)
+            if self.labels is not None:
+                # Continuing from a full fit(): its clusters already hold (weighted) points
+                self._cluster_counts += np.bincount(self.labels, weights=self._sample_weight,
+                                                    minlength=self.k)
+        
+        slice_size = self.batch_size or len(batch)
+        for start in range(0, len(batch), slice_size):
+            self._minibatch_step(batch[start:start + slice_size])
+        
+        self._centroid_index = None  # Centroids moved
+        return self
+    
+    def _fit_minibatch(self, data):
+        """
+        Fit loop for mini-batch mode: one random batch per iteration.
+        """
+        n = len(data)
+        batch_size = min(self.batch_size, n)
+        self._cluster_counts = np.zeros(self.k)
+        
+        for iteration in range(self.max_iterations):
+            self.n_iterations = iteration + 1
+            indices = random.sample(range(n), batch_size)
+            old_centroids = self.centroids.copy()
+            batch_weight = None if self._sample_weight is None else self._sample_weight[indices]
+            _, batch_inertia = self._minibatch_step(data[indices], batch_weight)
+            if self.record_history:
+                self.history.record(self.centroids)
+            
+            if self._has_converged(old_centroids, self.centroids):
+                print(f"✅ Converged after {iteration + 1} mini-batches!")
+                break
+            
+            if iteration % 10 == 0:
+                print(f"Mini-batch {iteration}: Batch inertia = {batch_inertia:.2f}")
+        else:
+            print(f"⚠️  Reached max iterations ({self.max_iterations})")
+        
+        # Final labels (and inertia) for every point
+        self.labels, min_distances_sq = self._assign_clusters(data)
+        self.inertia = self._inertia_from(min_distances_sq, data)
+        print(f"🎉 Final Inertia: {self.inertia:.2f}")
+        print()
+        
+        return self
+    
+    def _minibatch_step(self, batch, batch_weight=None):
+        """
+        Move each centroid toward the mean of its points in one batch.
+        
+        Per-cluster learning rate:
+        --------------------------
+        A centroid that has already seen N points and gets b new ones moves
+            c ← c + (b / N_total) · (batch mean - c)
+        So each centroid is the running mean of every point it has seen:
+        young centroids move a lot, well-established ones barely move.
+        
+        Returns:
+        --------
+        tuple of (np.ndarray, float)
+            Labels of the batch points, and the batch inertia
+        """
+        self.n_distance_evaluations += len(batch) * self.k
+        distances_sq = squared_distances_numpy(batch, self.centroids)
+        labels = np.argmin(distances_sq, axis=1)
+        min_distances_sq = distances_sq[np.arange(len(batch)), labels]
+        if batch_weight is None:
+            batch_inertia = float(min_distances_sq.sum(dtype=np.float64))
+        else:
+            batch_inertia = float(np.dot(batch_weight, min_distances_sq))
+        
+        batch_sums, batch_counts = cluster_sums_numpy(batch, labels, self.k, batch_weight)
+        
+        self._cluster_counts += batch_counts
+        updated = batch_counts > 0
+        learning_rates = batch_counts[updated] / self._cluster_counts[updated]
+        batch_means = batch_sums[updated] / batch_counts[updated, np.newaxis]
+        self.centroids[updated] += learning_rates[:, np.newaxis] * (batch_means - self.centroids[updated])
+        
+        return labels, batch_inertia
+    
+    def _copy_centroids(self, centroids):
+        """Copy centroids so later updates don't change stored snapshots."""
+        if self.backend == 'numpy':
+            return centroids.copy()
+        return [c[:] for c in centroids]
+    
+    def _initialize_centroids(self, data):
+        """
+        Initialize centroids randomly from the data points.
+        
+        Why from data points?
+        ---------------------
+        Ensures centroids start in reasonable locations
+        (within the range of actual data)
+        
+        With init='k-means++' or 'k-means||' the points are not picked
+        uniformly but by D² sampling (see kmeans_plusplus_numpy).
+        With sample weights, heavier points are proportionally more likely
+        to be picked - as if every copy of them were in the data.
+        """
+        if not isinstance(self.init, str):
+            # Explicit starting centroids (e.g. a warm start)
+            centroids = self.init.astype(self.dtype)
+            return centroids if self.backend == 'numpy' else centroids.tolist()
+        
+        if self.init != 'random':
+            X = np.asarray(data, dtype=self.dtype)
+            X_norms = self._point_norms if X is data else None
+            # Seed NumPy from the (already seeded) random module
+            rng = np.random.default_rng(random.randrange(2 ** 32))
+            
+            weights = self._sample_weight
+            if self.init == 'k-means++':
+                centroids = kmeans_plusplus_numpy(X, self.k, rng, X_norms, weights)
+            else:
+                centroids = kmeans_parallel_numpy(X, self.k, rng, X_norms, sample_weight=weights)
+            
+            return centroids if self.backend == 'numpy' else centroids.tolist()
+        
+        # Randomly select k data points as initial centroids
+        if self._sample_weight is None:
+            indices = random.sample(range(len(data)), self.k)
+        else:
+            # Weighted draw without replacement (only points with weight > 0)
+            weights = np.asarray(self._sample_weight)
+            rng = np.random.default_rng(random.randrange(2 ** 32))
+            indices = rng.choice(len(data), size=self.k, replace=False,
+                                 p=weights / weights.sum()).tolist()
+        if self.backend == 'numpy':
+            return data[indices].copy()
+        return [data[i][:] for i in indices]  # Copy to avoid reference issues
+    
+    def _assign_clusters(self, data):
+        """
+        Assign each point to the nearest centroid.
+        
+        Returns:
+        --------
+        tuple of (list of int, list of float)
+            Cluster label (0 to k-1) for each point, and each point's
+            squared distance to that centroid (None for Elkan/Hamerly,
+            which don't know every distance exactly)
+        """
+        if self.backend == 'numpy':
+            if self.algorithm == 'elkan':
+                return self._assign_clusters_elkan(data), None
+            if self.algorithm == 'hamerly':
+                return self._assign_clusters_hamerly(data), None
+            if self.algorithm == 'yinyang':
+                return self._assign_clusters_yinyang(data), None
+            return self._assign_clusters_numpy(data)
+        
+        self.n_distance_evaluations += len(data) * self.k
+        labels = []
+        min_distances_sq = []
+        
+        for point in data:
+            # Calculate (squared) distance to each centroid
+            distances_sq = [squared_euclidean_distance(point, centroid)
+                            for centroid in self.centroids]
+            
+            # Assign to nearest centroid - and remember how far it is
+            nearest_distance_sq = min(distances_sq)
+            labels.append(distances_sq.index(nearest_distance_sq))
+            min_distances_sq.append(nearest_distance_sq)
+        
+        return labels, min_distances_sq
+    
+    def _assign_clusters_numpy(self, data):
+        """
+        Vectorized assignment: one distance block, one argmin.
+        
+        Why squared distances?
         ----------------------
-        No point continuing if nothing is changing!
-        Saves computation.
+        The nearest centroid by distance is also the nearest by SQUARED
+        distance, so we never need the square root here.
         """
-        for old, new in zip(old_centroids, new_centroids):
-            if euclidean_distance(old, new) > tolerance:
-                return False
-        return True
+        self.n_distance_evaluations += len(data) * self.k
+        distances_sq = squared_distances_numpy(data, self.centroids, self._point_norms)
+        labels = np.argmin(distances_sq, axis=1)
+        return labels, distances_sq[np.arange(len(data)), labels]
     
-    def _calculate_inertia(self, data):
+    def _assign_clusters_elkan(self, data):
         """
-        Calculate inertia (sum of squared distances to nearest centroid).
+        Elkan's assignment: skip distances the triangle inequality rules out.
         
-        What is inertia?
+        The Key Insight:
         ----------------
-        Measures how tight the clusters are.
-        Lower inertia = tighter clusters = better fit
+        For a point x with centroid a and any other centroid c:
+            d(a, c) ≥ 2·d(x, a)   ⟹   d(x, c) ≥ d(x, a)
+        so c cannot be closer and d(x, c) need not be computed!
+        
+        Bookkeeping per point:
+        ----------------------
+        - upper bound u(x)    ≥ d(x, own centroid)
+        - lower bound l(x, c) ≤ d(x, c) for every centroid c
+        When centroids move by δ(c), the bounds stay valid after
+            u(x) += δ(own centroid),   l(x, c) -= δ(c)
+        so after the first few iterations (small moves) almost every
+        distance is skipped.
+        
+        Returns:
+        --------
+        np.ndarray of int
+            Cluster label for each point (same as Lloyd's assignment)
+        """
+        n = len(data)
+        
+        if self._upper_bounds is None:
+            # First iteration: no bounds yet, so compute everything once
+            self.n_distance_evaluations += n * self.k
+            distances = np.sqrt(squared_distances_numpy(data, self.centroids,
+                                                        self._point_norms))
+            labels = np.argmin(distances, axis=1)
+            self._lower_bounds = distances
+            self._upper_bounds = distances[np.arange(n), labels]
+            self._bounds_centroids = self.centroids.copy()
+            return labels
+        
+        labels = self.labels.copy()
+        upper = self._upper_bounds
+        lower = self._lower_bounds
+        
+        # Step 1: Loosen the bounds by how far each centroid moved
+        shifts = np.sqrt(((self.centroids - self._bounds_centroids) ** 2).sum(axis=1))
+        self.n_distance_evaluations += self.k
+        upper += shifts[labels]
+        lower -= shifts[np.newaxis, :]
+        np.maximum(lower, 0, out=lower)
+        self._bounds_centroids = self.centroids.copy()
+        
+        # Step 2: Centroid-to-centroid distances
+        centroid_distances = np.sqrt(squared_distances_numpy(self.centroids, self.centroids))
+        self.n_distance_evaluations += self.k * (self.k - 1) // 2
+        np.fill_diagonal(centroid_distances, np.inf)
+        half_nearest = 0.5 * centroid_distances.min(axis=1)
+        
+        # Points much closer to their centroid than to any other centroid
+        # cannot change cluster - skip them entirely
+        active = np.flatnonzero(upper > half_nearest[labels])
+        tight = np.zeros(n, dtype=bool)  # Is upper[i] an exact distance?
+        
+        # Step 3: For the remaining points, check centroids one at a time
+        for j in range(self.k):
+            if len(active) == 0:
+                break
+            
+            own = labels[active]
+            candidates = active[(own != j)
+                                & (upper[active] > lower[active, j])
+                                & (upper[active] > 0.5 * centroid_distances[own, j])]
+            if len(candidates) == 0:
+                continue
+            
+            # Tighten the upper bound with one exact distance (once per point)
+            loose = candidates[~tight[candidates]]
+            if len(loose) > 0:
+                exact = np.sqrt(((data[loose] - self.centroids[labels[loose]]) ** 2).sum(axis=1))
+                self.n_distance_evaluations += len(loose)
+                upper[loose] = exact
+                lower[loose, labels[loose]] = exact
+                tight[loose] = True
+            
+            # Re-check with the tight bound before paying for d(x, c_j)
+            own = labels[candidates]
+            candidates = candidates[(upper[candidates] > lower[candidates, j])
+                                    & (upper[candidates] > 0.5 * centroid_distances[own, j])]
+            if len(candidates) == 0:
+                continue
+            
+            distance_j = np.sqrt(((data[candidates] - self.centroids[j]) ** 2).sum(axis=1))
+            self.n_distance_evaluations += len(candidates)
+            lower[candidates, j] = distance_j
+            
+            closer = distance_j < upper[candidates]
+            moved = candidates[closer]
+            labels[moved] = j
+            upper[moved] = distance_j[closer]
+        
+        return labels
+    
+    def _assign_clusters_hamerly(self, data):
+        """
+        Hamerly's assignment: Elkan's idea with a single lower bound.
+        
+        Why only one lower bound?
+        -------------------------
+        Elkan stores k lower bounds per point - for 5M points and k=500
+        that is 2.5 billion floats! Hamerly keeps just one:
+            l(x) ≤ distance to the SECOND-closest centroid
+        If u(x) ≤ l(x), no other centroid can beat the current one.
+        
+        When centroids move, l(x) shrinks by the largest move of any
+        OTHER centroid. In low dimensions centroids are few and move
+        little, so this single bound prunes almost every point.
+        
+        Returns:
+        --------
+        np.ndarray of int
+            Cluster label for each point (same as Lloyd's assignment)
+        """
+        n = len(data)
+        
+        if self._upper_bounds is None:
+            # First iteration: compute everything once to set up the bounds
+            self.n_distance_evaluations += n * self.k
+            distances = np.sqrt(squared_distances_numpy(data, self.centroids,
+                                                        self._point_norms))
+            return self._reset_hamerly_bounds(np.arange(n), distances)
+        
+        labels = self.labels.copy()
+        upper = self._upper_bounds
+        lower = self._lower_bounds
+        
+        # Step 1: Loosen the bounds by how far the centroids moved
+        shifts = np.sqrt(((self.centroids - self._bounds_centroids) ** 2).sum(axis=1))
+        self.n_distance_evaluations += self.k
+        self._bounds_centroids = self.centroids.copy()
+        upper += shifts[labels]
+        if self.k > 1:
+            # Largest move among the OTHER centroids
+            order = np.argsort(shifts)
+            largest, second_largest = shifts[order[-1]], shifts[order[-2]]
+            lower -= np.where(labels == order[-1], second_largest, largest)
+        
+        # Step 2: Half the distance from each centroid to its nearest neighbor
+        centroid_distances = np.sqrt(squared_distances_numpy(self.centroids, self.centroids))
+        self.n_distance_evaluations += self.k * (self.k - 1) // 2
+        np.fill_diagonal(centroid_distances, np.inf)
+        half_nearest = 0.5 * centroid_distances.min(axis=1)
+        
+        # Step 3: Points whose upper bound beats both bounds keep their label
+        bound = np.maximum(half_nearest[labels], lower)
+        active = np.flatnonzero(upper > bound)
+        if len(active) == 0:
+            return labels
+        
+        # Tighten the upper bound and check again
+        upper[active] = np.sqrt(((data[active] - self.centroids[labels[active]]) ** 2).sum(axis=1))
+        self.n_distance_evaluations += len(active)
+        active = active[upper[active] > bound[active]]
+        if len(active) == 0:
+            return labels
+        
+        # Step 4: Only these points need a full distance scan
+        self.n_distance_evaluations += len(active) * self.k
+        distances = np.sqrt(squared_distances_numpy(data[active], self.centroids,
+                                                    self._point_norms[active]))
+        labels[active] = self._reset_hamerly_bounds(active, distances)
+        return labels
+    
+    def _reset_hamerly_bounds(self, indices, distances):
+        """Set exact Hamerly bounds for some points from their full distance rows."""
+        if self._upper_bounds is None:
+            n = len(indices)
+            self._upper_bounds = np.empty(n)
+            self._lower_bounds = np.empty(n)
+            self._bounds_centroids = self.centroids.copy()
+        
+        labels = np.argmin(distances, axis=1)
+        if self.k > 1:
+            # Smallest two distances per row: closest and second-closest
+            nearest_two = np.partition(distances, 1, axis=1)
+            self._upper_bounds[indices] = nearest_two[:, 0]
+            self._lower_bounds[indices] = nearest_two[:, 1]
+        else:
+            self._upper_bounds[indices] = distances[:, 0]
+            self._lower_bounds[indices] = np.inf
+        
+        return labels
+    
+    def _assign_clusters_yinyang(self, data):
+        """
+        Yinyang assignment: lower bounds per GROUP of centroids.
+        
+        Why another one?
+        ----------------
+        With k in the thousands, Elkan's n × k bounds don't fit in memory,
+        and Hamerly's single bound is loose: ONE of a thousand centroids
+        moving a lot invalidates it for every point.
+        
+        The Yinyang Idea:
+        -----------------
+        Group the centroids once (about k/10 groups, see group_centroids).
+        Per point keep an upper bound u(x) and, per group G, a lower bound
+            l(x, G) ≤ distance to every other centroid in G
+        When centroids move, l(x, G) only drops by the largest move IN G.
+        Three filters, from coarse to fine:
+        1. Global: u(x) ≤ min over G of l(x, G)   → keep the label, done
+        2. Group:  u(x) ≤ l(x, G)                 → skip the whole group
+        3. Local:  u(x) ≤ l_old(x, G) - δ(c)      → skip centroid c
+        Memory: O(n · k/10) instead of Elkan's O(n · k).
+        
+        Returns:
+        --------
+        np.ndarray of int
+            Cluster label for each point (same as Lloyd's assignment)
+        """
+        n = len(data)
+        
+        if self._upper_bounds is None:
+            return self._reset_yinyang_bounds(data)
+        
+        labels = self.labels.copy()
+        upper = self._upper_bounds
+        lower = self._lower_bounds
+        groups = self._centroid_groups
+        n_groups = lower.shape[1]
+        
+        # Step 1: Loosen the bounds by how far the centroids moved
+        shifts = np.sqrt(((self.centroids - self._bounds_centroids) ** 2).sum(axis=1))
+        self.n_distance_evaluations += self.k
+        self._bounds_centroids = self.centroids.copy()
+        group_shifts = np.zeros(n_groups)
+        np.maximum.at(group_shifts, groups, shifts)
+        
+        upper += shifts[labels]
+        old_lower = lower.copy()  # Before the shift - for the local filter
+        lower -= group_shifts[np.newaxis, :]
+        np.maximum(lower, 0, out=lower)
+        
+        # Step 2: Global filter, then again with a tight upper bound
+        active = np.flatnonzero(upper > lower.min(axis=1))
+        if len(active) == 0:
+            return labels
+        upper[active] = np.sqrt(((data[active] - self.centroids[labels[active]]) ** 2).sum(axis=1))
+        self.n_distance_evaluations += len(active)
+        active = active[upper[active] > lower[active].min(axis=1)]
+        if len(active) == 0:
+            return labels
+        
+        # Work on the active points only (local copies, written back at the end)
+        points = data[active]
+        point_norms = self._point_norms[active]
+        point_labels = labels[active]
+        point_upper = upper[active]
+        point_lower = lower[active]
+        point_old_lower = old_lower[active]
+        own_labels = point_labels.copy()      # Label at the start of this iteration
+        own_distances = point_upper.copy()    # ...and its exact distance
+        
+        # Step 3: Group filter for all (point, group) pairs at once, sorted by group
+        pair_points, pair_groups = np.nonzero(point_lower < point_upper[:, np.newaxis])
+        order = np.argsort(pair_groups, kind='stable')
+        pair_points = pair_points[order]
+        group_starts = np.searchsorted(pair_groups[order], np.arange(n_groups + 1))
+        
+        for group in range(n_groups):
+            rows = pair_points[group_starts[group]:group_starts[group + 1]]
+            # Re-check: earlier groups may have lowered the upper bound
+            rows = rows[point_lower[rows, group] < point_upper[rows]]
+            if len(rows) == 0:
+                continue
+            members = np.flatnonzero(groups == group)
+            
+            # Local filter: skip members that the old group bound minus
+            # their own move rules out for EVERY row (own centroids excepted)
+            reach = point_upper[rows].max()
+            lowest = point_old_lower[rows, group].min()
+            keep = (lowest - shifts[members] < reach) | np.isin(members, own_labels[rows])
+            if not keep.all():
+                # The skipped members still bound the group from below
+                skipped_bound = np.maximum(point_old_lower[rows, group]
+                                           - shifts[members[~keep]].max(), 0)
+            members = members[keep]
+            if len(members) == 0:
+                point_lower[rows, group] = skipped_bound
+                continue
+            
+            # Exact distances: one small matrix multiply for the whole group
+            distances = np.sqrt(squared_distances_numpy(points[rows], self.centroids[members],
+                                                        point_norms[rows]))
+            self.n_distance_evaluations += distances.size
+            
+            # Closest member of the group...
+            best_column = np.argmin(distances, axis=1)
+            best_distance = distances[np.arange(len(rows)), best_column]
+            improved = best_distance < point_upper[rows]
+            
+            # ...and the group's new lower bound: every member except the label
+            is_current = members[np.newaxis, :] == point_labels[rows][:, np.newaxis]
+            winner = np.where(improved, best_column, np.argmax(is_current, axis=1))
+            has_winner = improved | is_current.any(axis=1)
+            distances[np.flatnonzero(has_winner), winner[has_winner]] = np.inf
+            group_lower = distances.min(axis=1)
+            point_lower[rows, group] = (group_lower if keep.all()
+                                        else np.minimum(group_lower, skipped_bound))
+            
+            # Points that found a closer centroid: the old one is now "other"
+            moved = rows[improved]
+            previous = point_labels[moved]
+            np.minimum.at(point_lower, (moved, groups[previous]), point_upper[moved])
+            point_labels[moved] = members[best_column[improved]]
+            point_upper[moved] = best_distance[improved]
+        
+        labels[active] = point_labels
+        upper[active] = point_upper
+        lower[active] = point_lower
+        return labels
+    
+    def _reset_yinyang_bounds(self, data):
+        """First Yinyang iteration: group the centroids, exact bounds for all points."""
+        n = len(data)
+        rng = np.random.default_rng(self.random_state)
+        self._centroid_groups = group_centroids(self.centroids, max(1, self.k // 10), rng)
+        n_groups = self._centroid_groups.max() + 1
+        
+        labels = np.empty(n, dtype=np.intp)
+        self._upper_bounds = np.empty(n)
+        self._lower_bounds = np.empty((n, n_groups))
+        self._bounds_centroids = self.centroids.copy()
+        
+        # Columns sorted by group, so np.minimum.reduceat gives per-group minima
+        order = np.argsort(self._centroid_groups, kind='stable')
+        starts = np.searchsorted(self._centroid_groups[order], np.arange(n_groups))
+        
+        sorted_centroids = self.centroids[order]
+        
+        chunk_size = max(1, 4_000_000 // self.k)
+        for start in range(0, n, chunk_size):
+            block = slice(start, start + chunk_size)
+            distances_sq = squared_distances_numpy(data[block], sorted_centroids,
+                                                   self._point_norms[block])
+            self.n_distance_evaluations += distances_sq.size
+            nearest = np.argmin(distances_sq, axis=1)
+            index = np.arange(len(distances_sq))
+            labels[block] = order[nearest]
+            self._upper_bounds[block] = np.sqrt(distances_sq[index, nearest])
+            
+            # Group bounds leave out the point's own centroid
+            distances_sq[index, nearest] = np.inf
+            self._lower_bounds[block] = np.sqrt(np.minimum.reduceat(distances_sq, starts, axis=1))
+        
+        return labels
+    
+    def _update_centroids(self, data, old_labels=None):
+        """
+        Recalculate centroids as the mean of points in each cluster.
+        
+        Why recalculate?
+        ----------------
+        The centroid should be at the CENTER of its cluster!
+        As points move between clusters, centroids must move too.
+        
+        Why one pass?
+        -------------
+        Collecting each cluster's points separately scans all n labels once
+        PER CLUSTER. Instead we walk the data once, adding every point into
+        a running sum for its cluster - O(n·d) work, whatever k is.
+        """
+        if self.backend == 'numpy':
+            return self._update_centroids_numpy(data, old_labels)
+        
+        num_dimensions = len(data[0])
+        sums = [[0.0] * num_dimensions for _ in range(self.k)]
+        counts = [0] * self.k
+        weights = self._sample_weight or [1] * len(data)
+        
+        # One pass: add each (weighted) point to its cluster's running sum
+        for point, cluster_id, weight in zip(data, self.labels, weights):
+            counts[cluster_id] += weight
+            cluster_sum = sums[cluster_id]
+            for dim in range(num_dimensions):
+                cluster_sum[dim] += weight * point[dim]
+        
+        new_centroids = []
+        
+        for cluster_id in range(self.k):
+            if counts[cluster_id] > 0:
+                # Mean position = sum / count (same as calculate_centroid)
+                new_centroid = [total / counts[cluster_id] for total in sums[cluster_id]]
+            else:
+                # Empty cluster - reinitialize randomly
+                new_centroid = random.choice(data)[:]
+                print(f"⚠️  Cluster {cluster_id} is empty, reinitializing")
+            
+            new_centroids.append(new_centroid)
+        
+        return new_centroids
+    
+    def _update_centroids_numpy(self, data, old_labels=None):
+        """Same update as _update_centroids, accumulated with np.bincount."""
+        if self.incremental_update:
+            sums, counts = self._incremental_cluster_sums(data, old_labels)
+        else:
+            sums, counts = cluster_sums_numpy(data, self.labels, self.k, self._sample_weight)
+        
+        new_centroids = np.empty_like(self.centroids)
+        filled = counts > 0
+        new_centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+        
+        for cluster_id in np.flatnonzero(~filled):
+            # Empty cluster - reinitialize randomly (same draw as 'python')
+            new_centroids[cluster_id] = random.choice(data)
+            print(f"⚠️  Cluster {cluster_id} is empty, reinitializing")
+        
+        return new_centroids
+    
+    def _incremental_cluster_sums(self, data, old_labels):
+        """
+        Per-cluster sums and sizes, updated from the moved points only.
+        
+        Why do we need this?
+        --------------------
+        Late in a fit only a handful of points change cluster, yet a full
+        update re-adds all n points. Instead keep the sums from the last
+        iteration and, for each moved point x (from cluster a to b):
+            sum[a] -= x,  size[a] -= 1,  sum[b] += x,  size[b] += 1
+        Cost O(moved · d) instead of O(n · d).
+        """
+        if self._cluster_sums is None or old_labels is None:
+            moved = None
+        else:
+            moved = np.flatnonzero(old_labels != self.labels)
+        
+        if moved is None or len(moved) > len(data) // 2:
+            # First update (or most points moved): a full pass is cheaper
+            self._cluster_sums, self._cluster_sizes = cluster_sums_numpy(
+                data, self.labels, self.k, self._sample_weight)
+        elif len(moved) > 0:
+            weights = None if self._sample_weight is None else self._sample_weight[moved]
+            left_sums, left_sizes = cluster_sums_numpy(data[moved], old_labels[moved],
+                                                       self.k, weights)
+            joined_sums, joined_sizes = cluster_sums_numpy(data[moved], self.labels[moved],
+                                                           self.k, weights)
+            self._cluster_sums += joined_sums - left_sums
+            self._cluster_sizes = self._cluster_sizes + joined_sizes - left_sizes
+        
+        return self._cluster_sums, self._cluster_sizes
+    
+    def _count_label_changes(self, old_labels, new_labels):
+        """Number of points whose cluster changed (all of them at the start)."""
+        if old_labels is None:
+            return len(new_labels)
+        if self.backend == 'numpy':
+            return int(np.count_nonzero(old_labels != new_labels))
+        return sum(old != new for old, new in zip(old_labels, new_labels))
+    
+    def _absolute_tolerance(self, data):
+        """
+        The centroid shift below which fit() has converged.
+        
+        With relative_tol=True, tol is scaled by the data's spread (root
+        of the mean per-feature variance): tol=1e-4 means "moved less than
+        0.01% of a typical spread", whether the data is in cents or millions.
+        """
+        if not self.relative_tol:
+            return self.tol
+        
+        if self.backend == 'numpy':
+            spread = float(np.sqrt(np.var(np.asarray(data, dtype=np.float64), axis=0).mean()))
+        else:
+            n, num_dimensions = len(data), len(data[0])
+            total_variance = 0.0
+            for dim in range(num_dimensions):
+                mean = sum(point[dim] for point in data) / n
+                total_variance += sum((point[dim] - mean) ** 2 for point in data) / n
+            spread = (total_variance / num_dimensions) ** 0.5
+        return self.tol * spread
+    
+    def _has_converged(self, old_centroids, new_centroids):
+        """
+        Check if centroids have stopped moving (converged).
+        
+        Why check convergence?
+        ----------------------
+        No point continuing if nothing is changing!
+        Saves computation.
+        """
+        if self.backend == 'numpy':
+            shifts = np.sqrt(((old_centroids - new_centroids) ** 2).sum(axis=1))
+            return bool(np.all(shifts <= self._tolerance))
+        
+        for old, new in zip(old_centroids, new_centroids):
+            if euclidean_distance(old, new) > self._tolerance:
+                return False
+        return True
+    
+    def _calculate_inertia(self, data):
+        """
+        Calculate inertia (sum of squared distances to nearest centroid).
+        
+        What is inertia?
+        ----------------
+        Measures how tight the clusters are.
+        Lower inertia = tighter clusters = better fit
+        
+        Formula: Σ (distance from point to its centroid)²
+        """
+        if self.backend == 'numpy':
+            data = np.asarray(data, dtype=self.dtype)
+            distances_sq = ((data - self.centroids[self.labels]) ** 2).sum(axis=1, dtype=np.float64)
+            if self._sample_weight is not None:
+                return float(np.dot(self._sample_weight, distances_sq))
+            return float(distances_sq.sum())
+        
+        inertia = 0
+        for i, point in enumerate(data):
+            cluster = self.labels[i]
+            centroid = self.centroids[cluster]
+            distance = euclidean_distance(point, centroid)
+            weight = 1 if self._sample_weight is None else self._sample_weight[i]
+            inertia += weight * distance ** 2
+        
+        return inertia
+    
+    def predict(self, data, out=None):
+        """
+        Predict cluster labels for new data.
+        
+        Parameters:
+        -----------
+        data : list of lists
+            New data points to classify (or out-of-core data, see
+            ChunkedDataset - then it is processed chunk by chunk)
+        out : array, optional
+            Where to write the labels of out-of-core data
+            (e.g. an int32 np.memmap, so labels don't have to fit in RAM)
+            
+        Returns:
+        --------
+        list of int
+            Cluster label for each point (a NumPy array for out-of-core
+            data, whatever the backend)
+        """
+        if self.centroids is None:
+            raise ValueError("Model not fitted yet! Call fit() first.")
+        
+        if is_out_of_core(data):
+            return self._predict_out_of_core(ChunkedDataset(data, self.chunk_size, self.dtype), out)
+        
+        if self.predict_index == 'kdtree':
+            if self._centroid_index is None:
+                self._centroid_index = CentroidKDTree(self.centroids)
+            labels, _ = self._centroid_index.query(data)
+            return labels if self.backend == 'numpy' else labels.tolist()
+        
+        if self.backend == 'numpy':
+            data = np.asarray(data, dtype=self.dtype)
+            labels, _ = nearest_centroids_numpy(data, self.centroids)
+            return labels
+        
+        labels = []
+        for point in data:
+            distances = [euclidean_distance(point, centroid) 
+                        for centroid in self.centroids]
+            labels.append(distances.index(min(distances)))
+        
+        return labels
+    
+    def _predict_out_of_core(self, dataset, out):
+        """Label chunk by chunk, writing into out (or a new array)."""
+        # The python backend keeps centroids as lists - convert them ONCE
+        centroids = np.asarray(self.centroids, dtype=self.dtype)
+        chunk_labels = []
+        start = 0
+        
+        for chunk in dataset.chunks():
+            if self.predict_index == 'kdtree':
+                if self._centroid_index is None:
+                    self._centroid_index = CentroidKDTree(self.centroids)
+                labels, _ = self._centroid_index.query(chunk)
+            else:
+                labels, _ = nearest_centroids_numpy(chunk, centroids)
+            
+            if out is not None:
+                out[start:start + len(labels)] = labels
+            else:
+                chunk_labels.append(labels)
+            start += len(labels)
+        
+        if out is not None:
+            return out
+        return np.concatenate(chunk_labels) if chunk_labels else np.empty(0, dtype=np.intp)
+
+
+def normalize_rows(X):
+    """
+    Scale every row to unit length (L2). All-zero rows stay zero.
+    
+    Works for dense arrays and for scipy.sparse matrices (which stay
+    sparse - only the stored non-zeros are rescaled).
+    
+    Returns:
+    --------
+    np.ndarray or sparse matrix
+        The normalized rows (float64)
+    """
+    if hasattr(X, 'tocsr'):
+        X = X.tocsr().astype(np.float64)
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        # Row i owns the stored values indptr[i]:indptr[i+1]
+        X.data *= np.repeat(scale, np.diff(X.indptr))
+        return X
+    
+    X = np.array(X, dtype=np.float64)
+    norms = np.sqrt(np.einsum('ij,ij->i', X, X))
+    X /= np.where(norms > 0, norms, 1)[:, np.newaxis]
+    return X
+
+
+class SphericalKMeans:
+    """
+    K-Means for COSINE similarity (spherical K-Means).
+    
+    Why do we need this?
+    --------------------
+    For documents, direction matters, not length: a long and a short
+    article about cats should land in the same cluster. Euclidean K-Means
+    on raw term-frequency vectors groups documents by LENGTH instead.
+    
+    The Spherical Trick:
+    --------------------
+    1. L2-normalize every document once (all on the unit sphere)
+    2. For unit vectors, cosine similarity = dot product, so the nearest
+       centroid is the one with the LARGEST dot product:
+       assignment = ONE matrix multiply X @ Cᵀ + argmax
+    3. Centroid = mean direction of its documents (sum, renormalized)
+    
+    Data:
+    -----
+    Dense vectors (e.g. the word-frequency lists used with
+    cosine_similarity in chapter3.py) or scipy.sparse matrices - real
+    term-frequency matrices are >99% zeros and are never densified here.
+    
+    inertia is the total cosine DISTANCE Σ (1 - cos(x, centroid)).
+    
+    Not a KMeansFromScratch subclass: its Euclidean extras (partial_fit,
+    fit_shards, out-of-core data, restarts) would silently ignore cosine.
+    """
+    
+    INITS = ('random', 'k-means++')
+    
+    def __init__(self, k=3, max_iterations=100, random_state=42, init='random'):
+        """
+        Initialize spherical K-Means.
+        
+        Parameters:
+        -----------
+        k : int
+            Number of clusters
+        max_iterations : int
+            Maximum iterations before stopping
+        random_state : int
+            Random seed for reproducibility
+        init : str
+            'random' or 'k-means++' (D² sampling on cosine distance)
+        """
+        if init not in self.INITS:
+            raise ValueError(f"init must be one of {self.INITS}, got {init!r}")
+        
+        self.k = k
+        self.max_iterations = max_iterations
+        self.random_state = random_state
+        self.init = init
+        self.centroids = None
+        self.labels = None
+        self.inertia = None
+        self.n_iterations = 0
+        self.n_distance_evaluations = 0
+    
+    def fit(self, data, sample_weight=None):
+        """
+        Fit spherical K-Means.
+        
+        Parameters:
+        -----------
+        data : list of lists, 2D array or scipy.sparse matrix
+            One (term-frequency) vector per row
+        sample_weight : list or array of float, optional
+            Weight of each document (default: all 1)
+        """
+        random.seed(self.random_state)
+        X = normalize_rows(data)
+        n = X.shape[0]
+        weights = check_sample_weight(sample_weight, n, self.k)
+        
+        self.labels = None
+        self.n_distance_evaluations = 0
+        self.n_iterations = 0
+        self.centroids = self._initialize_spherical(X, weights)
+        
+        print(f"🎯 Starting spherical K-Means with k={self.k}")
+        print(f"📊 Documents: {n}")
+        print(f"📏 Dimensions: {X.shape[1]}")
+        print()
+        
+        for iteration in range(self.max_iterations):
+            self.n_iterations = iteration + 1
+            
+            # Assign: one matrix multiply, largest cosine similarity wins
+            old_labels = self.labels
+            self.labels, best_similarities = self._most_similar(X)
+            if weights is None:
+                self.inertia = float(n - best_similarities.sum())
+            else:
+                self.inertia = float(np.dot(weights, 1 - best_similarities))
+            
+            if old_labels is not None and np.array_equal(old_labels, self.labels):
+                print(f"✅ Converged after {iteration + 1} iterations!")
+                break
+            
+            # Update: (weighted) summed directions of each cluster, back to unit length
+            sums = self._cluster_sums(X, weights)
+            self.centroids = normalize_rows(sums)
+            
+            for cluster_id in np.flatnonzero(~sums.any(axis=1)):
+                # Empty cluster - reinitialize from a random document
+                self.centroids[cluster_id] = self._dense_rows(X, [random.randrange(n)])[0]
+                print(f"⚠️  Cluster {cluster_id} is empty, reinitializing")
+            
+            if iteration % 10 == 0:
+                print(f"Iteration {iteration}: Cosine distance = {self.inertia:.2f}")
+        else:
+            print(f"⚠️  Reached max iterations ({self.max_iterations})")
+        
+        print(f"🎉 Final total cosine distance: {self.inertia:.2f}")
+        print()
+        
+        return self
+    
+    def predict(self, data, out=None):
+        """
+        Assign new documents to the most similar centroid.
+        
+        Parameters:
+        -----------
+        data : list of lists, 2D array or scipy.sparse matrix
+            Vectors to assign
+        out : np.ndarray, optional
+            Array to write the labels into
+            
+        Returns:
+        --------
+        np.ndarray
+            Cluster label for each document
+        """
+        if self.centroids is None:
+            raise ValueError("Model not fitted yet! Call fit() first.")
+        
+        labels, _ = self._most_similar(normalize_rows(data))
+        if out is not None:
+            out[:] = labels
+            return out
+        return labels
+    
+    def _cluster_sums(self, X, weights=None):
+        """
+        (Weighted) sum of the documents in each cluster, as a dense (k, d) array.
+        
+        Sparse X: multiply by a sparse n × k indicator (one non-zero per
+        row) - never a dense n × k matrix, and only the stored terms are
+        touched. Dense X: bincount sums (see cluster_sums_numpy).
+        """
+        n = X.shape[0]
+        if hasattr(X, 'tocsr'):
+            from scipy import sparse
+            values = np.ones(n) if weights is None else weights
+            indicator = sparse.csr_matrix((values, (np.arange(n), self.labels)),
+                                          shape=(n, self.k))
+            return (indicator.T @ X).toarray()
+        
+        sums, _ = cluster_sums_numpy(X, self.labels, self.k, weights)
+        return sums
+    
+    def _most_similar(self, X):
+        """Labels and cosine similarities of the most similar centroids."""
+        self.n_distance_evaluations += X.shape[0] * self.k
+        similarities = np.asarray(X @ self.centroids.T)
+        labels = np.argmax(similarities, axis=1)
+        return labels, similarities[np.arange(len(labels)), labels]
+    
+    def _initialize_spherical(self, X, weights=None):
+        """
+        Pick k documents as the first centroids.
+        
+        With init='k-means++' each next document is picked with probability
+        proportional to its squared cosine distance to the nearest centroid
+        so far - seeds spread over different topics.
+        With weights, heavier documents are proportionally more likely.
+        """
+        n = X.shape[0]
+        if self.init == 'random':
+            if weights is None:
+                return self._dense_rows(X, random.sample(range(n), self.k))
+            rng = np.random.default_rng(random.randrange(2 ** 32))
+            return self._dense_rows(X, rng.choice(n, size=self.k, replace=False,
+                                                  p=weights / weights.sum()).tolist())
+        
+        rng = np.random.default_rng(random.randrange(2 ** 32))
+        first = rng.integers(n) if weights is None else rng.choice(n, p=weights / weights.sum())
+        chosen = [int(first)]
+        closest = 1 - np.asarray(X @ self._dense_rows(X, chosen).T).ravel()
+        for _ in range(1, self.k):
+            probabilities = np.maximum(closest, 0) ** 2
+            if weights is not None:
+                probabilities *= weights
+            total = probabilities.sum()
+            index = int(rng.integers(n)) if total == 0 else int(
+                min(np.searchsorted(np.cumsum(probabilities), rng.random() * total), n - 1))
+            chosen.append(index)
+            distances = 1 - np.asarray(X @ self._dense_rows(X, [index]).T).ravel()
+            np.minimum(closest, distances, out=closest)
+        
+        return self._dense_rows(X, chosen)
+    
+    @staticmethod
+    def _dense_rows(X, indices):
+        """Selected rows of X as a dense (copied) array."""
+        rows = X[indices]
+        return rows.toarray() if hasattr(rows, 'toarray') else rows.copy()
+
+
+class BisectingKMeans:
+    """
+    Bisecting (divisive) K-Means: build k clusters by repeated 2-way splits.
+    
+    Why do we need this?
+    --------------------
+    Plain K-Means with k in the hundreds is slow (n × k distances per
+    iteration) and tends to give very uneven segments. Splitting instead:
+    
+    The Algorithm:
+    --------------
+    1. Start with ONE cluster holding every point
+    2. Pick the cluster with the highest inertia (the "worst" one)
+    3. Split it with a 2-means fit on ONLY that cluster's points
+    4. Repeat until there are k clusters
+    Each split only touches the points of one cluster, with k=2.
+    
+    The Tree:
+    ---------
+    Every split adds two child nodes, so the result is a binary tree whose
+    leaves are the k clusters. predict() walks it from the root, always
+    into the nearer child: 2 distance evaluations per level, so at most
+    2 × tree_depth per point instead of k. That is ≈2·log₂(k) only when
+    the tree is balanced - uneven splits make some paths longer.
+    
+    Tree attributes (one row per node, node 0 = root):
+    - node_centroids: (n_nodes, d) center of each node's points
+    - node_children:  (n_nodes, 2) child nodes, -1 for leaves
+    - node_labels:    (n_nodes,) cluster label of each leaf, -1 otherwise
+    - tree_depth:     splits on the longest root-to-leaf path
+    
+    Not a KMeansFromScratch subclass: the flat-model extras (partial_fit,
+    fit_shards, ...) would move the centroids but leave the tree stale.
+    """
+    
+    def __init__(self, k=3, max_iterations=100, random_state=42, init='k-means++', n_init=1):
+        """
+        Initialize bisecting K-Means.
+        
+        Parameters:
+        -----------
+        k : int
+            Number of clusters (leaves of the tree)
+        max_iterations : int
+            Maximum iterations of each 2-means split
+        random_state : int
+            Random seed for reproducibility
+        init : str
+            Seeding of each split: 'random', 'k-means++' or 'k-means||'
+        n_init : int
+            Restarts per split; the best one is kept
+        """
+        if init not in KMeansFromScratch.INITS:
+            raise ValueError(f"init must be one of {KMeansFromScratch.INITS}, got {init!r}")
+        if n_init < 1:
+            raise ValueError(f"n_init must be at least 1, got {n_init}")
+        
+        self.k = k
+        self.max_iterations = max_iterations
+        self.random_state = random_state
+        self.init = init
+        self.n_init = n_init
+        self.centroids = None  # One per leaf
+        self.labels = None
+        self.inertia = None
+        self.n_iterations = 0  # Number of splits
+        self.n_distance_evaluations = 0
+        self.node_centroids = None
+        self.node_children = None
+        self.node_labels = None
+        self.tree_depth = 0
+        # Distance evaluations made by the last predict()
+        self.n_predict_distance_evaluations = 0
+    
+    def fit(self, data, sample_weight=None):
+        """
+        Fit by splitting the highest-inertia cluster until there are k.
+        
+        Parameters:
+        -----------
+        data : list of lists (or 2D array)
+            Data points
+        sample_weight : list or array of float, optional
+            Weight of each point (default: all 1), used by every split
+        """
+        X = np.asarray(data, dtype=np.float64)
+        weights = check_sample_weight(sample_weight, len(X), self.k)
+        seeds = np.random.SeedSequence(self.random_state).generate_state(self.k)
+        self.n_distance_evaluations = 0
+        
+        def weighted_inertia(indices, center):
+            distances_sq = ((X[indices] - center) ** 2).sum(axis=1)
+            return float(distances_sq.sum() if weights is None
+                         else np.dot(weights[indices], distances_sq))
+        
+        centroids = [np.average(X, axis=0, weights=weights)]
+        children = [[-1, -1]]
+        depths = [0]
+        root_inertia = weighted_inertia(np.arange(len(X)), centroids[0])
+        
+        # Max-heap of splittable leaves by inertia: (-inertia, node, point indices)
+        leaves = [(-root_inertia, 0, np.arange(len(X)))]
+        finished = []  # Leaves that can't be split (fewer than 2 distinct points)
+        
+        print(f"🌳 Starting bisecting K-Means with k={self.k}")
+        print(f"📊 Data points: {len(X)}")
+        print()
+        
+        while leaves and len(leaves) + len(finished) < self.k:
+            negative_inertia, node, indices = heapq.heappop(leaves)
+            points = X[indices]
+            point_weights = None if weights is None else weights[indices]
+            if (len(points) < 2 or np.all(points == points[0])
+                    or (point_weights is not None and np.count_nonzero(point_weights) < 2)):
+                finished.append((negative_inertia, node, indices))
+                continue
+            
+            # Split this cluster with 2-means on its points only
+            split = KMeansFromScratch(k=2, max_iterations=self.max_iterations,
+                                      random_state=int(seeds[len(centroids) // 2]),
+                                      backend='numpy', init=self.init, n_init=self.n_init)
+            with contextlib.redirect_stdout(io.StringIO()):
+                split.fit(points, sample_weight=point_weights)
+            self.n_distance_evaluations += split.n_distance_evaluations
+            
+            children[node] = [len(centroids), len(centroids) + 1]
+            for side in (0, 1):
+                side_indices = indices[split.labels == side]
+                side_inertia = weighted_inertia(side_indices, split.centroids[side])
+                heapq.heappush(leaves, (-side_inertia, len(centroids), side_indices))
+                centroids.append(split.centroids[side])
+                children.append([-1, -1])
+                depths.append(depths[node] + 1)
+        
+        # Leaves → cluster labels 0 .. k-1 (in order of creation)
+        all_leaves = sorted(leaves + finished, key=lambda leaf: leaf[1])
+        self.node_centroids = np.array(centroids)
+        self.node_children = np.array(children, dtype=np.intp)
+        self.node_labels = np.full(len(centroids), -1, dtype=np.intp)
+        self.tree_depth = max(depths)
+        self.labels = np.empty(len(X), dtype=np.intp)
+        for label, (_, node, indices) in enumerate(all_leaves):
+            self.node_labels[node] = label
+            self.labels[indices] = label
+        
+        self.centroids = self.node_centroids[[node for _, node, _ in all_leaves]]
+        self.inertia = sum(-negative_inertia for negative_inertia, _, _ in all_leaves)
+        self.n_iterations = len(all_leaves) - 1  # Number of splits
+        
+        print(f"🎉 {len(all_leaves)} clusters after {self.n_iterations} splits, "
+              f"Inertia: {self.inertia:.2f}")
+        print()
+        
+        return self
+    
+    def predict(self, data, out=None):
+        """
+        Assign points by walking the tree: root → nearer child → ... → leaf.
+        
+        Parameters:
+        -----------
+        data : list of lists (or 2D array)
+            Points to assign
+        out : np.ndarray, optional
+            Array to write the labels into
+            
+        Returns:
+        --------
+        np.ndarray
+            Cluster label for each point
+        """
+        if self.node_centroids is None:
+            raise ValueError("Model not fitted yet! Call fit() first.")
+        
+        X = np.asarray(data, dtype=np.float64)
+        nodes = np.zeros(len(X), dtype=np.intp)
+        self.n_predict_distance_evaluations = 0
+        
+        # One tree level per pass, for all points still at an inner node
+        inner = np.flatnonzero(self.node_children[nodes, 0] >= 0)
+        while len(inner) > 0:
+            left, right = self.node_children[nodes[inner]].T
+            left_distances = ((X[inner] - self.node_centroids[left]) ** 2).sum(axis=1)
+            right_distances = ((X[inner] - self.node_centroids[right]) ** 2).sum(axis=1)
+            self.n_predict_distance_evaluations += 2 * len(inner)
+            nodes[inner] = np.where(right_distances < left_distances, right, left)
+            inner = inner[self.node_children[nodes[inner], 0] >= 0]
+        
+        labels = self.node_labels[nodes]
+        if out is not None:
+            out[:] = labels
+            return out
+        return labels
+
+
+class KernelKMeans:
+    """
+    Kernel K-Means with a Nyström feature map: clusters of ANY shape.
+    
+    Why do we need this?
+    --------------------
+    K-Means draws straight borders between centroids, so rings, moons and
+    other curved clusters get cut in pieces. Kernel K-Means clusters in the
+    feature space of an RBF kernel  k(x, y) = exp(-γ‖x - y‖²)  where such
+    shapes become separable - but the exact version needs the full n × n
+    kernel matrix: 20,000 points → 3.2 GB.
+    
+    The Nyström Trick:
+    ------------------
+    1. Sample m landmark points L (m ≪ n)
+    2. Eigendecompose the small m × m kernel  K_LL = U Λ Uᵀ
+    3. Feature map  φ(x) = k(x, L) · U Λ^(-1/2)   (m numbers per point)
+       Then φ(x)·φ(y) ≈ k(x, y): a rank-m approximation of the kernel
+    4. Run the vectorized (numpy) K-Means on the features
+    Memory: O(n·m) for the features, never O(n²).
+    More landmarks = better approximation, but more time (n·m² to map).
+    
+    centroids live in the FEATURE space (shape (k, m)), not the input space.
+    The clustering itself is a KMeansFromScratch (self.kmeans) fitted on
+    transform(data) - this class only owns the feature map.
+    """
+    
+    def __init__(self, k=3, n_landmarks=100, gamma=None, max_iterations=100,
+                 random_state=42, init='k-means++', n_init=1, chunk_size=65536):
+        """
+        Initialize kernel K-Means.
+        
+        Parameters:
+        -----------
+        k : int
+            Number of clusters
+        n_landmarks : int
+            Landmarks m = rank of the kernel approximation
+        gamma : float or None
+            RBF kernel width (None: 1 / (d · variance of the data))
+        max_iterations : int
+            Maximum K-Means iterations
+        random_state : int
+            Random seed (landmarks and K-Means)
+        init : str
+            K-Means seeding: 'random', 'k-means++' or 'k-means||'
+        n_init : int
+            K-Means restarts; the best one is kept
+        chunk_size : int
+            Rows per block when computing features
+        """
+        self.kmeans = KMeansFromScratch(k=k, max_iterations=max_iterations,
+                                        random_state=random_state, backend='numpy',
+                                        init=init, n_init=n_init)
+        self.k = k
+        self.random_state = random_state
+        self.chunk_size = chunk_size
+        self.n_landmarks = n_landmarks
+        self.gamma = gamma
+        self.landmarks = None
+        self.feature_projection = None  # U Λ^(-1/2), shape (m, rank)
+        self._gamma = None
+        # Results of the inner K-Means (centroids in feature space)
+        self.centroids = None
+        self.labels = None
+        self.inertia = None
+        self.n_iterations = 0
+        self.n_distance_evaluations = 0
+    
+    def fit(self, data, sample_weight=None):
+        """
+        Pick landmarks, map all points to Nyström features, run K-Means.
+        
+        Parameters:
+        -----------
+        data : list of lists (or 2D array)
+            Data points
+        sample_weight : list or array of float, optional
+            Weight of each point (default: all 1), passed to the K-Means
+        """
+        X = np.asarray(data, dtype=np.float64)
+        rng = np.random.default_rng(self.random_state)
+        
+        self._gamma = self.gamma
+        if self._gamma is None:
+            self._gamma = 1.0 / (X.shape[1] * X.var())
+        
+        # Landmarks: a uniform sample of the points
+        n_landmarks = min(self.n_landmarks, len(X))
+        self.landmarks = X[rng.choice(len(X), size=n_landmarks, replace=False)]
+        
+        # K_LL = U Λ Uᵀ; drop (near-)zero eigenvalues - they carry no information
+        eigenvalues, eigenvectors = np.linalg.eigh(self._kernel(self.landmarks))
+        keep = eigenvalues > 1e-10 * eigenvalues.max()
+        self.feature_projection = eigenvectors[:, keep] / np.sqrt(eigenvalues[keep])
+        
+        self.kmeans.fit(self.transform(X), sample_weight=sample_weight)
+        self.centroids = self.kmeans.centroids
+        self.labels = self.kmeans.labels
+        self.inertia = self.kmeans.inertia
+        self.n_iterations = self.kmeans.n_iterations
+        self.n_distance_evaluations = self.kmeans.n_distance_evaluations
+        return self
+    
+    def transform(self, data):
+        """
+        Nyström features φ(x) = k(x, L) · U Λ^(-1/2), computed in chunks.
+        
+        Returns:
+        --------
+        np.ndarray, shape (n, rank)
+            Feature vector of each point
+        """
+        X = np.asarray(data, dtype=np.float64)
+        features = np.empty((len(X), self.feature_projection.shape[1]))
+        for start in range(0, len(X), self.chunk_size):
+            block = slice(start, start + self.chunk_size)
+            features[block] = self._kernel(X[block]) @ self.feature_projection
+        return features
+    
+    def predict(self, data):
+        """Assign new points: map to features, then nearest centroid."""
+        if self.feature_projection is None:
+            raise ValueError("Model not fitted yet! Call fit() first.")
+        return self.kmeans.predict(self.transform(data))
+    
+    def _kernel(self, X):
+        """RBF kernel between the rows of X and the landmarks."""
+        return np.exp(-self._gamma * squared_distances_numpy(X, self.landmarks))
+
+
+def pairwise_distances(X, Y, metric='euclidean'):
+    """
+    Distance matrix between the rows of X and the rows of Y.
+    
+    Parameters:
+    -----------
+    X, Y : np.ndarray, shapes (n, d) and (m, d)
+        Points
+    metric : str or callable
+        'euclidean', 'manhattan', or a function f(X, Y) → (n, m) matrix
+        
+    Returns:
+    --------
+    np.ndarray, shape (n, m)
+        Distance between every pair
+    """
+    if callable(metric):
+        return np.asarray(metric(X, Y), dtype=np.float64)
+    if metric == 'euclidean':
+        return np.sqrt(squared_distances_numpy(X, Y))
+    if metric == 'manhattan':
+        # One feature at a time: O(n·m) memory instead of an (n, m, d) block
+        distances = np.zeros((len(X), len(Y)))
+        for feature in range(X.shape[1]):
+            distances += np.abs(X[:, feature, np.newaxis] - Y[np.newaxis, :, feature])
+        return distances
+    raise ValueError(f"Unknown metric: {metric!r}")
+
+
+class DistanceBlockCache:
+    """
+    Least-recently-used cache of distance column blocks.
+    
+    Why do we need this?
+    --------------------
+    PAM evaluates every point as a candidate medoid in EVERY swap pass,
+    so it needs the distances from all n points to each candidate - the
+    same n² distances, pass after pass. The columns are grouped in blocks
+    of block_size candidates; the max_blocks most recently used blocks
+    stay in memory and are never recomputed.
+    
+    Memory: max_blocks × n × block_size floats.
+    
+    Scan order matters: scanning blocks 0, 1, 2, ... in EVERY pass, an LRU
+    cache smaller than a full pass evicts each block just before it is
+    needed again - zero hits. PAM therefore alternates the direction, so
+    each pass starts with the blocks the previous pass ended with.
+    """
+    
+    def __init__(self, X, metric='euclidean', block_size=256, max_blocks=16):
+        self.X = X
+        self.metric = metric
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.n_blocks = -(-len(X) // block_size)  # Ceiling division
+        self.hits = 0
+        self.misses = 0
+        self.n_distance_evaluations = 0
+        self._blocks = collections.OrderedDict()
+    
+    def block(self, block_id):
+        """Distances from all points to the candidates of block block_id: (n, ≤ block_size)."""
+        if block_id in self._blocks:
+            self.hits += 1
+            self._blocks.move_to_end(block_id)  # Now the most recently used
+            return self._blocks[block_id]
+        
+        self.misses += 1
+        start = block_id * self.block_size
+        distances = pairwise_distances(self.X, self.X[start:start + self.block_size], self.metric)
+        self.n_distance_evaluations += distances.size
+        
+        self._blocks[block_id] = distances
+        if len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)  # Evict the least recently used
+        return distances
+
+
+class KMedoids:
+    """
+    k-medoids clustering: cluster centers are actual DATA POINTS (medoids).
+    
+    Why not means?
+    --------------
+    - Any metric: a mean (calculate_centroid) only minimizes SQUARED
+      Euclidean distance. A medoid minimizes the sum of ANY distance -
+      Manhattan, edit distance, travel time, ...
+    - Robust: one extreme outlier drags a mean far away, but it can't
+      drag a medoid (the medoid must be a real, typical point)
+    
+    PAM with FastPAM swaps:
+    -----------------------
+    Repeatedly find the (medoid, non-medoid) swap that lowers the total
+    distance most. Naively each of the k·(n-k) swaps costs O(n) → O(k·n²)
+    per pass. FastPAM evaluates one candidate against ALL k medoids at
+    once, using each point's nearest and second-nearest medoid distance:
+    O(n²) per pass. Distance blocks come from a DistanceBlockCache.
+    
+    CLARA (method='clara') for large n:
+    ----------------------------------
+    PAM on a few random samples (sample_size points each), every result
+    scored on the FULL data in O(n·k); the best medoids win.
+    """
+    
+    METHODS = ('pam', 'clara')
+    
+    def __init__(self, k=3, metric='euclidean', method='pam', max_iterations=100,
+                 random_state=42, sample_size=None, n_samples=5, block_size=256,
+                 cache_blocks=16):
+        """
+        Initialize k-medoids.
+        
+        Parameters:
+        -----------
+        k : int
+            Number of clusters
+        metric : str or callable
+            'euclidean', 'manhattan', or f(X, Y) → distance matrix
+        method : str
+            'pam' (all points) or 'clara' (PAM on samples)
+        max_iterations : int
+            Maximum swap passes (per PAM run)
+        random_state : int
+            Random seed for reproducibility
+        sample_size : int or None
+            CLARA sample size (default 40 + 2k, the classic choice)
+        n_samples : int
+            Number of CLARA samples
+        block_size : int
+            Candidates per cached distance block
+        cache_blocks : int
+            Distance blocks kept in the LRU cache
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"method must be one of {self.METHODS}, got {method!r}")
+        if sample_size is not None and sample_size < k:
+            raise ValueError(f"sample_size must be at least k={k}, got {sample_size}")
+        
+        self.k = k
+        self.metric = metric
+        self.method = method
+        self.max_iterations = max_iterations
+        self.random_state = random_state
+        self.sample_size = sample_size
+        self.n_samples = n_samples
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.medoid_indices = None
+        self.centroids = None  # The medoid points themselves
+        self.labels = None
+        self.inertia = None    # Sum of distances (NOT squared) to the medoids
+        self.n_iterations = 0  # Swaps performed
+        self.n_distance_evaluations = 0
+        self.cache = None      # DistanceBlockCache of the last PAM run
+    
+    def fit(self, data):
+        """
+        Find k medoids.
+        
+        Parameters:
+        -----------
+        data : list of lists (or 2D array)
+            Data points
+        """
+        X = np.asarray(data, dtype=np.float64)
+        if self.k > len(X):
+            raise ValueError(f"Need at least k={self.k} points, got {len(X)}")
+        rng = np.random.default_rng(self.random_state)
+        self.n_distance_evaluations = 0
+        self.n_iterations = 0
+        
+        print(f"🎯 Starting k-medoids ({self.method.upper()}) with k={self.k}")
+        print(f"📊 Data points: {len(X)}")
+        print()
+        
+        if self.method == 'pam':
+            self.medoid_indices = self._pam(X, rng)
+        else:
+            sample_size = min(len(X), self.sample_size or 40 + 2 * self.k)
+            best_cost = np.inf
+            for sample_id in range(self.n_samples):
+                sample = rng.choice(len(X), size=sample_size, replace=False)
+                medoids = sample[self._pam(X[sample], rng)]
+                cost = self._assign(X, medoids)[1].sum()
+                print(f"Sample {sample_id}: total distance = {cost:.2f}")
+                if cost < best_cost:
+                    best_cost, self.medoid_indices = cost, medoids
+        
+        self.centroids = X[self.medoid_indices]
+        self.labels, distances = self._assign(X, self.medoid_indices)
+        self.inertia = float(distances.sum())
+        
+        print(f"🎉 Total distance to medoids: {self.inertia:.2f}")
+        print()
+        
+        return self
+    
+    def predict(self, data):
+        """Label of the nearest medoid for every point."""
+        if self.centroids is None:
+            raise ValueError("Model not fitted yet! Call fit() first.")
+        distances = pairwise_distances(np.asarray(data, dtype=np.float64), self.centroids,
+                                       self.metric)
+        return np.argmin(distances, axis=1)
+    
+    def _assign(self, X, medoids):
+        """Nearest medoid (as a cluster number) and the distance to it."""
+        distances = pairwise_distances(X, X[medoids], self.metric)
+        self.n_distance_evaluations += distances.size
+        labels = np.argmin(distances, axis=1)
+        return labels, distances[np.arange(len(X)), labels]
+    
+    def _pam(self, X, rng):
+        """
+        PAM on X: k-medoids++ seeding, then FastPAM swap passes.
+        
+        Returns:
+        --------
+        np.ndarray of int
+            Indices (into X) of the k medoids
+        """
+        n = len(X)
+        k = self.k
+        cache = DistanceBlockCache(X, self.metric, self.block_size, self.cache_blocks)
+        
+        # Seeding (k-medoids++): next medoid ∝ distance to the nearest one
+        medoids = [int(rng.integers(n))]
+        nearest = pairwise_distances(X, X[medoids], self.metric)[:, 0]
+        for _ in range(1, k):
+            total = nearest.sum()
+            index = int(rng.integers(n)) if total == 0 else int(
+                min(np.searchsorted(np.cumsum(nearest), rng.random() * total), n - 1))
+            medoids.append(index)
+            np.minimum(nearest, pairwise_distances(X, X[index:index + 1], self.metric)[:, 0],
+                       out=nearest)
+        self.n_distance_evaluations += n * k
+        medoids = np.array(medoids)
+        
+        for iteration in range(self.max_iterations):
+            # Nearest and second-nearest medoid of every point
+            medoid_distances = pairwise_distances(X, X[medoids], self.metric)
+            self.n_distance_evaluations += medoid_distances.size
+            order = np.argsort(medoid_distances, axis=1)[:, :2]
+            rows = np.arange(n)
+            nearest_medoid = order[:, 0]
+            d_nearest = medoid_distances[rows, nearest_medoid]
+            d_second = (medoid_distances[rows, order[:, 1]] if k > 1
+                        else np.full(n, np.inf))
+            
+            # Removal loss of each medoid: its points fall back to their 2nd-nearest
+            removal_loss = np.bincount(nearest_medoid, weights=d_second - d_nearest, minlength=k)
+            
+            # Rows sorted by nearest medoid: per-medoid sums with one reduceat
+            row_order = np.argsort(nearest_medoid, kind='stable')
+            medoid_starts = np.searchsorted(nearest_medoid[row_order], np.arange(k))
+            has_points = np.bincount(nearest_medoid, minlength=k) > 0
+            
+            best_delta, best_swap = 0.0, None
+            # Alternate the scan direction: the most recent blocks are cached
+            block_order = (range(cache.n_blocks) if iteration % 2 == 0
+                           else range(cache.n_blocks - 1, -1, -1))
+            for block_id in block_order:
+                D = cache.block(block_id)  # (n, candidates)
+                d_near = d_nearest[:, np.newaxis]
+                d_sec = d_second[:, np.newaxis]
+                
+                # Points that would move to the candidate whatever is removed
+                closer = D < d_near
+                shared = np.where(closer, D - d_near, 0.0).sum(axis=0)
+                
+                # Per-medoid correction if that medoid is the one removed
+                correction = np.where(closer, d_near - d_sec,
+                                      np.where(D < d_sec, D - d_sec, 0.0))
+                per_medoid = np.zeros((k, D.shape[1]))
+                per_medoid[has_points] = np.add.reduceat(
+                    correction[row_order], medoid_starts[has_points], axis=0)
+                
+                if k == 1:  # No second-nearest: every point moves to the candidate
+                    delta = (D - d_near).sum(axis=0)[np.newaxis, :]
+                else:
+                    delta = removal_loss[:, np.newaxis] + per_medoid + shared[np.newaxis, :]
+                candidates = block_id * self.block_size + np.arange(D.shape[1])
+                delta[:, np.isin(candidates, medoids)] = np.inf  # Already medoids
+                
+                medoid_slot, column = np.unravel_index(np.argmin(delta), delta.shape)
+                if delta[medoid_slot, column] < best_delta - 1e-12:
+                    best_delta = delta[medoid_slot, column]
+                    best_swap = (medoid_slot, candidates[column])
+            
+            if best_swap is None:
+                break  # No swap lowers the total distance: converged
+            medoids[best_swap[0]] = best_swap[1]
+            self.n_iterations += 1
+        
+        self.n_distance_evaluations += cache.n_distance_evaluations
+        self.cache = cache
+        return medoids
+
+
+# Data shared with worker processes (see run_on_shared_data)
+_SHARED_DATA = None
+
+
+def count_workers(n_jobs, n_tasks):
+    """Worker processes that run_on_shared_data will actually use."""
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return 1
+    n_workers = multiprocessing.cpu_count() if n_jobs == -1 else n_jobs
+    return max(1, min(n_workers, n_tasks))
+
+
+def run_on_shared_data(func, arg_tuples, data, n_jobs):
+    """
+    Run func(*args) for every args tuple, in parallel worker processes.
+    
+    Why a module-level variable?
+    ----------------------------
+    The data is stored in _SHARED_DATA BEFORE the workers are forked.
+    Forked workers inherit it (copy-on-write), so it is never pickled and
+    sent with each task - func simply reads _SHARED_DATA.
+    Without fork support (e.g. Windows) the tasks run one by one.
+    """
+    global _SHARED_DATA
+    
+    n_workers = count_workers(n_jobs, len(arg_tuples))
+    # Restore afterwards: tasks may share data themselves (restarts in a sweep)
+    outer_data, _SHARED_DATA = _SHARED_DATA, data
+    try:
+        if n_workers > 1:
+            with multiprocessing.get_context('fork').Pool(n_workers) as pool:
+                return pool.starmap(func, arg_tuples)
+        return [func(*args) for args in arg_tuples]
+    finally:
+        _SHARED_DATA = outer_data
+
+
+def _fit_restart(params, seed):
+    """
+    Run one K-Means restart on the shared data (runs in a worker process).
+    
+    The shared data is a (points, sample_weight) pair.
+    
+    Returns:
+    --------
+    tuple of (float, centroids, int, int, KMeansHistory or list)
+        Inertia, centroids, iterations, distance evaluations and history
+    """
+    model = KMeansFromScratch(random_state=seed, **params)
+    data, sample_weight = _SHARED_DATA
+    
+    # Restarts run side by side - their progress output would be interleaved
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.fit(data, sample_weight)
+    
+    return (model.inertia, model.centroids,
+            model.n_iterations, model.n_distance_evaluations, model.history)
+
+
+def _shard_statistics(shard_path, centroids, k, chunk_size, dtype):
+    """
+    Map step of fit_shards: sufficient statistics of one shard.
+    
+    The shard is streamed from disk in chunks, so a worker holds at most
+    one chunk of it in memory.
+    
+    Returns:
+    --------
+    tuple of (np.ndarray (k, d), np.ndarray (k,), float)
+        Per-cluster coordinate sums, point counts, and the shard's inertia
+    """
+    sums = np.zeros((k, centroids.shape[1]))
+    counts = np.zeros(k)
+    inertia = 0.0
+    for chunk in ChunkedDataset(shard_path, chunk_size, dtype).chunks():
+        labels, min_distances_sq = nearest_centroids_numpy(chunk, centroids)
+        chunk_sums, chunk_counts = cluster_sums_numpy(chunk, labels, k)
+        sums += chunk_sums
+        counts += chunk_counts
+        inertia += float(min_distances_sq.sum(dtype=np.float64))
+    return sums, counts, inertia
+
+
+# =============================================================================
+# TEST THE IMPLEMENTATION
+# =============================================================================
+
+print("=" * 80)
+print("TESTING K-MEANS FROM SCRATCH")
+print("=" * 80)
+print()
+
+# Create simple 2D dataset with clear clusters
+print("📊 Creating synthetic dataset with 3 clusters...")
+print()
+
+# Cluster 1: Points around (2, 2)
+cluster1 = [[2 + random.gauss(0, 0.5), 2 + random.gauss(0, 0.5)] 
+            for _ in range(30)]
+
+# Cluster 2: Points around (8, 3)
+cluster2 = [[8 + random.gauss(0, 0.5), 3 + random.gauss(0, 0.5)] 
+            for _ in range(30)]
+
+# Cluster 3: Points around (5, 8)
+cluster3 = [[5 + random.gauss(0, 0.5), 8 + random.gauss(0, 0.5)] 
+            for _ in range(30)]
+
+# Combine all data
+data = cluster1 + cluster2 + cluster3
+
+# True labels (for comparison)
+true_labels = [0] * 30 + [1] * 30 + [2] * 30
+
+print(f"✓ Created {len(data)} points in 3 natural clusters")
+print(f"  Cluster 1 (around 2,2): 30 points")
+print(f"  Cluster 2 (around 8,3): 30 points")
+print(f"  Cluster 3 (around 5,8): 30 points")
+print()
+
+# Fit K-Means (keeping the history so we can animate it in Part C)
+kmeans = KMeansFromScratch(k=3, max_iterations=50, random_state=42, record_history=True)
+kmeans.fit(data)
+
+# Show results
+print("🎯 Final Centroids:")
+for i, centroid in enumerate(kmeans.centroids):
+    print(f"  Cluster {i}: ({centroid[0]:.2f}, {centroid[1]:.2f})")
+print()
+
+# Count points in each cluster
+cluster_counts = [0, 0, 0]
+for label in kmeans.labels:
+    cluster_counts[label] += 1
+
+print("📊 Cluster Sizes:")
+for i, count in enumerate(cluster_counts):
+    print(f"  Cluster {i}: {count} points")
+print()
+
+
+# =============================================================================
+# DEMONSTRATION: STEP-BY-STEP VISUALIZATION
+# =============================================================================
+
+print("=" * 80)
+print("STEP-BY-STEP: How K-Means Works")
+print("=" * 80)
+print()
+
+# Create simpler 2D example for clear illustration
+simple_data = [
+    [1, 1], [1.5, 2], [2, 1.5],  # Group 1
+    [8, 8], [8.5, 9], [9, 8.5],  # Group 2
+]
+
+print("📊 Simple dataset with 6 points:")
+for i, point in enumerate(simple_data):
+    print(f"  Point {i+1}: {point}")
+print()
+
+# Run K-Means with k=2 (record centroids, plus labels for the first iterations)
+simple_kmeans = KMeansFromScratch(k=2, max_iterations=10, random_state=42,
+                                  record_history=True, history_label_iterations=range(4))
+simple_kmeans.fit(simple_data)
+
+print("🔍 Let's trace through the first few iterations:")
+print()
+
+for iter_num in range(min(4, len(simple_kmeans.history))):
+    state = simple_kmeans.history[iter_num]
+    
+    if iter_num == 0:
+        print(f"INITIALIZATION:")
+        print(f"  Initial centroids (randomly chosen from data):")
+        for i, cent in enumerate(state['centroids']):
+            print(f"    Centroid {i}: ({cent[0]:.2f}, {cent[1]:.2f})")
+    else:
+        print(f"\nITERATION {iter_num}:")
+        print(f"  Current centroids:")
+        for i, cent in enumerate(state['centroids']):
+            print(f"    Centroid {i}: ({cent[0]:.2f}, {cent[1]:.2f})")
+        
+        print(f"  Point assignments:")
+        if state['labels'] is not None:
+            for i, (point, label) in enumerate(zip(simple_data, state['labels'])):
+                print(f"    Point {i+1} {point} → Cluster {label}")
+    
+    print()
+
+
+"""
+================================================================================
+PART B: IMPLEMENTATION WITH SCIKIT-LEARN
+================================================================================
+
+Why use Scikit-learn?
+---------------------
+- Highly optimized (faster)
+- Battle-tested (reliable)
+- More features (K-Means++, Mini-Batch K-Means, etc.)
+- Industry standard
+
+Our implementation is for LEARNING.
+Scikit-learn is for PRODUCTION.
+"""
+
+from sklearn.cluster import KMeans
+import numpy as np
+
+print("=" * 80)
+print("K-MEANS WITH SCIKIT-LEARN")
+print("=" * 80)
+print()
+
+# Convert our data to numpy array (sklearn expects numpy)
+data_np = np.array(data)
+
+# Fit K-Means using sklearn
+sklearn_kmeans = KMeans(n_clusters=3, random_state=42, n_init=10)
+sklearn_kmeans.fit(data_np)
+
+print(f"✅ Sklearn K-Means fitted successfully")
+print()
+
+print("🎯 Sklearn Centroids:")
+for i, centroid in enumerate(sklearn_kmeans.cluster_centers_):
+    print(f"  Cluster {i}: ({centroid[0]:.2f}, {centroid[1]:.2f})")
+print()
+
+print("📊 Sklearn Cluster Sizes:")
+unique, counts = np.unique(sklearn_kmeans.labels_, return_counts=True)
+for cluster, count in zip(unique, counts):
+    print(f"  Cluster {cluster}: {count} points")
+print()
+
+print(f"📉 Sklearn Inertia: {sklearn_kmeans.inertia_:.2f}")
+print()
+
+# Compare with our implementation
+print("=" * 80)
+print("COMPARISON: Our Implementation vs Sklearn")
+print("=" * 80)
+print()
+
+our_inertia = kmeans.inertia
+sklearn_inertia = sklearn_kmeans.inertia_
+
+print(f"Our Inertia:     {our_inertia:.2f}")
+print(f"Sklearn Inertia: {sklearn_inertia:.2f}")
+print(f"Difference:      {abs(our_inertia - sklearn_inertia):.2f}")
+print()
+
+print("💡 Note: Small differences are expected because:")
+print("   - Different random initializations")
+print("   - Sklearn uses K-Means++ (smarter initialization)")
+print("   - Sklearn is more numerically precise")
+print()
+
+
+"""
+================================================================================
+PART C: VISUALIZATION (Using Matplotlib)
+================================================================================
+"""
+
+import matplotlib.pyplot as plt
+
+def plot_kmeans_result(data, labels, centroids, title="K-Means Clustering"):
+    """
+    Visualize K-Means clustering results.
+    
+    Parameters:
+    -----------
+    data : list or array
+        Data points (2D for visualization)
+    labels : list or array
+        Cluster assignments
+    centroids : list or array
+        Cluster centers
+    title : str
+        Plot title
+    """
+    # Convert to numpy for easier indexing
+    data_np = np.array(data)
+    centroids_np = np.array(centroids)
+    labels_np = np.array(labels)
+    
+    plt.figure(figsize=(10, 8))
+    
+    # Plot each cluster with different color
+    colors = ['red', 'blue', 'green', 'orange', 'purple']
+    
+    for cluster_id in range(len(centroids)):
+        # Get points in this cluster
+        cluster_points = data_np[labels_np == cluster_id]
+        
+        if len(cluster_points) > 0:
+            plt.scatter(cluster_points[:, 0], cluster_points[:, 1], 
+                       c=colors[cluster_id % len(colors)], 
+                       label=f'Cluster {cluster_id}',
+                       alpha=0.6, s=50)
+    
+    # Plot centroids
+    plt.scatter(centroids_np[:, 0], centroids_np[:, 1], 
+               c='black', marker='X', s=200, 
+               label='Centroids', edgecolors='white', linewidths=2)
+    
+    plt.xlabel('Feature 1')
+    plt.ylabel('Feature 2')
+    plt.title(title)
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+    plt.show()
+
+
+def plot_kmeans_animation(history, data, title="K-Means Iterations"):
+    """
+    Create subplots showing K-Means iterations.
+    
+    Parameters:
+    -----------
+    history : KMeansHistory (or list of dict)
+        History of centroids and labels at each iteration
+    data : list or array
+        Data points
+    title : str
+        Main title
+    """
+    # Show first, middle, and last iterations
+    n_iterations = len(history)
+    indices_to_show = [0, n_iterations // 3, 2 * n_iterations // 3, n_iterations - 1]
+    
+    fig, axes = plt.subplots(2, 2, figsize=(12, 12))
+    axes = axes.flatten()
+    
+    data_np = np.array(data, dtype=float)
+    colors = ['red', 'blue', 'green', 'orange', 'purple']
+    
+    for idx, iter_num in enumerate(indices_to_show):
+        ax = axes[idx]
+        state = history[iter_num]
+        centroids = np.array(state['centroids'])
+        labels = state['labels']
+        
+        if labels is None and iter_num > 0:
+            # Labels weren't kept for this iteration - they are simply
+            # the nearest centroid of each point, so recompute them
+            labels = np.argmin(squared_distances_numpy(data_np, centroids), axis=1)
+        
+        if labels is None:
+            # Initial state - just show centroids
+            ax.scatter(data_np[:, 0], data_np[:, 1], 
+                      c='gray', alpha=0.5, s=30)
+            ax.scatter(centroids[:, 0], centroids[:, 1], 
+                      c='black', marker='X', s=200, edgecolors='white', linewidths=2)
+            ax.set_title(f'Initialization')
+        else:
+            # Show clusters
+            for cluster_id in range(len(centroids)):
+                cluster_points = data_np[np.array(labels) == cluster_id]
+                if len(cluster_points) > 0:
+                    ax.scatter(cluster_points[:, 0], cluster_points[:, 1], 
+                              c=colors[cluster_id % len(colors)], 
+                              alpha=0.6, s=30)
+            
+            ax.scatter(centroids[:, 0], centroids[:, 1], 
+                      c='black', marker='X', s=200, edgecolors='white', linewidths=2)
+            ax.set_title(f'Iteration {iter_num}')
+        
+        ax.grid(True, alpha=0.3)
+        ax.set_xlabel('Feature 1')
+        ax.set_ylabel('Feature 2')
+    
+    plt.suptitle(title, fontsize=16)
+    plt.tight_layout()
+    plt.show()
+
+
+print("=" * 80)
+print("GENERATING VISUALIZATIONS")
+print("=" * 80)
+print()
+
+print("📊 Creating plots...")
+print("   1. Final clustering result")
+print("   2. K-Means iterations (animation)")
+print()
+
+# Plot 1: Final result
+plot_kmeans_result(data, kmeans.labels, kmeans.centroids, 
+                   title="Final K-Means Clustering (Our Implementation)")
+
+# Plot 2: Iterations
+plot_kmeans_animation(kmeans.history, data, 
+                     title="K-Means Algorithm: Watch Centroids Move!")
+
+
+"""
+================================================================================
+PART D: REAL-WORLD APPLICATIONS
+================================================================================
+"""
+
+print("\n")
+print("=" * 80)
+print("APPLICATION 1: CUSTOMER SEGMENTATION")
+print("=" * 80)
+print()
+
+print("""
+Business Problem:
+-----------------
+You have customer data: [Annual Income, Spending Score]
+You want to segment customers into groups for targeted marketing.
+
+Question: How many customer segments exist naturally?
+""")
+
+# Simulated customer data
+# [Annual Income (k$), Spending Score (1-100)]
+np.random.seed(42)
+
+# Segment 1: Low income, low spending
+seg1 = [[income, score] 
+        for income, score in zip(
+            np.random.normal(30, 5, 25),
+            np.random.normal(35, 10, 25)
+        )]
+
+# Segment 2: Low income, high spending  
+seg2 = [[income, score]
+        for income, score in zip(
+            np.random.normal(35, 5, 25),
+            np.random.normal(75, 10, 25)
+        )]
+
+# Segment 3: High income, low spending
+seg3 = [[income, score]
+        for income, score in zip(
+            np.random.normal(75, 5, 25),
+            np.random.normal(30, 10, 25)
+        )]
+
+# Segment 4: High income, high spending
+seg4 = [[income, score]
+        for income, score in zip(
+            np.random.normal(75, 5, 25),
+            np.random.normal(75, 10, 25)
+        )]
+
+customer_data = seg1 + seg2 + seg3 + seg4
+
+print(f"📊 Customer Data: {len(customer_data)} customers")
+print(f"   Features: [Annual Income (k$), Spending Score (1-100)]")
+print()
+
+# Cluster customers
+customer_kmeans = KMeansFromScratch(k=4, random_state=42)
+customer_kmeans.fit(customer_data)
+
+# Analyze segments
+print("🎯 Customer Segments Discovered:")
+print()
+
+for cluster_id in range(4):
+    cluster_customers = [customer_data[i] for i in range(len(customer_data))
+                        if customer_kmeans.labels[i] == cluster_id]
+    
+    avg_income = sum(c[0] for c in cluster_customers) / len(cluster_customers)
+    avg_spending = sum(c[1] for c in cluster_customers) / len(cluster_customers)
+    
+    print(f"Segment {cluster_id}: {len(cluster_customers)} customers")
+    print(f"  Average Income: ${avg_income:.1f}k")
+    print(f"  Average Spending Score: {avg_spending:.1f}")
+    
+    # Business interpretation
+    if avg_income < 50 and avg_spending < 50:
+        print(f"  💡 Type: Budget-conscious, lower income")
+    elif avg_income < 50 and avg_spending >= 50:
+        print(f"  💡 Type: High spenders despite lower income")
+    elif avg_income >= 50 and avg_spending < 50:
+        print(f"  💡 Type: High income but conservative spenders")
+    else:
+        print(f"  💡 Type: Premium customers - high income, high spending")
+    print()
+
+# Visualize
+plot_kmeans_result(customer_data, customer_kmeans.labels, customer_kmeans.centroids,
+                   title="Customer Segmentation")
+
+
+print("=" * 80)
+print("APPLICATION 2: IMAGE COMPRESSION")
+print("=" * 80)
+print()
+
+print("""
+Problem:
+--------
+Images have millions of colors, but we can approximate them with fewer colors!
+Each pixel is a point in 3D RGB color space: (Red, Green, Blue)
+
+Strategy:
+---------
+1. Treat each pixel as a 3D point
+2. Cluster pixels into K color groups
+3. Replace each pixel with its cluster center
+4. Image now uses only K colors!
+
+Example: Reduce 16 million colors → 16 colors
+""")
+
+# Simulate image pixels (we'll use a small example)
+# In reality, you'd load actual image data
+print("📸 Simulating image with 100 pixels...")
+print()
+
+# Create "image" with 3 dominant colors plus noise
+red_pixels = [[200 + random.randint(-20, 20), 
+               50 + random.randint(-20, 20), 
+               50 + random.randint(-20, 20)] 
+              for _ in range(40)]
+
+green_pixels = [[50 + random.randint(-20, 20), 
+                 200 + random.randint(-20, 20), 
+                 50 + random.randint(-20, 20)] 
+                for _ in range(30)]
+
+blue_pixels = [[50 + random.randint(-20, 20), 
+                50 + random.randint(-20, 20), 
+                200 + random.randint(-20, 20)] 
+               for _ in range(30)]
+
+image_pixels = red_pixels + green_pixels + blue_pixels
+
+print(f"Original: {len(image_pixels)} pixels, each with unique RGB value")
+print(f"Goal: Compress to just 3 colors")
+print()
+
+# Cluster colors
+color_kmeans = KMeansFromScratch(k=3, random_state=42)
+color_kmeans.fit(image_pixels)
+
+print("🎨 Compressed Color Palette (3 colors):")
+for i, color in enumerate(color_kmeans.centroids):
+    r, g, b = int(color[0]), int(color[1]), int(color[2])
+    print(f"  Color {i}: RGB({r}, {g}, {b})")
+print()
+
+# Calculate compression ratio
+original_size = len(image_pixels) * 3  # 3 bytes per pixel (RGB)
+compressed_size = 3 * 3 + len(image_pixels) * 1  # 3 colors + 1 byte index per pixel
+
+print(f"💾 Compression:")
+print(f"  Original size: {original_size} bytes")
+print(f"  Compressed size: {compressed_size} bytes")
+print(f"  Compression ratio: {original_size / compressed_size:.1f}x")
+print()
+
+
+def unique_colors(pixels):
+    """
+    Collapse pixels to their distinct RGB colors, with how often each occurs.
+    
+    Why do we need this?
+    --------------------
+    A 12-megapixel photo has 12 million pixels - but usually only a few
+    hundred thousand DIFFERENT colors. Clustering each distinct color once,
+    weighted by its count, gives exactly the same K-Means result.
+    
+    Trick: pack (R, G, B) into one integer R·65536 + G·256 + B, so finding
+    the distinct colors is a 1D np.unique instead of a slower row-wise one.
+    
+    Parameters:
+    -----------
+    pixels : array-like, shape (..., 3)
+        Integer RGB values 0-255 (e.g. an image of shape (height, width, 3))
+        
+    Returns:
+    --------
+    tuple of (np.ndarray (m, 3) uint8, np.ndarray (m,), np.ndarray (n,))
+        Distinct colors, their pixel counts, and for every pixel the
+        index of its color
+    """
+    unique_codes, inverse, counts = np.unique(pack_colors(pixels), return_inverse=True,
+                                              return_counts=True)
+    return unpack_colors(unique_codes), counts, inverse.ravel()
+
+
+def pack_colors(pixels):
+    """RGB pixels (..., 3) → one integer R·65536 + G·256 + B per pixel."""
+    pixels = np.asarray(pixels).reshape(-1, 3)
+    if pixels.dtype != np.uint8 and pixels.size:
+        # Anything else could silently wrap around (-1 → 255, 256 → 0)
+        if pixels.min() < 0 or pixels.max() > 255 or np.any(pixels != np.round(pixels)):
+            raise ValueError("RGB values must be integers between 0 and 255")
+    pixels = pixels.astype(np.uint32)
+    return (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+
+
+def unpack_colors(codes):
+    """Inverse of pack_colors: integer codes → (m, 3) uint8 RGB colors."""
+    colors = np.empty((len(codes), 3), dtype=np.uint8)
+    colors[:, 0] = codes >> 16
+    colors[:, 1] = (codes >> 8) & 255
+    colors[:, 2] = codes & 255
+    return colors
+
+
+def quantize_colors(pixels, n_colors, **kmeans_params):
+    """
+    Reduce an image to n_colors colors with weighted K-Means.
+    
+    The Pipeline:
+    -------------
+    1. Collapse pixels to distinct colors + counts (unique_colors)
+    2. Fit K-Means on the distinct colors, weighted by their counts
+    3. Map every pixel to the palette entry of its color
+    Fit time scales with the number of DISTINCT colors, not the resolution.
+    
+    Parameters:
+    -----------
+    pixels : array-like, shape (..., 3)
+        RGB values 0-255
+    n_colors : int
+        Size of the palette
+    **kmeans_params
+        Extra KMeansFromScratch arguments (backend='numpy' by default)
+        
+    Returns:
+    --------
+    tuple of (np.ndarray (n_colors, 3) uint8, np.ndarray, KMeansFromScratch)
+        Palette, palette index of every pixel (same shape as the image
+        without the color axis), and the fitted model
+    """
+    pixels = np.asarray(pixels)
+    colors, counts, inverse = unique_colors(pixels)
+    
+    palette, color_labels, model = fit_palette(colors, counts, n_colors, **kmeans_params)
+    index_dtype = np.uint8 if n_colors <= 256 else np.uint16
+    indices = np.asarray(color_labels, dtype=index_dtype)[inverse]
+    return palette, indices.reshape(pixels.shape[:-1]), model
+
+
+def fit_palette(colors, counts, n_colors, **kmeans_params):
+    """
+    Weighted K-Means on distinct colors → a palette of exactly n_colors.
+    
+    Fewer distinct colors than n_colors?
+    ------------------------------------
+    Then every color IS a palette entry: K-Means runs with k = the number
+    of distinct colors, and the unused palette entries repeat the last
+    color (no pixel points to them).
+    
+    Parameters:
+    -----------
+    colors : np.ndarray, shape (m, 3)
+        Distinct RGB colors
+    counts : np.ndarray, shape (m,)
+        Pixels of each color (the sample weights)
+    n_colors : int
+        Size of the palette
+    **kmeans_params
+        Extra KMeansFromScratch arguments (backend='numpy' by default)
+        
+    Returns:
+    --------
+    tuple of (np.ndarray (n_colors, 3) uint8, np.ndarray (m,), KMeansFromScratch)
+        Palette, palette index of every distinct color, and the fitted model
+    """
+    kmeans_params.setdefault('backend', 'numpy')
+    model = KMeansFromScratch(k=min(n_colors, len(colors)), **kmeans_params)
+    model.fit(colors.astype(model.dtype), sample_weight=counts)
+    
+    palette = np.clip(np.round(model.centroids), 0, 255).astype(np.uint8)
+    if len(palette) < n_colors:
+        palette = np.vstack([palette, np.repeat(palette[-1:], n_colors - len(palette), axis=0)])
+    return palette, np.asarray(model.labels), model
+
+
+def quantize_raw_image(input_path, width, height, n_colors, output_path,
+                       chunk_size=1_048_576, **kmeans_params):
+    """
+    Quantize a full-resolution raw RGB image file into an indexed image file.
+    
+    Why do we need this?
+    --------------------
+    A 24-megapixel photo is 72 MB of RGB bytes - and as float64 points
+    576 MB. We never load it: the input is memory-mapped and read in
+    chunks of chunk_size pixels, and the output is written the same way.
+    
+    The Pipeline:
+    -------------
+    1. Pass 1: count the distinct colors chunk by chunk (pack_colors)
+    2. Fit the palette: weighted K-Means on the distinct colors
+    3. Pass 2: map every chunk of pixels to palette indices with one
+       vectorized lookup (np.searchsorted into the sorted color codes)
+    
+    File formats:
+    -------------
+    - Input:  raw interleaved RGB bytes, row by row (height × width × 3)
+    - Output: the palette (n_colors × 3 bytes), then one uint8 palette
+      index per pixel - an indexed image, 1 byte per pixel instead of 3
+    
+    Parameters:
+    -----------
+    input_path : str
+        Raw RGB file
+    width, height : int
+        Image size in pixels
+    n_colors : int
+        Palette size (at most 256, so an index fits in one byte); an image
+        with fewer distinct colors gets them all, padded (see fit_palette)
+    output_path : str
+        Where to write the indexed image
+    chunk_size : int
+        Pixels per chunk
+    **kmeans_params
+        Extra KMeansFromScratch arguments (backend='numpy' by default)
+        
+    Returns:
+    --------
+    dict
+        'palette' (n_colors, 3) uint8, 'indices' (height, width) uint8
+        (memory-mapped from the output file), 'bytes_read',
+        'bytes_written', 'n_distinct_colors', 'seconds' and
+        'megapixels_per_second'
+    """
+    if not 1 <= n_colors <= 256:
+        raise ValueError(f"n_colors must be between 1 and 256, got {n_colors}")
+    
+    start = time.time()
+    n_pixels = width * height
+    image = np.memmap(input_path, dtype=np.uint8, mode='r', shape=(n_pixels, 3))
+    
+    # Pass 1: distinct colors and their counts, merged chunk by chunk
+    codes = np.empty(0, dtype=np.uint32)
+    counts = np.empty(0, dtype=np.int64)
+    for chunk_start in range(0, n_pixels, chunk_size):
+        chunk_codes, chunk_counts = np.unique(
+            pack_colors(image[chunk_start:chunk_start + chunk_size]), return_counts=True)
+        codes, merged = np.unique(np.concatenate([codes, chunk_codes]), return_inverse=True)
+        counts = np.bincount(merged.ravel(), weights=np.concatenate([counts, chunk_counts]),
+                             minlength=len(codes)).astype(np.int64)
+    
+    # Fit the palette on the weighted distinct colors (padded if there are
+    # fewer distinct colors than n_colors)
+    palette, color_labels, _ = fit_palette(unpack_colors(codes), counts, n_colors,
+                                           **kmeans_params)
+    color_labels = color_labels.astype(np.uint8)
+    
+    # Pass 2: write palette + one index byte per pixel
+    palette_bytes = n_colors * 3
+    output = np.memmap(output_path, dtype=np.uint8, mode='w+', shape=(palette_bytes + n_pixels,))
+    output[:palette_bytes] = palette.ravel()
+    for chunk_start in range(0, n_pixels, chunk_size):
+        chunk_codes = pack_colors(image[chunk_start:chunk_start + chunk_size])
+        chunk_labels = color_labels[np.searchsorted(codes, chunk_codes)]
+        output[palette_bytes + chunk_start:palette_bytes + chunk_start + len(chunk_codes)] = chunk_labels
+    output.flush()
+    del output
+    
+    seconds = time.time() - start
+    indices = np.memmap(output_path, dtype=np.uint8, mode='r', offset=palette_bytes,
+                        shape=(height, width))
+    return {
+        'palette': palette,
+        'indices': indices,
+        'bytes_read': image.nbytes,
+        'bytes_written': os.path.getsize(output_path),
+        'n_distinct_colors': len(codes),
+        'seconds': seconds,
+        'megapixels_per_second': n_pixels / seconds / 1e6,
+    }
+
+
+# The same compression through the weighted pipeline
+palette, pixel_indices, _ = quantize_colors(image_pixels, 3, random_state=42)
+print(f"🎨 Weighted pipeline: {len(unique_colors(image_pixels)[0])} distinct colors "
+      f"→ palette {palette.tolist()}")
+print()
+
+
+"""
+================================================================================
+PART E: ADVANCED TOPICS
+================================================================================
+"""
+
+print("=" * 80)
+print("ADVANCED TOPIC 1: ELBOW METHOD (Finding Optimal K)")
+print("=" * 80)
+print()
+
+print("""
+Problem:
+--------
+How do we choose K (number of clusters)?
+
+The Elbow Method:
+-----------------
+1. Try different values of K (e.g., 1 to 10)
+2. Calculate inertia for each K
+3. Plot K vs Inertia
+4. Look for "elbow" - point where adding more clusters doesn't help much
+
+Why does it work?
+-----------------
+- More clusters → Lower inertia (better fit)
+- But too many clusters → Overfitting!
+- Elbow = sweet spot (good fit without overdoing it)
+""")
+
+def find_elbow(k_values, inertias):
+    """
+    Detect the "elbow" (knee) of an inertia curve automatically.
+    
+    How it works:
+    -------------
+    1. Scale K and inertia to [0, 1] so both axes count equally
+    2. Draw a straight line from the first point to the last point
+    3. The elbow is the point FARTHEST below that line - where the curve
+       bends from "steep" to "flat"
+    
+    Returns:
+    --------
+    int
+        The K value at the elbow
+    """
+    ks = np.asarray(k_values, dtype=float)
+    values = np.asarray(inertias, dtype=float)
+    if len(ks) < 3:
+        return int(ks[0])
+    
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    value_range = values[0] - values[-1]
+    y = (values - values[-1]) / value_range if value_range > 0 else np.zeros_like(values)
+    
+    # Line from (0, 1) to (1, 0) is y = 1 - x; distance below it ∝ 1 - x - y
+    return int(ks[np.argmax(1 - x - y)])
+
+
+def add_plusplus_centroids(X, centroids, n_new, rng, sample_weight=None):
+    """
+    Extend a set of centroids with n_new K-Means++ (D²) draws.
+    
+    Used for warm starts: the (k-1)-cluster solution plus ONE new seed
+    placed where the data is worst covered is an excellent start for k.
+    With sample_weight, points are drawn with probability ∝ weight × D².
+    """
+    centroids = np.asarray(centroids, dtype=float)
+    _, closest_d2 = nearest_centroids_numpy(X, centroids)
+    weights = np.ones(len(X)) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+    
+    new_centroids = []
+    for _ in range(n_new):
+        probabilities = weights * closest_d2
+        total = probabilities.sum()
+        index = rng.integers(len(X)) if total == 0 else min(
+            np.searchsorted(np.cumsum(probabilities), rng.random() * total), len(X) - 1)
+        new_centroids.append(X[index])
+        np.minimum(closest_d2, ((X - X[index]) ** 2).sum(axis=1), out=closest_d2)
+    
+    return np.vstack([centroids] + new_centroids)
+
+
+def _fit_for_k(params, k):
+    """Fit one K of an elbow sweep on the shared (data, sample_weight) pair."""
+    model = KMeansFromScratch(k=k, **params)
+    data, sample_weight = _SHARED_DATA
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.fit(data, sample_weight)
+    return model.inertia, model.n_iterations, np.asarray(model.centroids, dtype=float)
+
+
+def elbow_sweep(data, k_values, n_jobs=1, warm_start=False, sample_weight=None,
+                **kmeans_params):
+    """
+    Fit K-Means for every K and find the elbow of the inertia curve.
+    
+    Two ways to speed up the sweep:
+    -------------------------------
+    - n_jobs: the K values are independent, so fit them in parallel
+      worker processes (the data is shared, not copied per task)
+    - warm_start: start K from the (K-1) solution plus one K-Means++
+      draw. Most centroids are already in place, so each fit needs only
+      a few iterations. (The fits then depend on each other and run
+      one after another - n_jobs is ignored.)
+    Each fit's own inertia is reused - nothing is recomputed.
+    
+    Parameters:
+    -----------
+    data : list of lists (or 2D array)
+        Data points
+    k_values : iterable of int
+        K values to try
+    n_jobs : int
+        Worker processes for cold fits (1 = serial, -1 = all CPUs)
+    warm_start : bool
+        Seed each K from the previous solution
+    sample_weight : list or array of float, optional
+        Point weights, e.g. from a coreset (see lightweight_coreset)
+    **kmeans_params
+        Passed on to KMeansFromScratch (max_iterations, backend, ...)
+        
+    Returns:
+    --------
+    dict
+        'k_values', 'inertias', 'n_iterations', 'centroids' (per K)
+        and 'elbow_k'
+    """
+    k_values = sorted(k_values)
+    
+    if not warm_start:
+        results = run_on_shared_data(_fit_for_k, [(kmeans_params, k) for k in k_values],
+                                     (data, sample_weight), n_jobs)
+    else:
+        X = np.asarray(data, dtype=float)
+        rng = np.random.default_rng(kmeans_params.get('random_state', 42))
+        results, previous = [], None
+        
+        for k in k_values:
+            params = dict(kmeans_params)
+            if previous is not None and len(previous) < k:
+                params['init'] = add_plusplus_centroids(X, previous, k - len(previous), rng,
+                                                        sample_weight)
+            
+            model = KMeansFromScratch(k=k, **params)
+            with contextlib.redirect_stdout(io.StringIO()):
+                model.fit(data, sample_weight)
+            previous = np.asarray(model.centroids, dtype=float)
+            results.append((model.inertia, model.n_iterations, previous))
+    
+    inertias = [inertia for inertia, _, _ in results]
+    return {
+        'k_values': k_values,
+        'inertias': inertias,
+        'n_iterations': [n_iterations for _, n_iterations, _ in results],
+        'centroids': [centroids for _, _, centroids in results],
+        'elbow_k': find_elbow(k_values, inertias),
+    }
+
+
+# Test different K values
+k_values = range(1, 11)
+
+print("🔍 Testing different K values...")
+print()
+
+sweep = elbow_sweep(data, k_values, max_iterations=50, random_state=42, init='k-means++')
+inertias = sweep['inertias']  # Each fit's own inertia - no recomputation
+elbow_k = sweep['elbow_k']
+
+for k, inertia in zip(sweep['k_values'], inertias):
+    print(f"K={k}: Inertia={inertia:.2f}")
+
+print()
+
+# Plot elbow curve
+plt.figure(figsize=(10, 6))
+plt.plot(k_values, inertias, 'bo-', linewidth=2, markersize=8)
+plt.xlabel('Number of Clusters (K)', fontsize=12)
+plt.ylabel('Inertia', fontsize=12)
+plt.title('Elbow Method: Finding Optimal K', fontsize=14)
+plt.grid(True, alpha=0.3)
+
+# Highlight the detected "elbow"
+plt.axvline(x=elbow_k, color='red', linestyle='--', label=f'Elbow at K={elbow_k}')
+plt.legend()
+plt.show()
+
+print("💡 Interpretation:")
+print(f"   The 'elbow' is around K={elbow_k} (detected by find_elbow)")
+print(f"   After K={elbow_k}, adding more clusters doesn't reduce inertia much")
+print("   Compare with our data: we created 3 clusters!")
+print()
+
+
+print("=" * 80)
+print("ADVANCED TOPIC 2: SILHOUETTE SCORE (Cluster Quality)")
+print("=" * 80)
+print()
+
+print("""
+Problem:
+--------
+Inertia alone doesn't tell us if clusters are well-separated.
+
+Silhouette Score:
+-----------------
+Measures how similar a point is to its own cluster vs other clusters.
+
+Formula: s = (b - a) / max(a, b)
+where:
+- a = avg distance to points in same cluster
+- b = avg distance to points in nearest other cluster
+
+Score range: [-1, 1]
+- 1: Perfect clustering
+- 0: Overlapping clusters
+- -1: Wrong cluster assignment
+""")
+
+def calculate_silhouette_score(data, labels, centroids):
+    """
+    Calculate average silhouette score for the clustering.
+    
+    Higher score = better defined clusters
+    """
+    n = len(data)
+    silhouette_scores = []
+    
+    for i in range(n):
+        point = data[i]
+        own_cluster = labels[i]
+        
+        # Calculate a: avg distance to points in same cluster
+        same_cluster_points = [data[j] for j in range(n) if labels[j] == own_cluster and j != i]
+        
+        if len(same_cluster_points) == 0:
+            a = 0
+        else:
+            a = sum(euclidean_distance(point, p) for p in same_cluster_points) / len(same_cluster_points)
+        
+        # Calculate b: avg distance to nearest other cluster
+        b = float('inf')
+        
+        for cluster_id in range(len(centroids)):
+            if cluster_id == own_cluster:
+                continue
+            
+            other_cluster_points = [data[j] for j in range(n) if labels[j] == cluster_id]
+            
+            if len(other_cluster_points) > 0:
+                avg_dist = sum(euclidean_distance(point, p) for p in other_cluster_points) / len(other_cluster_points)
+                b = min(b, avg_dist)
+        
+        # Calculate silhouette score for this point
+        if max(a, b) == 0:
+            s = 0
+        else:
+            s = (b - a) / max(a, b)
+        
+        silhouette_scores.append(s)
+    
+    # Return average
+    return sum(silhouette_scores) / len(silhouette_scores)
+
+
+def calculate_silhouette_score_numpy(data, labels, block_size=None):
+    """
+    Vectorized silhouette score, computed in memory-bounded row blocks.
+    
+    Why a second version?
+    ---------------------
+    The loop above rebuilds same_cluster_points and other_cluster_points
+    for EVERY point: O(n²·k) list work - hours beyond ~20k points.
+    But a full n × n distance matrix would need 3.2 GB at n = 20k!
+    
+    The Block Trick:
+    ----------------
+    1. Sort the points by cluster once
+    2. For a block of rows, compute distances to ALL points (block × n)
+    3. Sum each row's distances per cluster in ONE np.add.reduceat call
+       (clusters are contiguous after sorting)
+    4. a = own-cluster sum / (size - 1),  b = min over other clusters of
+       sum / size,  s = (b - a) / max(a, b)
+    Only one block is in memory at a time - never the full n × n matrix.
+    Gives the same result as calculate_silhouette_score (a = 0 for points
+    alone in their cluster, as there).
+    
+    Parameters:
+    -----------
+    data : list of lists (or 2D array)
+        Data points
+    labels : list or array of int
+        Cluster of each point
+    block_size : int, optional
+        Rows per block (default: about 4 million distances per block)
+        
+    Returns:
+    --------
+    float
+        Average silhouette score
+    """
+    return float(silhouette_values_numpy(data, labels, block_size=block_size).mean())
+
+
+def silhouette_values_numpy(data, labels, rows=None, block_size=None):
+    """
+    Silhouette value of selected points, measured against ALL points.
+    
+    This is the block computation behind calculate_silhouette_score_numpy.
+    Asking only for some rows costs O(rows · n) instead of O(n²) - which
+    is what the sampled estimator below relies on.
+    
+    Parameters:
+    -----------
+    data : list of lists (or 2D array)
+        Data points
+    labels : list or array of int
+        Cluster of each point
+    rows : array of int, optional
+        Which points to score (default: all of them)
+    block_size : int, optional
+        Rows per block (default: about 4 million distances per block)
+        
+    Returns:
+    --------
+    np.ndarray
+        Silhouette value of each selected point
+    """
+    X = np.asarray(data, dtype=float)
+    labels = np.asarray(labels)
+    n = len(X)
+    rows = np.arange(n) if rows is None else np.asarray(rows)
+    if block_size is None:
+        block_size = max(1, 4_000_000 // n)
+    
+    # Sort by cluster so each cluster is one contiguous run of columns
+    order = np.argsort(labels, kind='stable')
+    X_sorted = X[order]
+    clusters, starts, sizes = np.unique(labels[order], return_index=True, return_counts=True)
+    if len(clusters) < 2:
+        return np.zeros(len(rows))
+    
+    # Position of each point's own cluster among the non-empty clusters
+    own_cluster = np.searchsorted(clusters, labels)
+    
+    # ‖x‖² once for all points, not once per block
+    norms = np.einsum('ij,ij->i', X, X)
+    norms_sorted = norms[order]
+    
+    values = np.empty(len(rows))
+    for start in range(0, len(rows), block_size):
+        block_rows = rows[start:start + block_size]
+        distances = np.sqrt(squared_distances_numpy(X[block_rows], X_sorted,
+                                                    norms[block_rows], norms_sorted))
+        cluster_sums = np.add.reduceat(distances, starts, axis=1)  # (block, clusters)
         
-        Formula: Σ (distance from point to its centroid)²
-        """
-        inertia = 0
-        for i, point in enumerate(data):
-            cluster = self.labels[i]
-            centroid = self.centroids[cluster]
-            distance = euclidean_distance(point, centroid)
-            inertia += distance ** 2
+        index = np.arange(len(cluster_sums))
+        own = own_cluster[block_rows]
+        own_sizes = sizes[own]
         
-        return inertia
+        # a: mean distance to the OTHER points of the own cluster
+        a = np.where(own_sizes > 1,
+                     cluster_sums[index, own] / np.maximum(own_sizes - 1, 1), 0.0)
+        
+        # b: smallest mean distance to any other cluster
+        mean_distances = cluster_sums / sizes
+        mean_distances[index, own] = np.inf
+        b = mean_distances.min(axis=1)
+        
+        largest = np.maximum(a, b)
+        values[start:start + len(block_rows)] = np.where(
+            largest > 0, (b - a) / np.where(largest > 0, largest, 1), 0.0)
     
-    def predict(self, data):
-        """
-        Predict cluster labels for new data.
+    return values
+
+
+def sampled_silhouette_score(data, labels, sample_size=1000, confidence=0.95, random_state=0):
+    """
+    Estimate the silhouette score from a stratified sample of points.
+    
+    Why sample?
+    -----------
+    The exact score needs ALL n² distances. For model selection we only
+    need to know it to ±0.01 or so - and a few thousand points give that.
+    
+    How it works:
+    -------------
+    1. Stratify: sample from every cluster in proportion to its size
+       (small clusters are never missed by bad luck)
+    2. Score each sampled point EXACTLY against all n points: O(m·n)
+    3. Combine the per-cluster means, weighted by cluster size, and get a
+       confidence interval from the per-cluster variances
+    
+    Parameters:
+    -----------
+    data : list of lists (or 2D array)
+        Data points
+    labels : list or array of int
+        Cluster of each point
+    sample_size : int
+        Total number of points to score
+    confidence : float
+        Confidence level of the interval (e.g. 0.95)
+    random_state : int
+        Random seed for the sample
         
-        Parameters:
-        -----------
-        data : list of lists
-            New data points to classify
-            
-        Returns:
-        --------
-        list of int
-            Cluster label for each point
-        """
-        if self.centroids is None:
-            raise ValueError("Model not fitted yet! Call fit() first.")
+    Returns:
+    --------
+    tuple of (float, (float, float))
+        Estimated silhouette score and its confidence interval
+    """
+    from statistics import NormalDist
+    
+    labels = np.asarray(labels)
+    n = len(labels)
+    rng = np.random.default_rng(random_state)
+    clusters, sizes = np.unique(labels, return_counts=True)
+    
+    # Proportional allocation, at least 2 per cluster (to get a variance)
+    allocation = np.minimum(sizes, np.maximum(2, np.round(sample_size * sizes / n).astype(int)))
+    sampled_rows = [rng.choice(np.flatnonzero(labels == cluster), size=count, replace=False)
+                    for cluster, count in zip(clusters, allocation)]
+    values = silhouette_values_numpy(data, labels, rows=np.concatenate(sampled_rows))
+    
+    # Stratified mean and its standard error
+    weights = sizes / n
+    estimate, variance = 0.0, 0.0
+    start = 0
+    for weight, count, size in zip(weights, allocation, sizes):
+        stratum = values[start:start + count]
+        start += count
+        estimate += weight * stratum.mean()
+        if count > 1:
+            # Finite population correction: sampling a whole cluster = no error
+            variance += weight ** 2 * stratum.var(ddof=1) / count * (1 - count / size)
+    
+    margin = NormalDist().inv_cdf(0.5 + confidence / 2) * variance ** 0.5
+    return float(estimate), (float(estimate - margin), float(estimate + margin))
+
+
+def simplified_silhouette_score(data, labels, centroids):
+    """
+    Simplified silhouette: compare distances to CENTROIDS instead of points.
+    
+    The Shortcut:
+    -------------
+    - a = distance to the own centroid
+    - b = distance to the nearest OTHER centroid
+    - s = (b - a) / max(a, b)
+    Only n × k distances instead of n × n: O(n·k), seconds for millions
+    of points. For compact, K-Means-shaped clusters it ranks K values very
+    much like the exact score.
+    
+    Parameters:
+    -----------
+    data : list of lists (or 2D array)
+        Data points
+    labels : list or array of int
+        Cluster of each point
+    centroids : list of lists (or 2D array)
+        Cluster centers
         
-        labels = []
-        for point in data:
-            distances = [euclidean_distance(point, centroid) 
-                        for centroid in self.centroids]
-            labels.append(distances.index(min(distances)))
+    Returns:
+    --------
+    float
+        Average simplified silhouette score
+    """
+    X = np.asarray(data, dtype=float)
+    labels = np.asarray(labels)
+    centroids = np.asarray(centroids, dtype=float)
+    if len(centroids) < 2:
+        return 0.0
+    
+    total = 0.0
+    chunk_size = max(1, 4_000_000 // len(centroids))
+    for start in range(0, len(X), chunk_size):
+        block = slice(start, start + chunk_size)
+        distances = np.sqrt(squared_distances_numpy(X[block], centroids))
+        index = np.arange(len(distances))
         
-        return labels
+        a = distances[index, labels[block]].copy()
+        distances[index, labels[block]] = np.inf
+        b = distances.min(axis=1)
+        
+        largest = np.maximum(a, b)
+        total += np.where(largest > 0, (b - a) / np.where(largest > 0, largest, 1), 0.0).sum()
+    
+    return total / len(X)
 
 
-# =============================================================================
-# TEST THE IMPLEMENTATION
-# =============================================================================
+def estimate_silhouette(data, labels, centroids, method='exact', **options):
+    """
+    Silhouette score by the chosen method - handy for sweeps over K.
+    
+    method:
+    -------
+    - 'exact':      calculate_silhouette_score_numpy (O(n²), blocked)
+    - 'sampled':    sampled_silhouette_score (estimate, O(m·n))
+    - 'simplified': simplified_silhouette_score (O(n·k))
+    """
+    if method == 'exact':
+        return calculate_silhouette_score_numpy(data, labels, **options)
+    if method == 'sampled':
+        estimate, _ = sampled_silhouette_score(data, labels, **options)
+        return estimate
+    if method == 'simplified':
+        return simplified_silhouette_score(data, labels, centroids)
+    raise ValueError(f"Unknown silhouette method: {method!r}")
 
-print("=" * 80)
-print("TESTING K-MEANS FROM SCRATCH")
-print("=" * 80)
-print()
 
-# Create simple 2D dataset with clear clusters
-print("📊 Creating synthetic dataset with 3 clusters...")
+# Calculate silhouette scores for different K
+print("🔍 Calculating silhouette scores...")
 print()
 
-# Cluster 1: Points around (2, 2)
-cluster1 = [[2 + random.gauss(0, 0.5), 2 + random.gauss(0, 0.5)] 
-            for _ in range(30)]
+silhouette_scores = []
 
-# Cluster 2: Points around (8, 3)
-cluster2 = [[8 + random.gauss(0, 0.5), 3 + random.gauss(0, 0.5)] 
-            for _ in range(30)]
+# For large data switch to 'sampled' or 'simplified' (see estimate_silhouette)
+silhouette_method = 'exact'
 
-# Cluster 3: Points around (5, 8)
-cluster3 = [[5 + random.gauss(0, 0.5), 8 + random.gauss(0, 0.5)] 
-            for _ in range(30)]
+for k in range(2, 7):  # Start from 2 (need at least 2 clusters)
+    kmeans_test = KMeansFromScratch(k=k, max_iterations=50, random_state=42)
+    kmeans_test.fit(data)
+    score = estimate_silhouette(data, kmeans_test.labels, kmeans_test.centroids,
+                                method=silhouette_method)
+    silhouette_scores.append(score)
+    print(f"K={k}: Silhouette Score={score:.3f}")
 
-# Combine all data
-data = cluster1 + cluster2 + cluster3
+print()
 
-# True labels (for comparison)
-true_labels = [0] * 30 + [1] * 30 + [2] * 30
+# Plot silhouette scores
+plt.figure(figsize=(10, 6))
+plt.plot(range(2, 7), silhouette_scores, 'go-', linewidth=2, markersize=8)
+plt.xlabel('Number of Clusters (K)', fontsize=12)
+plt.ylabel('Silhouette Score', fontsize=12)
+plt.title('Silhouette Analysis: Cluster Quality', fontsize=14)
+plt.grid(True, alpha=0.3)
+plt.axhline(y=0, color='red', linestyle='--', alpha=0.5)
+plt.show()
 
-print(f"✓ Created {len(data)} points in 3 natural clusters")
-print(f"  Cluster 1 (around 2,2): 30 points")
-print(f"  Cluster 2 (around 8,3): 30 points")
-print(f"  Cluster 3 (around 5,8): 30 points")
+print("💡 Interpretation:")
+print("   Higher silhouette score = better clustering")
+print("   K with highest score is often the best choice")
 print()
 
-# Fit K-Means
-kmeans = KMeansFromScratch(k=3, max_iterations=50, random_state=42)
-kmeans.fit(data)
 
-# Show results
-print("🎯 Final Centroids:")
-for i, centroid in enumerate(kmeans.centroids):
-    print(f"  Cluster {i}: ({centroid[0]:.2f}, {centroid[1]:.2f})")
-print()
+"""
+================================================================================
+PART F: SCALING K-MEANS TO LARGE DATA
+================================================================================
 
-# Count points in each cluster
-cluster_counts = [0, 0, 0]
-for label in kmeans.labels:
-    cluster_counts[label] += 1
+Why do we need this?
+--------------------
+Problem: Our from-scratch K-Means loops over every (point, centroid) pair
+in Python. Fine for 100 points - painfully slow for a million customers.
 
-print("📊 Cluster Sizes:")
-for i, count in enumerate(cluster_counts):
-    print(f"  Cluster {i}: {count} points")
-print()
+Root cause: Each iteration does n × k × d interpreter steps.
 
+Solution: Keep the SAME algorithm, but change how the work is done:
+- Vectorize: let NumPy compute whole blocks of distances at once
+- Prune: skip distances that provably cannot change any label
+"""
 
-# =============================================================================
-# DEMONSTRATION: STEP-BY-STEP VISUALIZATION
-# =============================================================================
+# Part F measures speed on large data, which takes a while - so it only
+# runs when asked for:  python "Chapter 4.py" --benchmarks
+RUN_BENCHMARKS = __name__ == '__main__' and '--benchmarks' in sys.argv
 
-print("=" * 80)
-print("STEP-BY-STEP: How K-Means Works")
-print("=" * 80)
-print()
+if RUN_BENCHMARKS:
+    print("=" * 80)
+    print("SCALING 1: NUMPY BACKEND vs PURE PYTHON")
+    print("=" * 80)
+    print()
 
-# Create simpler 2D example for clear illustration
-simple_data = [
-    [1, 1], [1.5, 2], [2, 1.5],  # Group 1
-    [8, 8], [8.5, 9], [9, 8.5],  # Group 2
-]
+    # Larger synthetic dataset: 5 blobs in 2D
+    rng = np.random.default_rng(42)
+    blob_centers = np.array([[2, 2], [8, 3], [5, 8], [1, 9], [9, 9]])
+    big_data = np.vstack([center + rng.normal(0, 0.7, size=(1000, 2))
+                          for center in blob_centers])
 
-print("📊 Simple dataset with 6 points:")
-for i, point in enumerate(simple_data):
-    print(f"  Point {i+1}: {point}")
-print()
+    print(f"📊 Dataset: {len(big_data)} points, {big_data.shape[1]} dimensions")
+    print()
 
-# Run K-Means with k=2
-simple_kmeans = KMeansFromScratch(k=2, max_iterations=10, random_state=42)
-simple_kmeans.fit(simple_data)
+    start = time.time()
+    python_kmeans = KMeansFromScratch(k=5, max_iterations=50, random_state=0, backend='python')
+    python_kmeans.fit(big_data.tolist())
+    time_python = time.time() - start
 
-print("🔍 Let's trace through the first few iterations:")
-print()
+    start = time.time()
+    numpy_kmeans = KMeansFromScratch(k=5, max_iterations=50, random_state=0, backend='numpy')
+    numpy_kmeans.fit(big_data)
+    time_numpy = time.time() - start
 
-for iter_num in range(min(4, len(simple_kmeans.history))):
-    state = simple_kmeans.history[iter_num]
-    
-    if iter_num == 0:
-        print(f"INITIALIZATION:")
-        print(f"  Initial centroids (randomly chosen from data):")
-        for i, cent in enumerate(state['centroids']):
-            print(f"    Centroid {i}: ({cent[0]:.2f}, {cent[1]:.2f})")
-    else:
-        print(f"\nITERATION {iter_num}:")
-        print(f"  Current centroids:")
-        for i, cent in enumerate(state['centroids']):
-            print(f"    Centroid {i}: ({cent[0]:.2f}, {cent[1]:.2f})")
+    same_labels = np.array_equal(np.array(python_kmeans.labels), numpy_kmeans.labels)
+
+    print(f"⏱️  Python backend: {time_python*1000:.1f} ms")
+    print(f"⏱️  NumPy backend:  {time_numpy*1000:.1f} ms")
+    print(f"   Speedup: {time_python / time_numpy:.1f}x faster with NumPy")
+    print(f"   Same labels from both backends? {same_labels}")
+    print()
+
+    print("💡 Why is NumPy faster?")
+    print("   - ‖x - c‖² = ‖x‖² - 2x·c + ‖c‖² turns n × k distances into ONE matrix multiply")
+    print("   - ‖x‖² is computed once per fit, not once per iteration")
+    print("   - Labels come from a single argmin over the distance block")
+    print()
+
+
+    print("=" * 80)
+    print("SCALING 2: ELKAN'S ALGORITHM (Triangle Inequality Pruning)")
+    print("=" * 80)
+    print()
+
+    print("""
+Problem:
+--------
+After the first few iterations, most points never change cluster.
+Yet Lloyd's algorithm still computes ALL n × k distances every iteration!
+
+Elkan's Trick:
+--------------
+If the other centroid c is far from my centroid a (d(a, c) ≥ 2·d(x, a)),
+the triangle inequality guarantees c can't be closer - skip d(x, c)!
+Bounds on each distance are kept between iterations to make this cheap.
+""")
+
+    # Many small clusters - typical of a 50-segment customer job
+    segment_centers = rng.uniform(0, 100, size=(50, 2))
+    segment_data = np.vstack([center + rng.normal(0, 1.5, size=(400, 2))
+                              for center in segment_centers])
+
+    results = {}
+    for algorithm in ('lloyd', 'elkan'):
+        start = time.time()
+        model = KMeansFromScratch(k=50, max_iterations=100, random_state=0,
+                                  backend='numpy', algorithm=algorithm)
+        model.fit(segment_data)
+        results[algorithm] = (model, time.time() - start)
+
+    lloyd_model, time_lloyd = results['lloyd']
+    elkan_model, time_elkan = results['elkan']
+
+    print(f"📊 Dataset: {len(segment_data)} points, k=50")
+    print(f"   Lloyd distance evaluations: {lloyd_model.n_distance_evaluations:,} ({time_lloyd*1000:.0f} ms)")
+    print(f"   Elkan distance evaluations: {elkan_model.n_distance_evaluations:,} ({time_elkan*1000:.0f} ms)")
+    print(f"   Skipped: {1 - elkan_model.n_distance_evaluations / lloyd_model.n_distance_evaluations:.1%}")
+    print(f"   Same labels? {np.array_equal(lloyd_model.labels, elkan_model.labels)}")
+    print()
+
+
+    print("=" * 80)
+    print("SCALING 3: HAMERLY'S ALGORITHM (One Bound Per Point)")
+    print("=" * 80)
+    print()
+
+    print("""
+Problem:
+--------
+Elkan keeps k lower bounds per point: n × k floats of extra memory.
+For 5 million customers and k=100 that's 4 GB just for bounds!
+
+Hamerly's Trick:
+----------------
+Keep ONE lower bound per point: the distance to the second-closest
+centroid. Extra memory drops to O(n), and in low dimensions (like our
+[income, spending] data) it prunes almost as well as Elkan.
+""")
+
+    # Customer segmentation at scale: [Annual Income (k$), Spending Score]
+    segment_means = np.array([[30, 35], [35, 75], [75, 30], [75, 75],
+                              [55, 50], [20, 90], [95, 15], [95, 90]])
+    big_customers = np.vstack([mean + rng.normal(0, [5, 8], size=(6000, 2))
+                               for mean in segment_means])
+
+    print(f"📊 Customers: {len(big_customers)}, k=8")
+    print()
+
+    results = {}
+    for algorithm in ('lloyd', 'elkan', 'hamerly'):
+        start = time.time()
+        model = KMeansFromScratch(k=8, max_iterations=100, random_state=0,
+                                  backend='numpy', algorithm=algorithm)
+        model.fit(big_customers)
+        elapsed = time.time() - start
         
-        print(f"  Point assignments:")
-        if state['labels']:
-            for i, (point, label) in enumerate(zip(simple_data, state['labels'])):
-                print(f"    Point {i+1} {point} → Cluster {label}")
-    
+        # Extra memory spent on bounds (Lloyd keeps none)
+        bound_floats = 0
+        if model._upper_bounds is not None:
+            bound_floats = model._upper_bounds.size + model._lower_bounds.size
+        
+        results[algorithm] = (model, elapsed, bound_floats)
+
+    for algorithm, (model, elapsed, bound_floats) in results.items():
+        print(f"   {algorithm:8s} distances: {model.n_distance_evaluations:>10,}  "
+              f"bounds: {bound_floats * 8 / 1024:>7.0f} KB  time: {elapsed*1000:.0f} ms")
+
+    print(f"   Same labels (Lloyd vs Hamerly)? "
+          f"{np.array_equal(results['lloyd'][0].labels, results['hamerly'][0].labels)}")
     print()
 
 
-"""
-================================================================================
-PART B: IMPLEMENTATION WITH SCIKIT-LEARN
-================================================================================
+    print("=" * 80)
+    print("SCALING 4: MINI-BATCH K-MEANS (Streaming Data)")
+    print("=" * 80)
+    print()
 
-Why use Scikit-learn?
----------------------
-- Highly optimized (faster)
-- Battle-tested (reliable)
-- More features (K-Means++, Mini-Batch K-Means, etc.)
-- Industry standard
+    print("""
+Problem:
+--------
+fit() needs ALL the data in memory and rescans all of it every iteration.
+What if tens of millions of rows arrive in chunks?
+
+Mini-Batch Solution:
+--------------------
+1. Take a small random batch (e.g. 1024 points)
+2. Assign the batch to the nearest centroids
+3. Move each centroid toward its batch points, with a learning rate
+   of (new points) / (all points it has seen so far)
+4. Repeat - memory depends on the batch size, not the dataset size!
+""")
 
-Our implementation is for LEARNING.
-Scikit-learn is for PRODUCTION.
-"""
+    # 1) Mini-batch fit vs full Lloyd fit on the same customers
+    start = time.time()
+    full_model = KMeansFromScratch(k=8, random_state=0, backend='numpy')
+    full_model.fit(big_customers)
+    time_full = time.time() - start
 
-from sklearn.cluster import KMeans
-import numpy as np
+    start = time.time()
+    minibatch_model = KMeansFromScratch(k=8, max_iterations=100, random_state=0,
+                                        backend='numpy', batch_size=1024)
+    minibatch_model.fit(big_customers)
+    time_minibatch = time.time() - start
 
-print("=" * 80)
-print("K-MEANS WITH SCIKIT-LEARN")
-print("=" * 80)
-print()
+    full_inertia = full_model.inertia
+    minibatch_inertia = minibatch_model.inertia
 
-# Convert our data to numpy array (sklearn expects numpy)
-data_np = np.array(data)
+    print(f"   Full Lloyd: inertia={full_inertia:,.0f}  time={time_full*1000:.0f} ms")
+    print(f"   Mini-batch: inertia={minibatch_inertia:,.0f}  time={time_minibatch*1000:.0f} ms")
+    print(f"   Inertia cost of mini-batches: {minibatch_inertia / full_inertia - 1:+.2%}")
+    print()
 
-# Fit K-Means using sklearn
-sklearn_kmeans = KMeans(n_clusters=3, random_state=42, n_init=10)
-sklearn_kmeans.fit(data_np)
+    # 2) Streaming: chunks arrive one at a time and are discarded after use
+    stream_model = KMeansFromScratch(k=8, random_state=0, backend='numpy', batch_size=1024)
+    n_chunks, chunk_size = 20, 10000
+
+    for chunk_id in range(n_chunks):
+        chunk_segments = rng.integers(0, len(segment_means), size=chunk_size)
+        chunk = segment_means[chunk_segments] + rng.normal(0, [5, 8], size=(chunk_size, 2))
+        stream_model.partial_fit(chunk)
+
+    print(f"📡 Streamed {n_chunks} chunks × {chunk_size} rows = {n_chunks * chunk_size:,} rows")
+    print(f"   Largest array ever held: one chunk ({chunk_size} × 2)")
+    print("   Learned centroids vs true segment means:")
+    for centroid in sorted(stream_model.centroids.tolist()):
+        nearest_mean = min(segment_means.tolist(), key=lambda m: euclidean_distance(m, centroid))
+        print(f"     ({centroid[0]:5.1f}, {centroid[1]:5.1f})  ←  true ({nearest_mean[0]}, {nearest_mean[1]})")
+    print()
 
-print(f"✅ Sklearn K-Means fitted successfully")
-print()
 
-print("🎯 Sklearn Centroids:")
-for i, centroid in enumerate(sklearn_kmeans.cluster_centers_):
-    print(f"  Cluster {i}: ({centroid[0]:.2f}, {centroid[1]:.2f})")
-print()
+    print("=" * 80)
+    print("SCALING 5: SMARTER SEEDS (K-Means++ and K-Means||)")
+    print("=" * 80)
+    print()
 
-print("📊 Sklearn Cluster Sizes:")
-unique, counts = np.unique(sklearn_kmeans.labels_, return_counts=True)
-for cluster, count in zip(unique, counts):
-    print(f"  Cluster {cluster}: {count} points")
-print()
+    print("""
+Problem:
+--------
+Random seeds often put two centroids in one cluster and none in another.
+K-Means then needs many more iterations - or gets stuck for good.
 
-print(f"📉 Sklearn Inertia: {sklearn_kmeans.inertia_:.2f}")
-print()
+Solution:
+---------
+- K-Means++: pick each new seed with probability ∝ D(x)², the squared
+  distance to the nearest seed so far → seeds spread over the data
+- K-Means||: same idea, but samples many seeds per pass → only a few
+  passes over the data even for large k
+""")
+
+    seed_data = segment_data[::2]  # 200 points per segment is plenty here
+    print(f"📊 Dataset: {len(seed_data)} points, k=50")
+    print()
+
+    # One seed proves nothing - compare each strategy over a few seeds
+    init_results = {}
+    for init in ('random', 'k-means++', 'k-means||'):
+        iterations, inertias = [], []
+        start = time.time()
+        for seed in range(3):
+            model = KMeansFromScratch(k=50, max_iterations=100, random_state=seed,
+                                      backend='numpy', init=init)
+            model.fit(seed_data)
+            iterations.append(model.n_iterations)
+            inertias.append(model.inertia)
+        init_results[init] = (iterations, sum(inertias) / len(inertias),
+                              (time.time() - start) / len(iterations))
+
+    for init, (iterations, mean_inertia, mean_time) in init_results.items():
+        print(f"   {init:10s} iterations: {str(iterations):14s} mean inertia: {mean_inertia:>10,.0f}  "
+              f"mean fit time: {mean_time*1000:.0f} ms")
+    print()
+
+    print("💡 Better seeds → a much lower final inertia from a single run,")
+    print("   so far fewer restarts are needed to find a good solution")
+    print("   (n_iterations shows what each seeding costs in Lloyd iterations)")
+    print()
+
+
+    print("=" * 80)
+    print("SCALING 6: PARALLEL RESTARTS (n_init, n_jobs)")
+    print("=" * 80)
+    print()
+
+    print("""
+Problem:
+--------
+K-Means is sensitive to its initial centroids - "run it multiple times!"
+But running restarts one after another multiplies the fit time.
+
+Solution:
+---------
+Restarts are independent, so run them in parallel worker processes:
+- Each restart gets its own reproducible seed derived from random_state
+- Workers inherit the data when they are forked (no pickling per task)
+- Only the lowest-inertia restart is kept
+""")
 
-# Compare with our implementation
-print("=" * 80)
-print("COMPARISON: Our Implementation vs Sklearn")
-print("=" * 80)
-print()
+    restart_times = {}
+    for n_jobs in (1, -1):
+        start = time.time()
+        restart_model = KMeansFromScratch(k=50, max_iterations=100, random_state=0,
+                                          backend='numpy', init='k-means++',
+                                          n_init=4, n_jobs=n_jobs)
+        restart_model.fit(seed_data)
+        restart_times[n_jobs] = time.time() - start
+
+    print(f"🖥️  CPUs available: {multiprocessing.cpu_count()}")
+    print(f"   4 restarts, serial:   {restart_times[1]*1000:.0f} ms")
+    print(f"   4 restarts, parallel: {restart_times[-1]*1000:.0f} ms")
+    print(f"   Inertia of each restart: {[round(i) for i in restart_model.restart_inertias]}")
+    print(f"   Kept: {min(restart_model.restart_inertias):,.0f}")
+    print()
 
-our_inertia = kmeans._calculate_inertia(data)
-sklearn_inertia = sklearn_kmeans.inertia_
 
-print(f"Our Inertia:     {our_inertia:.2f}")
-print(f"Sklearn Inertia: {sklearn_inertia:.2f}")
-print(f"Difference:      {abs(our_inertia - sklearn_inertia):.2f}")
-print()
+    print("=" * 80)
+    print("SCALING 7: FAST PREDICTION WITH A KD-TREE")
+    print("=" * 80)
+    print()
 
-print("💡 Note: Small differences are expected because:")
-print("   - Different random initializations")
-print("   - Sklearn uses K-Means++ (smarter initialization)")
-print("   - Sklearn is more numerically precise")
-print()
+    print("""
+Problem:
+--------
+fit() runs once, but predict() runs for EVERY new customer.
+Brute force compares each point with all k centroids: O(k) per point.
 
+Solution:
+---------
+Build a KD-tree over the centroids once after fitting. Each query then
+descends to the region containing the point and skips most centroids.
+""")
 
-"""
-================================================================================
-PART C: VISUALIZATION (Using Matplotlib)
-================================================================================
-"""
+    query_points = rng.uniform(0, 100, size=(10000, 2))
 
-import matplotlib.pyplot as plt
+    print(f"⏱️  Nearest-centroid queries for {len(query_points):,} points (2D):")
+    print(f"   {'k':>5s}  {'brute force':>12s}  {'KD-tree':>9s}  {'speedup':>8s}  "
+          f"{'distances/point':>15s}  same labels?")
 
-def plot_kmeans_result(data, labels, centroids, title="K-Means Clustering"):
-    """
-    Visualize K-Means clustering results.
-    
-    Parameters:
-    -----------
-    data : list or array
-        Data points (2D for visualization)
-    labels : list or array
-        Cluster assignments
-    centroids : list or array
-        Cluster centers
-    title : str
-        Plot title
-    """
-    # Convert to numpy for easier indexing
-    data_np = np.array(data)
-    centroids_np = np.array(centroids)
-    labels_np = np.array(labels)
-    
-    plt.figure(figsize=(10, 8))
-    
-    # Plot each cluster with different color
-    colors = ['red', 'blue', 'green', 'orange', 'purple']
-    
-    for cluster_id in range(len(centroids)):
-        # Get points in this cluster
-        cluster_points = data_np[labels_np == cluster_id]
+    for k in (8, 64, 512, 2048):
+        fitted_centroids = rng.uniform(0, 100, size=(k, 2))
         
-        if len(cluster_points) > 0:
-            plt.scatter(cluster_points[:, 0], cluster_points[:, 1], 
-                       c=colors[cluster_id % len(colors)], 
-                       label=f'Cluster {cluster_id}',
-                       alpha=0.6, s=50)
-    
-    # Plot centroids
-    plt.scatter(centroids_np[:, 0], centroids_np[:, 1], 
-               c='black', marker='X', s=200, 
-               label='Centroids', edgecolors='white', linewidths=2)
-    
-    plt.xlabel('Feature 1')
-    plt.ylabel('Feature 2')
-    plt.title(title)
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.show()
+        start = time.time()
+        brute_labels, _ = nearest_centroids_numpy(query_points, fitted_centroids)
+        time_brute = time.time() - start
+        
+        tree = CentroidKDTree(fitted_centroids)  # Built once, outside the timing
+        start = time.time()
+        tree_labels, _ = tree.query(query_points)
+        time_tree = time.time() - start
+        
+        print(f"   {k:>5d}  {time_brute*1000:>9.1f} ms  {time_tree*1000:>6.1f} ms  "
+              f"{time_brute / time_tree:>7.1f}x  {tree.n_distance_evaluations / len(query_points):>15.1f}  "
+              f"{np.array_equal(brute_labels, tree_labels)}")
+    print()
 
+    print("💡 The KD-tree pays off once k is large; for small k brute force")
+    print("   (one matrix multiply) is already as fast as it gets.")
+    print("   Use it with: KMeansFromScratch(..., predict_index='kdtree')")
+    print()
 
-def plot_kmeans_animation(history, data, title="K-Means Iterations"):
-    """
-    Create subplots showing K-Means iterations.
-    
-    Parameters:
-    -----------
-    history : list of dict
-        History of centroids and labels at each iteration
-    data : list or array
-        Data points
-    title : str
-        Main title
-    """
-    # Show first, middle, and last iterations
-    n_iterations = len(history)
-    indices_to_show = [0, n_iterations // 3, 2 * n_iterations // 3, n_iterations - 1]
-    
-    fig, axes = plt.subplots(2, 2, figsize=(12, 12))
-    axes = axes.flatten()
-    
-    data_np = np.array(data)
-    colors = ['red', 'blue', 'green', 'orange', 'purple']
-    
-    for idx, iter_num in enumerate(indices_to_show):
-        ax = axes[idx]
-        state = history[iter_num]
-        centroids = np.array(state['centroids'])
-        labels = state['labels']
+
+    print("=" * 80)
+    print("SCALING 8: OUT-OF-CORE K-MEANS (Data Bigger Than RAM)")
+    print("=" * 80)
+    print()
+
+    print("""
+Problem:
+--------
+Our segmentation table doesn't fit in memory - but fit() wants a list!
+
+Solution:
+---------
+K-Means only needs per-cluster SUMS and COUNTS to update the centroids.
+So stream the data in fixed-size chunks from disk (memory-mapped .npy):
+   for each chunk: assign → add to sums/counts → forget the chunk
+Memory = one chunk + O(k·d), whatever the dataset size.
+""")
+
+    import tempfile
+    import tracemalloc
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Write a "large" customer table to disk
+        table_path = os.path.join(tmp_dir, 'customers.npy')
+        n_table_rows = 200_000
+        table_segments = rng.integers(0, len(segment_means), size=n_table_rows)
+        table = segment_means[table_segments] + rng.normal(0, [5, 8], size=(n_table_rows, 2))
+        np.save(table_path, table)
+        del table, table_segments
         
-        if labels is None:
-            # Initial state - just show centroids
-            ax.scatter(data_np[:, 0], data_np[:, 1], 
-                      c='gray', alpha=0.5, s=30)
-            ax.scatter(centroids[:, 0], centroids[:, 1], 
-                      c='black', marker='X', s=200, edgecolors='white', linewidths=2)
-            ax.set_title(f'Initialization')
-        else:
-            # Show clusters
-            for cluster_id in range(len(centroids)):
-                cluster_points = data_np[np.array(labels) == cluster_id]
-                if len(cluster_points) > 0:
-                    ax.scatter(cluster_points[:, 0], cluster_points[:, 1], 
-                              c=colors[cluster_id % len(colors)], 
-                              alpha=0.6, s=30)
-            
-            ax.scatter(centroids[:, 0], centroids[:, 1], 
-                      c='black', marker='X', s=200, edgecolors='white', linewidths=2)
-            ax.set_title(f'Iteration {iter_num}')
+        # In-memory fit: load everything first
+        tracemalloc.start()
+        in_memory_model = KMeansFromScratch(k=8, random_state=0, backend='numpy', init='k-means++')
+        in_memory_model.fit(np.load(table_path))
+        _, peak_in_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
         
-        ax.grid(True, alpha=0.3)
-        ax.set_xlabel('Feature 1')
-        ax.set_ylabel('Feature 2')
-    
-    plt.suptitle(title, fontsize=16)
-    plt.tight_layout()
-    plt.show()
-
+        # Out-of-core fit: the path goes straight in, data is streamed
+        tracemalloc.start()
+        streaming_model = KMeansFromScratch(k=8, random_state=0, backend='numpy',
+                                            init='k-means++', chunk_size=20_000)
+        streaming_model.fit(table_path)
+        _, peak_streaming = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        
+        # predict() streams too, writing labels into a memory-mapped file
+        labels_out = np.lib.format.open_memmap(os.path.join(tmp_dir, 'labels.npy'),
+                                               mode='w+', dtype=np.int32, shape=(n_table_rows,))
+        streaming_model.predict(table_path, out=labels_out)
+        segment_sizes = np.bincount(labels_out, minlength=8)
+        del labels_out
+
+    print(f"💾 Table on disk: {n_table_rows:,} rows × 2 features ({n_table_rows * 16 / 1e6:.1f} MB)")
+    print(f"   In-memory fit:   peak memory {peak_in_memory / 1e6:6.1f} MB  inertia {in_memory_model.inertia:,.0f}")
+    print(f"   Out-of-core fit: peak memory {peak_streaming / 1e6:6.1f} MB  inertia {streaming_model.inertia:,.0f}")
+    print(f"   Segment sizes from streamed predict(): {segment_sizes.tolist()}")
+    print()
 
-print("=" * 80)
-print("GENERATING VISUALIZATIONS")
-print("=" * 80)
-print()
 
-print("📊 Creating plots...")
-print("   1. Final clustering result")
-print("   2. K-Means iterations (animation)")
-print()
+    print("=" * 80)
+    print("SCALING 9: FLOAT32 vs FLOAT64 (Memory Bandwidth)")
+    print("=" * 80)
+    print()
 
-# Plot 1: Final result
-plot_kmeans_result(data, kmeans.labels, kmeans.centroids, 
-                   title="Final K-Means Clustering (Our Implementation)")
+    print("""
+Problem:
+--------
+NumPy defaults to float64: 8 bytes per number. For pixel data (values
+0-255, 3 channels) that precision is wasted - and every iteration has to
+stream all those bytes through the CPU.
 
-# Plot 2: Iterations
-plot_kmeans_animation(kmeans.history, data, 
-                     title="K-Means Algorithm: Watch Centroids Move!")
+Solution:
+---------
+Store points, centroids and distances as float32 (4 bytes): half the
+memory traffic. Sums and inertia still add up in float64, so the
+result stays accurate.
+""")
 
+    # A "photo": 200k pixels drawn around 12 dominant colors
+    photo_colors = rng.uniform(0, 255, size=(12, 3))
+    photo_pixels = np.clip(photo_colors[rng.integers(0, 12, size=200_000)]
+                           + rng.normal(0, 12, size=(200_000, 3)), 0, 255)
+
+    dtype_results = {}
+    for dtype in (np.float64, np.float32):
+        pixels = photo_pixels.astype(dtype)
+        start = time.time()
+        model = KMeansFromScratch(k=16, max_iterations=10, random_state=0,
+                                  backend='numpy', dtype=dtype)
+        model.fit(pixels)
+        elapsed = time.time() - start
+        dtype_results[np.dtype(dtype).name] = (elapsed, model.n_iterations, model.inertia, pixels.nbytes)
+
+    print(f"🖼️  {len(photo_pixels):,} pixels, k=16:")
+    for name, (elapsed, n_iterations, inertia, n_bytes) in dtype_results.items():
+        megapixels_per_second = len(photo_pixels) * n_iterations / elapsed / 1e6
+        print(f"   {name}: {n_bytes / 1e6:5.1f} MB of pixels  {elapsed*1000:6.0f} ms  "
+              f"{megapixels_per_second:6.1f} Mpx/s per iteration  inertia {inertia:,.0f}")
+
+    inertia_64 = dtype_results['float64'][2]
+    inertia_32 = dtype_results['float32'][2]
+    print(f"   Inertia difference: {abs(inertia_32 - inertia_64) / inertia_64:.4%}")
+    print()
 
-"""
-================================================================================
-PART D: REAL-WORLD APPLICATIONS
-================================================================================
-"""
 
-print("\n")
-print("=" * 80)
-print("APPLICATION 1: CUSTOMER SEGMENTATION")
-print("=" * 80)
-print()
+    print("=" * 80)
+    print("SCALING 10: FAST ELBOW SWEEPS (Parallel and Warm-Started)")
+    print("=" * 80)
+    print()
 
-print("""
-Business Problem:
------------------
-You have customer data: [Annual Income, Spending Score]
-You want to segment customers into groups for targeted marketing.
+    print("""
+Problem:
+--------
+The elbow method fits K-Means from scratch for EVERY K, one after another.
 
-Question: How many customer segments exist naturally?
+Solution:
+---------
+- Cold sweep in parallel: each K is independent → one worker per K
+- Warm sweep: start K from the (K-1) answer + one K-Means++ draw;
+  the old centroids are already good, so each fit converges quickly
 """)
 
-# Simulated customer data
-# [Annual Income (k$), Spending Score (1-100)]
-np.random.seed(42)
+    sweep_params = dict(max_iterations=100, random_state=0, backend='numpy')
+    sweep_ks = range(2, 13)
+    sweep_customers = big_customers[::4]
+
+    for label, options in (('cold, serial', dict(n_jobs=1)),
+                           ('cold, parallel', dict(n_jobs=-1)),
+                           ('warm-started', dict(warm_start=True))):
+        start = time.time()
+        sweep_result = elbow_sweep(sweep_customers, sweep_ks, **options, **sweep_params)
+        elapsed = time.time() - start
+        print(f"   {label:15s} {elapsed*1000:6.0f} ms  total iterations: "
+              f"{sum(sweep_result['n_iterations']):4d}  elbow at K={sweep_result['elbow_k']}")
+    print()
 
-# Segment 1: Low income, low spending
-seg1 = [[income, score] 
-        for income, score in zip(
-            np.random.normal(30, 5, 25),
-            np.random.normal(35, 10, 25)
-        )]
+    print("💡 The customer data has 8 true segments - compare with the detected elbow.")
+    print()
 
-# Segment 2: Low income, high spending  
-seg2 = [[income, score]
-        for income, score in zip(
-            np.random.normal(35, 5, 25),
-            np.random.normal(75, 10, 25)
-        )]
 
-# Segment 3: High income, low spending
-seg3 = [[income, score]
-        for income, score in zip(
-            np.random.normal(75, 5, 25),
-            np.random.normal(30, 10, 25)
-        )]
+    print("=" * 80)
+    print("SCALING 11: BLOCK-WISE VECTORIZED SILHOUETTE SCORE")
+    print("=" * 80)
+    print()
 
-# Segment 4: High income, high spending
-seg4 = [[income, score]
-        for income, score in zip(
-            np.random.normal(75, 5, 25),
-            np.random.normal(75, 10, 25)
-        )]
+    print("""
+Problem:
+--------
+calculate_silhouette_score rebuilds Python lists of same-cluster and
+other-cluster points for every point: O(n²·k) work - hours at 20k points.
 
-customer_data = seg1 + seg2 + seg3 + seg4
+Solution:
+---------
+Compute distances for a BLOCK of rows at a time, and sum them per cluster
+with one np.add.reduceat over cluster-sorted columns. Memory stays at one
+block - the n × n distance matrix is never built.
+""")
 
-print(f"📊 Customer Data: {len(customer_data)} customers")
-print(f"   Features: [Annual Income (k$), Spending Score (1-100)]")
-print()
+    # Same answer on a small sample...
+    small_points = segment_data[::40]
+    small_model = KMeansFromScratch(k=5, random_state=0, backend='numpy')
+    with contextlib.redirect_stdout(io.StringIO()):
+        small_model.fit(small_points)
 
-# Cluster customers
-customer_kmeans = KMeansFromScratch(k=4, random_state=42)
-customer_kmeans.fit(customer_data)
+    start = time.time()
+    score_loop = calculate_silhouette_score(small_points.tolist(), small_model.labels.tolist(),
+                                            small_model.centroids)
+    time_loop = time.time() - start
 
-# Analyze segments
-print("🎯 Customer Segments Discovered:")
-print()
+    start = time.time()
+    score_blocks = calculate_silhouette_score_numpy(small_points, small_model.labels)
+    time_blocks = time.time() - start
 
-for cluster_id in range(4):
-    cluster_customers = [customer_data[i] for i in range(len(customer_data))
-                        if customer_kmeans.labels[i] == cluster_id]
-    
-    avg_income = sum(c[0] for c in cluster_customers) / len(cluster_customers)
-    avg_spending = sum(c[1] for c in cluster_customers) / len(cluster_customers)
-    
-    print(f"Segment {cluster_id}: {len(cluster_customers)} customers")
-    print(f"  Average Income: ${avg_income:.1f}k")
-    print(f"  Average Spending Score: {avg_spending:.1f}")
-    
-    # Business interpretation
-    if avg_income < 50 and avg_spending < 50:
-        print(f"  💡 Type: Budget-conscious, lower income")
-    elif avg_income < 50 and avg_spending >= 50:
-        print(f"  💡 Type: High spenders despite lower income")
-    elif avg_income >= 50 and avg_spending < 50:
-        print(f"  💡 Type: High income but conservative spenders")
-    else:
-        print(f"  💡 Type: Premium customers - high income, high spending")
+    print(f"📊 {len(small_points)} points, k=5:")
+    print(f"   Python loops: {score_loop:.6f}  ({time_loop*1000:.0f} ms)")
+    print(f"   Blocks:       {score_blocks:.6f}  ({time_blocks*1000:.1f} ms)")
+    print()
+
+    # ...and it scales to sizes the loop version can't touch
+    start = time.time()
+    score_large = calculate_silhouette_score_numpy(segment_data[::2], elkan_model.labels[::2])
+    print(f"📊 {len(segment_data[::2]):,} points, k=50: silhouette = {score_large:.3f} "
+          f"in {(time.time() - start):.1f} s (no {len(segment_data[::2]):,}² matrix needed)")
     print()
 
-# Visualize
-plot_kmeans_result(customer_data, customer_kmeans.labels, customer_kmeans.centroids,
-                   title="Customer Segmentation")
 
+    print("=" * 80)
+    print("SCALING 12: SAMPLED AND SIMPLIFIED SILHOUETTE (Millions of Points)")
+    print("=" * 80)
+    print()
+
+    print("""
+Problem:
+--------
+Even the blocked silhouette needs all n² distances. For choosing K on
+millions of points we don't need the exact value - a good estimate will do.
+
+Two estimators:
+---------------
+- Sampled:    score ~1000 stratified points exactly → estimate ± interval
+- Simplified: use centroids instead of points (a = own centroid,
+              b = nearest other centroid) → O(n·k)
+""")
+
+    silhouette_customers = sweep_customers[::4]
+    print(f"📊 {len(silhouette_customers):,} customers - silhouette for each K:")
+    print(f"   {'K':>3s}  {'exact':>7s}  {'sampled (95% CI)':>26s}  {'simplified':>10s}")
+    timings = {'exact': 0.0, 'sampled': 0.0, 'simplified': 0.0}
 
-print("=" * 80)
-print("APPLICATION 2: IMAGE COMPRESSION")
-print("=" * 80)
-print()
+    for k in range(2, 9):
+        model = KMeansFromScratch(k=k, random_state=0, backend='numpy', init='k-means++')
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.fit(silhouette_customers)
+        
+        start = time.time()
+        exact = calculate_silhouette_score_numpy(silhouette_customers, model.labels)
+        timings['exact'] += time.time() - start
+        
+        start = time.time()
+        sampled, (low, high) = sampled_silhouette_score(silhouette_customers, model.labels)
+        timings['sampled'] += time.time() - start
+        
+        start = time.time()
+        simplified = simplified_silhouette_score(silhouette_customers, model.labels, model.centroids)
+        timings['simplified'] += time.time() - start
+        
+        print(f"   {k:>3d}  {exact:7.3f}  {sampled:7.3f} [{low:.3f}, {high:.3f}]  {simplified:10.3f}")
 
-print("""
+    print()
+    print("⏱️  Total time for the sweep:")
+    for method, elapsed in timings.items():
+        print(f"   {method:10s} {elapsed*1000:7.0f} ms")
+    print()
+
+
+    print("=" * 80)
+    print("SCALING 13: WEIGHTED K-MEANS ON DISTINCT COLORS")
+    print("=" * 80)
+    print()
+
+    print("""
 Problem:
 --------
-Images have millions of colors, but we can approximate them with fewer colors!
-Each pixel is a point in 3D RGB color space: (Red, Green, Blue)
+Color quantization treats every pixel as a point - 12 megapixels means
+12 million points per iteration. But many pixels share the same color!
 
-Strategy:
+Solution:
 ---------
-1. Treat each pixel as a 3D point
-2. Cluster pixels into K color groups
-3. Replace each pixel with its cluster center
-4. Image now uses only K colors!
-
-Example: Reduce 16 million colors → 16 colors
+Collapse the pixels to their distinct colors with counts, then run
+K-Means with sample_weight = count. A color seen 500 times pulls its
+centroid exactly as hard as 500 separate pixels would - same result,
+far fewer points.
 """)
 
-# Simulate image pixels (we'll use a small example)
-# In reality, you'd load actual image data
-print("📸 Simulating image with 100 pixels...")
-print()
+    # An 800 × 600 "photo" with 8-bit colors around 12 dominant tones
+    photo = np.clip(photo_colors[rng.integers(0, 12, size=(600, 800))]
+                    + rng.normal(0, 4, size=(600, 800, 3)), 0, 255).round().astype(np.uint8)
+    print(f"🖼️  Photo: {photo.shape[1]} × {photo.shape[0]} = {photo.shape[0] * photo.shape[1]:,} pixels")
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        all_pixels_model = KMeansFromScratch(k=16, max_iterations=10, random_state=0,
+                                             backend='numpy', init='k-means++')
+        all_pixels_model.fit(photo.reshape(-1, 3).astype(float))
+    all_pixels_time = time.time() - start
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        palette, photo_indices, weighted_model = quantize_colors(
+            photo, 16, max_iterations=10, random_state=0, init='k-means++')
+    weighted_time = time.time() - start
+    n_distinct = len(weighted_model.labels)
+
+    print(f"   Every pixel:     {photo.shape[0] * photo.shape[1]:>9,} points  "
+          f"{all_pixels_time*1000:6.0f} ms  inertia {all_pixels_model.inertia:,.0f}")
+    print(f"   Distinct colors: {n_distinct:>9,} points  "
+          f"{weighted_time*1000:6.0f} ms  inertia {weighted_model.inertia:,.0f}  "
+          f"(incl. deduplication)")
+    print(f"   Quantized image: {photo_indices.shape} array of {photo_indices.dtype} palette indices")
+    print()
 
-# Create "image" with 3 dominant colors plus noise
-red_pixels = [[200 + random.randint(-20, 20), 
-               50 + random.randint(-20, 20), 
-               50 + random.randint(-20, 20)] 
-              for _ in range(40)]
 
-green_pixels = [[50 + random.randint(-20, 20), 
-                 200 + random.randint(-20, 20), 
-                 50 + random.randint(-20, 20)] 
-                for _ in range(30)]
+    print("=" * 80)
+    print("SCALING 14: FULL-RESOLUTION PALETTE QUANTIZER (Real Files)")
+    print("=" * 80)
+    print()
 
-blue_pixels = [[50 + random.randint(-20, 20), 
-                50 + random.randint(-20, 20), 
-                200 + random.randint(-20, 20)] 
-               for _ in range(30)]
+    print("""
+Problem:
+--------
+Application 2 only simulated 100 pixels and a theoretical compression
+ratio. A real photo is a file of millions of RGB bytes.
+
+Solution (quantize_raw_image):
+------------------------------
+- Memory-map the raw RGB file - never load it whole
+- Count distinct colors chunk by chunk, fit the palette on them
+- Map every chunk of pixels to a uint8 palette index and write it out
+""")
 
-image_pixels = red_pixels + green_pixels + blue_pixels
+    # A 2000 × 1500 "photo" (3 megapixels) saved as a raw RGB file
+    raw_photo = np.clip(photo_colors[rng.integers(0, 12, size=(1500, 2000))]
+                        + rng.normal(0, 4, size=(1500, 2000, 3)), 0, 255).round().astype(np.uint8)
 
-print(f"Original: {len(image_pixels)} pixels, each with unique RGB value")
-print(f"Goal: Compress to just 3 colors")
-print()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_path = os.path.join(tmp_dir, 'photo.rgb')
+        indexed_path = os.path.join(tmp_dir, 'photo.idx')
+        raw_photo.tofile(raw_path)
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = quantize_raw_image(raw_path, 2000, 1500, 16, indexed_path,
+                                        max_iterations=10, random_state=0, init='k-means++')
+        
+        # Decode: palette lookup gives back an RGB image
+        decoded = result['palette'][result['indices']]
+        error = np.sqrt(np.mean((decoded.astype(float) - raw_photo) ** 2))
+        
+        print(f"🖼️  2000 × 1500 photo, {result['n_distinct_colors']:,} distinct colors → 16-color palette")
+        print(f"   Bytes read:    {result['bytes_read']:>10,}")
+        print(f"   Bytes written: {result['bytes_written']:>10,} "
+              f"({result['bytes_read'] / result['bytes_written']:.2f}x smaller)")
+        print(f"   Throughput:    {result['megapixels_per_second']:.1f} Mpx/s "
+              f"({result['seconds']*1000:.0f} ms total)")
+        print(f"   RMS color error after decoding: {error:.1f} (of 255)")
+        del decoded, result
+    print()
 
-# Cluster colors
-color_kmeans = KMeansFromScratch(k=3, random_state=42)
-color_kmeans.fit(image_pixels)
 
-print("🎨 Compressed Color Palette (3 colors):")
-for i, color in enumerate(color_kmeans.centroids):
-    r, g, b = int(color[0]), int(color[1]), int(color[2])
-    print(f"  Color {i}: RGB({r}, {g}, {b})")
-print()
+    print("=" * 80)
+    print("SCALING 15: SPHERICAL K-MEANS FOR DOCUMENTS (Cosine Similarity)")
+    print("=" * 80)
+    print()
 
-# Calculate compression ratio
-original_size = len(image_pixels) * 3  # 3 bytes per pixel (RGB)
-compressed_size = 3 * 3 + len(image_pixels) * 1  # 3 colors + 1 byte index per pixel
+    print("""
+Problem:
+--------
+Documents are term-frequency vectors: long, mostly zeros, and of very
+different lengths. Euclidean K-Means groups them by LENGTH, not topic.
 
-print(f"💾 Compression:")
-print(f"  Original size: {original_size} bytes")
-print(f"  Compressed size: {compressed_size} bytes")
-print(f"  Compression ratio: {original_size / compressed_size:.1f}x")
-print()
+Solution (SphericalKMeans):
+---------------------------
+Normalize every document to unit length once. Then cosine similarity is
+just a dot product, and assignment is ONE sparse matrix multiply.
+""")
 
+    from scipy import sparse
+    from sklearn.metrics import adjusted_rand_score
 
-"""
-================================================================================
-PART E: ADVANCED TOPICS
-================================================================================
-"""
+    # The word-frequency documents from Chapter 3 (words: the, cat, dog, sat, mat, ran)
+    chapter3_docs = [[5, 2, 0, 1, 1, 0],   # "The cat sat on the mat"
+                     [3, 2, 0, 1, 0, 0],   # "The cat sat"
+                     [2, 0, 3, 0, 0, 2]]   # "The dog ran"
+    with contextlib.redirect_stdout(io.StringIO()):
+        tiny_model = SphericalKMeans(k=2, random_state=1).fit(chapter3_docs)
+    print(f"📄 Chapter 3 documents → clusters {tiny_model.labels.tolist()} (cat, cat, dog)")
+    print()
 
-print("=" * 80)
-print("ADVANCED TOPIC 1: ELBOW METHOD (Finding Optimal K)")
-print("=" * 80)
-print()
+    # 3,000 documents about 8 topics, 2,000-word vocabulary, 20-600 words each
+    n_topics, vocabulary_size = 8, 2000
+    topic_words = rng.dirichlet(np.full(vocabulary_size, 0.02), size=n_topics)
+    document_topics = rng.integers(0, n_topics, size=3000)
+    document_lengths = rng.integers(20, 600, size=3000)
+    term_frequencies = sparse.csr_matrix(np.array(
+        [rng.multinomial(length, topic_words[topic])
+         for length, topic in zip(document_lengths, document_topics)]))
+    density = term_frequencies.nnz / (term_frequencies.shape[0] * term_frequencies.shape[1])
+    print(f"📚 {term_frequencies.shape[0]:,} documents × {vocabulary_size:,} words "
+          f"({density:.1%} non-zero)")
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        spherical_model = SphericalKMeans(k=n_topics, random_state=0,
+                                          init='k-means++').fit(term_frequencies)
+    spherical_time = time.time() - start
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        euclidean_model = KMeansFromScratch(k=n_topics, random_state=0, backend='numpy',
+                                            init='k-means++').fit(term_frequencies.toarray())
+    euclidean_time = time.time() - start
+
+    print(f"   {'':22s} {'time':>8s}  {'agreement with true topics (ARI)':>34s}")
+    print(f"   {'Euclidean (dense)':22s} {euclidean_time*1000:6.0f} ms  "
+          f"{adjusted_rand_score(document_topics, euclidean_model.labels):34.3f}")
+    print(f"   {'Spherical (sparse)':22s} {spherical_time*1000:6.0f} ms  "
+          f"{adjusted_rand_score(document_topics, spherical_model.labels):34.3f}")
+    print()
 
-print("""
+
+    print("=" * 80)
+    print("SCALING 16: MAP-REDUCE K-MEANS OVER SHARDS (Distributed Fit)")
+    print("=" * 80)
+    print()
+
+    print("""
 Problem:
 --------
-How do we choose K (number of clusters)?
+The data is already split across many files (shards) - in production,
+across many machines. Moving it all to one process is the slow part.
 
-The Elbow Method:
------------------
-1. Try different values of K (e.g., 1 to 10)
-2. Calculate inertia for each K
-3. Plot K vs Inertia
-4. Look for "elbow" - point where adding more clusters doesn't help much
+Solution (fit_shards):
+----------------------
+Move the CENTROIDS to the data instead:
+   broadcast centroids → each worker assigns its shard and returns
+   per-cluster sums + counts + inertia → coordinator adds them up
+Only O(k·d) numbers per shard per iteration cross process boundaries.
 
-Why does it work?
------------------
-- More clusters → Lower inertia (better fit)
-- But too many clusters → Overfitting!
-- Elbow = sweet spot (good fit without overdoing it)
+Scaling efficiency = speedup / workers (1.0 = perfect linear scaling).
 """)
 
-# Test different K values
-k_values = range(1, 11)
-inertias = []
-
-print("🔍 Testing different K values...")
-print()
-
-for k in k_values:
-    kmeans_test = KMeansFromScratch(k=k, max_iterations=50, random_state=42)
-    kmeans_test.fit(data)
-    inertia = kmeans_test._calculate_inertia(data)
-    inertias.append(inertia)
-    print(f"K={k}: Inertia={inertia:.2f}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 4 shards of customer data, 50k rows each
+        shard_rows = 50_000
+        shard_paths = []
+        for shard_id in range(4):
+            shard_segments = rng.integers(0, len(segment_means), size=shard_rows)
+            shard = segment_means[shard_segments] + rng.normal(0, [5, 8], size=(shard_rows, 2))
+            shard_paths.append(os.path.join(tmp_dir, f'customers-{shard_id}.npy'))
+            np.save(shard_paths[-1], shard)
+        del shard, shard_segments
+        
+        worker_counts = sorted({1, 2, min(4, multiprocessing.cpu_count())})
+        shard_timings = {}
+        for n_workers in worker_counts:
+            start = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                sharded_model = KMeansFromScratch(k=8, max_iterations=10, random_state=0,
+                                                  backend='numpy', n_jobs=n_workers)
+                sharded_model.fit_shards(shard_paths)
+            shard_timings[n_workers] = (time.time() - start, sharded_model.inertia)
+
+    print(f"🖥️  {len(shard_paths)} shards × {shard_rows:,} rows, k=8, 10 iterations "
+          f"({multiprocessing.cpu_count()} CPU core(s) on this machine)")
+    print(f"   {'workers':>7s}  {'time':>8s}  {'speedup':>7s}  {'efficiency':>10s}  inertia")
+    serial_time = shard_timings[1][0]
+    for n_workers, (elapsed, inertia) in shard_timings.items():
+        speedup = serial_time / elapsed
+        print(f"   {n_workers:>7d}  {elapsed*1000:6.0f} ms  {speedup:6.2f}x  "
+              f"{speedup / n_workers:10.2f}  {inertia:,.0f}")
+    print()
+    print("   Same inertia for every worker count: the reduce step is exact.")
+    print("   Efficiency drops once workers exceed CPU cores (they just take turns),")
+    print("   and with more workers the fixed per-iteration broadcast cost weighs more.")
+    print()
 
-print()
 
-# Plot elbow curve
-plt.figure(figsize=(10, 6))
-plt.plot(k_values, inertias, 'bo-', linewidth=2, markersize=8)
-plt.xlabel('Number of Clusters (K)', fontsize=12)
-plt.ylabel('Inertia', fontsize=12)
-plt.title('Elbow Method: Finding Optimal K', fontsize=14)
-plt.grid(True, alpha=0.3)
+    print("=" * 80)
+    print("SCALING 17: SMARTER STOPPING AND INCREMENTAL UPDATES")
+    print("=" * 80)
+    print()
 
-# Highlight the "elbow" (K=3 in our case)
-plt.axvline(x=3, color='red', linestyle='--', label='Elbow at K=3')
-plt.legend()
-plt.show()
+    print("""
+Problem:
+--------
+fit() stops only when EVERY centroid moves less than 1e-6. With
+overlapping clusters, a few border points keep flipping for hundreds of
+iterations - the clustering is long finished, but fit() keeps going.
+And each of those iterations re-adds all n points to update the centroids.
+
+Solutions:
+----------
+- max_label_changes: stop when at most this many points changed cluster
+- relative_tol: measure tol relative to the data's spread, not in units
+- incremental_update: sums -= moved points' old clusters, += new ones
+  → the update costs O(moved points), not O(n)
+""")
 
-print("💡 Interpretation:")
-print("   The 'elbow' is around K=3")
-print("   After K=3, adding more clusters doesn't reduce inertia much")
-print("   This matches our data (we created 3 clusters!)")
-print()
+    overlap_centers = rng.uniform(-50, 50, size=(50, 2))
+    overlap_data = overlap_centers[rng.integers(0, 50, size=20_000)] + rng.normal(0, 4, size=(20_000, 2))
+
+    stopping_rules = [
+        ("tol=1e-6 (default)", {}),
+        ("relative_tol, tol=1e-3", {'relative_tol': True, 'tol': 1e-3}),
+        ("max_label_changes=40", {'max_label_changes': 40}),
+        ("  + incremental_update", {'max_label_changes': 40, 'incremental_update': True}),
+    ]
+    print(f"📊 {len(overlap_data):,} points in 50 overlapping clusters (Hamerly):")
+    print(f"   {'stopping rule':24s} {'iterations':>10s}  {'time':>8s}  {'inertia':>10s}")
+    for name, options in stopping_rules:
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            model = KMeansFromScratch(k=50, max_iterations=500, random_state=1, backend='numpy',
+                                      algorithm='hamerly', **options).fit(overlap_data)
+        elapsed = time.time() - start
+        print(f"   {name:24s} {model.n_iterations:>10d}  {elapsed*1000:6.0f} ms  {model.inertia:10,.0f}")
+    print(f"   Points moved in the last iterations: {model.label_changes[-5:]} (of {len(overlap_data):,})")
+
+    # The update step alone, when 40 points changed cluster
+    moved_points = rng.choice(len(overlap_data), size=40, replace=False)
+    new_labels = model.labels.copy()
+    new_labels[moved_points] = (new_labels[moved_points] + 1) % 50
+
+    start = time.time()
+    for _ in range(100):
+        cluster_sums_numpy(overlap_data, new_labels, 50)
+    full_update_time = (time.time() - start) / 100
+
+    start = time.time()
+    for _ in range(100):
+        cluster_sums_numpy(overlap_data[moved_points], new_labels[moved_points], 50)
+        cluster_sums_numpy(overlap_data[moved_points], model.labels[moved_points], 50)
+    incremental_update_time = (time.time() - start) / 100
+
+    print(f"   Centroid update with 40 moved points: full {full_update_time*1e6:.0f} µs, "
+          f"incremental {incremental_update_time*1e6:.0f} µs")
+    print("   (With Lloyd/Hamerly the assignment step still touches every point -")
+    print("    the incremental update removes the O(n·d) part of each iteration.)")
+    print()
 
 
-print("=" * 80)
-print("ADVANCED TOPIC 2: SILHOUETTE SCORE (Cluster Quality)")
-print("=" * 80)
-print()
+    print("=" * 80)
+    print("SCALING 18: YINYANG K-MEANS (k = 500)")
+    print("=" * 80)
+    print()
 
-print("""
+    print("""
 Problem:
 --------
-Inertia alone doesn't tell us if clusters are well-separated.
+A product catalog with k = 500 clusters:
+- Elkan keeps n × k lower bounds → 10,000 × 500 × 8 bytes = 40 MB
+- Hamerly keeps ONE bound, but any one of 500 centroids moving far
+  loosens it for everybody → it prunes too little
+
+Solution (algorithm='yinyang'):
+-------------------------------
+Group the centroids (~k/10 = 50 groups), keep one lower bound per GROUP.
+Skip whole groups first, then single centroids inside a group.
+""")
 
-Silhouette Score:
------------------
-Measures how similar a point is to its own cluster vs other clusters.
+    catalog_k = 500
+    catalog_centers = rng.uniform(-50, 50, size=(catalog_k, 8))
+    catalog = (catalog_centers[rng.integers(0, catalog_k, size=10_000)]
+               + rng.normal(0, 6, size=(10_000, 8)))
+
+    catalog_results = {}
+    for algorithm in ('lloyd', 'yinyang'):
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            model = KMeansFromScratch(k=catalog_k, max_iterations=15, random_state=0, backend='numpy',
+                                      algorithm=algorithm).fit(catalog)
+        catalog_results[algorithm] = (model, time.time() - start)
+
+    lloyd_model, lloyd_time = catalog_results['lloyd']
+    yinyang_model, yinyang_time = catalog_results['yinyang']
+    n_groups = yinyang_model._lower_bounds.shape[1]
+
+    print(f"📦 Catalog: {len(catalog):,} items × 8 features, k={catalog_k}, {lloyd_model.n_iterations} iterations")
+    print(f"   {'':9s} {'distance evaluations':>21s}  {'time':>8s}")
+    print(f"   {'Lloyd':9s} {lloyd_model.n_distance_evaluations:>21,}  {lloyd_time*1000:6.0f} ms")
+    print(f"   {'Yinyang':9s} {yinyang_model.n_distance_evaluations:>21,}  {yinyang_time*1000:6.0f} ms")
+    print(f"   Same labels: {np.array_equal(lloyd_model.labels, yinyang_model.labels)}")
+    print(f"   Lower-bound memory: Elkan {len(catalog) * catalog_k * 8 / 1e6:.0f} MB, "
+          f"Yinyang ({n_groups} groups) {yinyang_model._lower_bounds.nbytes / 1e6:.0f} MB, "
+          f"Hamerly {len(catalog) * 8 / 1e6:.2f} MB")
+    print()
 
-Formula: s = (b - a) / max(a, b)
-where:
-- a = avg distance to points in same cluster
-- b = avg distance to points in nearest other cluster
 
-Score range: [-1, 1]
-- 1: Perfect clustering
-- 0: Overlapping clusters
-- -1: Wrong cluster assignment
+    print("=" * 80)
+    print("SCALING 19: BISECTING K-MEANS (A Tree of Clusters)")
+    print("=" * 80)
+    print()
+
+    print("""
+Problem:
+--------
+Fine-grained segmentation with k = 128: every iteration of plain K-Means
+measures n × 128 distances, and so does every prediction.
+
+Solution (BisectingKMeans):
+---------------------------
+Split the highest-inertia cluster in two, again and again, each time with
+a 2-means fit on that cluster's points only. The splits form a tree;
+predict() walks it: 2 distances per tree level - 2·log₂(128) = 14 per
+point for a balanced tree, a few more for uneven splits - instead of 128.
 """)
 
-def calculate_silhouette_score(data, labels, centroids):
-    """
-    Calculate average silhouette score for the clustering.
-    
-    Higher score = better defined clusters
-    """
-    n = len(data)
-    silhouette_scores = []
-    
-    for i in range(n):
-        point = data[i]
-        own_cluster = labels[i]
-        
-        # Calculate a: avg distance to points in same cluster
-        same_cluster_points = [data[j] for j in range(n) if labels[j] == own_cluster and j != i]
+    tree_results = {}
+    for name, model in (("Flat K-Means", KMeansFromScratch(k=128, random_state=0, backend='numpy',
+                                                           init='k-means++')),
+                        ("Bisecting", BisectingKMeans(k=128, random_state=0))):
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.fit(sweep_customers)
+        fit_time = time.time() - start
         
-        if len(same_cluster_points) == 0:
-            a = 0
+        start = time.time()
+        predicted = model.predict(big_customers)
+        predict_time = time.time() - start
+        tree_results[name] = (model, fit_time, predict_time, np.bincount(predicted, minlength=128))
+
+    print(f"📊 Fit on {len(sweep_customers):,} customers, predict {len(big_customers):,}, k=128:")
+    print(f"   {'':13s} {'fit':>8s}  {'inertia':>10s}  {'predict':>8s}  {'distances/point':>15s}  segment sizes")
+    for name, (model, fit_time, predict_time, sizes) in tree_results.items():
+        if isinstance(model, BisectingKMeans):
+            per_point = model.n_predict_distance_evaluations / len(big_customers)
         else:
-            a = sum(euclidean_distance(point, p) for p in same_cluster_points) / len(same_cluster_points)
+            per_point = model.k
+        print(f"   {name:13s} {fit_time*1000:6.0f} ms  {model.inertia:10,.0f}  "
+              f"{predict_time*1000:6.1f} ms  {per_point:15.1f}  {sizes.min()}-{sizes.max()}")
+
+    bisecting_model = tree_results["Bisecting"][0]
+    print(f"   Tree: {len(bisecting_model.node_centroids)} nodes, "
+          f"{len(bisecting_model.centroids)} leaves, depth {bisecting_model.tree_depth} "
+          f"(a balanced tree would have depth {int(np.ceil(np.log2(128)))})")
+    print("   The tree gives a higher inertia: each split is final, so points")
+    print("   can't move to a cluster in another branch later.")
+    print()
+
+
+    print("=" * 80)
+    print("SCALING 20: CORESETS (Sweep K Over Huge Tables in Seconds)")
+    print("=" * 80)
+    print()
+
+    print("""
+Problem:
+--------
+An elbow sweep over a 100M-row table = one full K-Means fit per K, each
+dozens of passes over 100M rows. Hours - just to explore.
+
+Solution (lightweight_coreset):
+-------------------------------
+Two streaming passes build a few thousand WEIGHTED points whose K-Means
+cost matches the full table's for ANY centroids (within a proven error).
+Then sweep K on the coreset with sample_weight - and check the error by
+measuring the true cost of each solution in one more pass.
+""")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        n_huge_rows = 500_000
+        huge_path = os.path.join(tmp_dir, 'customers-500k.npy')
+        huge_table = np.lib.format.open_memmap(huge_path, mode='w+', dtype=np.float64,
+                                               shape=(n_huge_rows, 2))
+        for start in range(0, len(huge_table), 125_000):
+            chunk_segments = rng.integers(0, len(segment_means), size=125_000)
+            huge_table[start:start + 125_000] = (segment_means[chunk_segments]
+                                                 + rng.normal(0, [5, 8], size=(125_000, 2)))
+        huge_table.flush()
+        del huge_table
         
-        # Calculate b: avg distance to nearest other cluster
-        b = float('inf')
+        start = time.time()
+        coreset_points, coreset_weights = lightweight_coreset(huge_path, 4000, random_state=0,
+                                                              chunk_size=250_000)
+        coreset_time = time.time() - start
         
-        for cluster_id in range(len(centroids)):
-            if cluster_id == own_cluster:
-                continue
-            
-            other_cluster_points = [data[j] for j in range(n) if labels[j] == cluster_id]
-            
-            if len(other_cluster_points) > 0:
-                avg_dist = sum(euclidean_distance(point, p) for p in other_cluster_points) / len(other_cluster_points)
-                b = min(b, avg_dist)
+        start = time.time()
+        coreset_sweep = elbow_sweep(coreset_points, range(2, 13), sample_weight=coreset_weights,
+                                    backend='numpy', init='k-means++', n_init=3, random_state=0)
+        sweep_time = time.time() - start
         
-        # Calculate silhouette score for this point
-        if max(a, b) == 0:
-            s = 0
-        else:
-            s = (b - a) / max(a, b)
+        # Error check: the SAME centroids, costed on the coreset and on the full table -
+        # for the coreset's own solutions, and for independent ones (SCALING 10's sweep,
+        # which the coreset never saw: centroids fitted ON the coreset flatter it)
+        def coreset_errors(centroid_list):
+            return [kmeans_cost(coreset_points, centroids, sample_weight=coreset_weights)
+                    / kmeans_cost(huge_path, centroids, chunk_size=250_000) - 1
+                    for centroids in centroid_list]
         
-        silhouette_scores.append(s)
-    
-    # Return average
-    return sum(silhouette_scores) / len(silhouette_scores)
+        own_errors = coreset_errors(coreset_sweep['centroids'])
+        independent_errors = coreset_errors(sweep_result['centroids'])
+
+    rows_per_second = 2 * n_huge_rows / coreset_time
+    print(f"💾 Table: {n_huge_rows:,} rows on disk → coreset of {len(coreset_points):,} weighted points")
+    print(f"   Coreset (2 passes): {coreset_time*1000:.0f} ms   Sweep K=2..12 on it: {sweep_time*1000:.0f} ms")
+    print(f"   Coreset cost vs true cost of the same centroids:")
+    print(f"   {'K':>3s}  {'own solution':>12s}  {'independent centroids':>21s}")
+    for k, own_error, independent_error in zip(coreset_sweep['k_values'], own_errors,
+                                               independent_errors):
+        print(f"   {k:>3d}  {own_error:+12.2%}  {independent_error:+21.2%}")
+    print(f"   Elbow from the coreset: K={coreset_sweep['elbow_k']} "
+          f"(sweep on the in-memory sample in SCALING 10: K={sweep_result['elbow_k']})")
+    print(f"   At {rows_per_second / 1e6:.0f}M rows/s, the coreset of a 100M-row table takes "
+          f"~{2 * 100e6 / rows_per_second:.0f} s; the sweep cost doesn't grow at all.")
+    print()
 
 
-# Calculate silhouette scores for different K
-print("🔍 Calculating silhouette scores...")
-print()
+    print("=" * 80)
+    print("SCALING 21: KERNEL K-MEANS WITH NYSTRÖM FEATURES (Non-Spherical Clusters)")
+    print("=" * 80)
+    print()
 
-silhouette_scores = []
+    print("""
+Problem:
+--------
+K-Means only finds round blobs. Two rings (one inside the other) get
+cut in half. Kernel K-Means can separate them, but needs an n × n kernel.
 
-for k in range(2, 7):  # Start from 2 (need at least 2 clusters)
-    kmeans_test = KMeansFromScratch(k=k, max_iterations=50, random_state=42)
-    kmeans_test.fit(data)
-    score = calculate_silhouette_score(data, kmeans_test.labels, kmeans_test.centroids)
-    silhouette_scores.append(score)
-    print(f"K={k}: Silhouette Score={score:.3f}")
+Solution (KernelKMeans):
+------------------------
+Approximate the kernel with m landmarks (Nyström): every point gets m
+features, and plain vectorized K-Means runs on those. Memory O(n·m).
+""")
 
-print()
+    # Two rings: inner radius 1, outer radius 4
+    n_ring = 5_000
+    ring_labels = np.repeat([0, 1], n_ring)
+    ring_angles = rng.uniform(0, 2 * np.pi, size=2 * n_ring)
+    ring_radii = np.where(ring_labels == 0, 1.0, 4.0) + rng.normal(0, 0.3, size=2 * n_ring)
+    rings = np.column_stack([ring_radii * np.cos(ring_angles), ring_radii * np.sin(ring_angles)])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        plain_ring_model = KMeansFromScratch(k=2, random_state=0, backend='numpy',
+                                             init='k-means++').fit(rings)
+
+    print(f"⭕ Two rings, {len(rings):,} points "
+          f"(exact kernel matrix would need {len(rings) ** 2 * 8 / 1e9:.1f} GB):")
+    print(f"   {'method':22s} {'time':>8s}  {'features':>9s}  {'ARI vs true rings':>17s}")
+    print(f"   {'plain K-Means':22s} {'':>8s}  {'':>9s}  "
+          f"{adjusted_rand_score(ring_labels, plain_ring_model.labels):17.3f}")
+    for n_landmarks in (10, 25, 50, 100):
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            kernel_model = KernelKMeans(k=2, n_landmarks=n_landmarks, gamma=0.5, n_init=3,
+                                        random_state=0).fit(rings)
+        elapsed = time.time() - start
+        n_features = kernel_model.feature_projection.shape[1]
+        print(f"   {f'Nyström, m={n_landmarks}':22s} {elapsed*1000:6.0f} ms  "
+              f"{n_features * len(rings) * 8 / 1e6:7.1f} MB  "
+              f"{adjusted_rand_score(ring_labels, kernel_model.labels):17.3f}")
+    print()
 
-# Plot silhouette scores
-plt.figure(figsize=(10, 6))
-plt.plot(range(2, 7), silhouette_scores, 'go-', linewidth=2, markersize=8)
-plt.xlabel('Number of Clusters (K)', fontsize=12)
-plt.ylabel('Silhouette Score', fontsize=12)
-plt.title('Silhouette Analysis: Cluster Quality', fontsize=14)
-plt.grid(True, alpha=0.3)
-plt.axhline(y=0, color='red', linestyle='--', alpha=0.5)
-plt.show()
 
-print("💡 Interpretation:")
-print("   Higher silhouette score = better clustering")
-print("   K with highest score is often the best choice")
-print()
+    print("=" * 80)
+    print("SCALING 22: K-MEDOIDS (PAM / CLARA) WITH CACHED DISTANCE BLOCKS")
+    print("=" * 80)
+    print()
+
+    print("""
+Problem:
+--------
+A centroid is a MEAN: it only suits squared Euclidean distance, and a
+few extreme customers drag it away from everyone else.
+
+Solution (KMedoids):
+--------------------
+Use real customers as centers. PAM swaps medoids with FastPAM
+(all k medoids scored per candidate in one pass), an LRU cache keeps the
+distance blocks between passes, and CLARA runs PAM on samples for large n.
+""")
+
+    # 1. Robustness: one segment (k=1) where 5% of the customers are extreme big spenders
+    segment_customers = big_customers[:1500]  # Rows of the first segment, mean (30, 35)
+    outliers = np.column_stack([rng.uniform(400, 500, size=75), rng.uniform(40, 60, size=75)])
+    contaminated_segment = np.vstack([segment_customers, outliers])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        mean_model = KMeansFromScratch(k=1, random_state=0, backend='numpy').fit(contaminated_segment)
+        medoid_model = KMedoids(k=1, metric='manhattan', random_state=0).fit(contaminated_segment)
+
+    print(f"🧲 One segment (true center {segment_means[0]}) + {len(outliers)} outliers at x≈450:")
+    for name, center in (('mean (K-Means)', mean_model.centroids[0]),
+                         ('medoid (Manhattan)', medoid_model.centroids[0])):
+        print(f"   {name:20s} center = ({center[0]:5.1f}, {center[1]:5.1f})  "
+              f"miss = {np.linalg.norm(center - segment_means[0]):5.1f}")
+    print()
+
+    medoid_customers = big_customers[rng.choice(len(big_customers), size=1000, replace=False)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        medoid_model = KMedoids(k=8, metric='manhattan', random_state=0).fit(medoid_customers)
+
+    # 2. The distance cache: the same n² distances are needed in every swap pass
+    print(f"💾 PAM swap passes on {len(medoid_customers):,} points "
+          f"({medoid_model.n_iterations} swaps):")
+    print(f"   {'cache blocks':>12s} {'time':>8s} {'hits':>6s} {'misses':>7s} {'distances':>12s}")
+    for cache_blocks in (0, 1, 2, medoid_model.cache.n_blocks):
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cached_model = KMedoids(k=8, metric='manhattan', random_state=0,
+                                    cache_blocks=cache_blocks).fit(medoid_customers)
+        elapsed = time.time() - start
+        print(f"   {cache_blocks:12d} {elapsed*1000:6.0f} ms {cached_model.cache.hits:6d} "
+              f"{cached_model.cache.misses:7d} {cached_model.n_distance_evaluations:12,}")
+    print("   (passes alternate their scan direction, so even a partial cache")
+    print("    serves the blocks the previous pass touched last)")
+    print()
+
+    # 3. CLARA: PAM on samples, scored on all 48,000 customers
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.time()
+        clara_model = KMedoids(k=8, metric='manhattan', method='clara', sample_size=500,
+                               n_samples=5, random_state=0).fit(big_customers)
+        clara_time = time.time() - start
+
+    print(f"⚡ CLARA on all {len(big_customers):,} customers: {clara_time*1000:.0f} ms "
+          f"({clara_model.n_distance_evaluations:,} distances; full PAM would need "
+          f"{len(big_customers) ** 2:,} per pass)")
+    clara_misses = np.sqrt(squared_distances_numpy(segment_means, clara_model.centroids)).min(axis=1)
+    print(f"   worst miss of a true segment center: {clara_misses.max():.1f}")
+    print()
+else:
+    print("⏭️  Part F (scaling benchmarks) skipped - run with --benchmarks to see it")
+    print()
 
 
 """
@@ -1019,7 +5639,8 @@ print("""
 ⚠️  LIMITATIONS TO REMEMBER:
 ---------------------------
 - Assumes K is known (we must specify it)
-- Assumes spherical clusters (struggles with complex shapes)
+- Assumes spherical clusters (struggles with complex shapes -
+  see KernelKMeans for a way around it)
 - Sensitive to outliers
 - May converge to local optimum
 - Doesn't work well with clusters of different sizes/densities
@@ -0,0 +1,633 @@
+"""
+Checks for the clustering code in Chapter 4.py.
+
+Run with:  python -m pytest "Notes/Linear Algebra/test_chapter_4.py"
+
+Importing the chapter runs its (quick) Part A-E demos; the slow Part F
+benchmarks only run with  python "Chapter 4.py" --benchmarks.
+"""
+
+import contextlib
+import importlib.util
+import io
+import itertools
+import os
+
+os.environ.setdefault('MPLBACKEND', 'Agg')  # The demos draw plots - never open windows
+
+import numpy as np
+import pytest
+
+
+CHAPTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Chapter 4.py')
+
+
+def load_chapter(path):
+    """Import Chapter 4.py (its file name is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location('chapter_4', path)
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+ch4 = load_chapter(CHAPTER_PATH)
+
+
+def quiet_fit(model, *args, **kwargs):
+    """fit() without the progress messages."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return model.fit(*args, **kwargs)
+
+
+def blobs(n=600, k=5, d=2, seed=0):
+    """n points around k random centers."""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10, 10, size=(k, d))
+    return centers[rng.integers(k, size=n)] + rng.normal(size=(n, d))
+
+
+# -----------------------------------------------------------------------------
+# NumPy backend (user-001): same algorithm, same random choices as 'python'
+# -----------------------------------------------------------------------------
+
+def test_squared_distances_numpy_matches_brute_force():
+    X, C = blobs(n=50, seed=1), blobs(n=7, seed=2)
+    expected = [[ch4.squared_euclidean_distance(x, c) for c in C] for x in X]
+    np.testing.assert_allclose(ch4.squared_distances_numpy(X, C), expected, atol=1e-9)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_numpy_backend_matches_python_backend(seed):
+    X = blobs(n=300, k=4, seed=seed)
+    python_model = quiet_fit(ch4.KMeansFromScratch(k=4, random_state=seed), X.tolist())
+    numpy_model = quiet_fit(ch4.KMeansFromScratch(k=4, random_state=seed, backend='numpy'), X)
+
+    np.testing.assert_array_equal(numpy_model.labels, python_model.labels)
+    np.testing.assert_allclose(numpy_model.centroids, python_model.centroids)
+    assert numpy_model.n_iterations == python_model.n_iterations
+    assert numpy_model.inertia == pytest.approx(python_model.inertia)
+
+
+# -----------------------------------------------------------------------------
+# Bounded assignment (user-002/003/021) must match Lloyd exactly
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('algorithm', ['elkan', 'hamerly', 'yinyang'])
+@pytest.mark.parametrize('seed, k, d', [(0, 3, 2), (1, 8, 2), (2, 25, 5), (3, 40, 3)])
+def test_bounded_algorithms_match_lloyd(algorithm, seed, k, d):
+    X = blobs(n=800, k=k, d=d, seed=seed)
+    params = dict(k=k, random_state=seed, backend='numpy', init='k-means++')
+    lloyd = quiet_fit(ch4.KMeansFromScratch(**params), X)
+    bounded = quiet_fit(ch4.KMeansFromScratch(algorithm=algorithm, **params), X)
+
+    np.testing.assert_array_equal(bounded.labels, lloyd.labels)
+    np.testing.assert_allclose(bounded.centroids, lloyd.centroids)
+    assert bounded.n_iterations == lloyd.n_iterations
+    assert bounded.inertia == pytest.approx(lloyd.inertia)
+    assert bounded.n_distance_evaluations <= lloyd.n_distance_evaluations
+
+
+# -----------------------------------------------------------------------------
+# Mini-batch mode and partial_fit (user-004)
+# -----------------------------------------------------------------------------
+
+def test_partial_fit_learns_centers_from_chunks():
+    centers = np.array([[0.0, 0.0], [20.0, 0.0], [0.0, 20.0]])
+    rng = np.random.default_rng(0)
+    model = ch4.KMeansFromScratch(k=3, backend='numpy', init='k-means++', batch_size=100)
+    for _ in range(10):
+        model.partial_fit(centers[rng.integers(3, size=500)] + rng.normal(size=(500, 2)))
+    # Every true center has a learned centroid next to it
+    misses = np.sqrt(ch4.squared_distances_numpy(centers, model.centroids)).min(axis=1)
+    assert misses.max() < 0.3
+
+
+def test_minibatch_fit_is_close_to_full_fit():
+    X = blobs(n=5000, k=6, seed=3)
+    full = quiet_fit(ch4.KMeansFromScratch(k=6, backend='numpy', init='k-means++'), X)
+    minibatch = quiet_fit(ch4.KMeansFromScratch(k=6, backend='numpy', init='k-means++',
+                                                batch_size=500), X)
+    assert minibatch.inertia == pytest.approx(full.inertia, rel=0.05)
+
+
+def test_partial_fit_keeps_fit_labels_and_rejects_short_first_chunk():
+    X = blobs(n=400, seed=10)
+    model = quiet_fit(ch4.KMeansFromScratch(k=3, backend='numpy'), X)
+    labels = model.labels.copy()
+    model.partial_fit(X[:100])
+    np.testing.assert_array_equal(model.labels, labels)
+
+    with pytest.raises(ValueError, match='at least k=3 rows'):
+        ch4.KMeansFromScratch(k=3, backend='numpy').partial_fit(X[:2])
+
+
+# -----------------------------------------------------------------------------
+# Restarts (user-006): keep the best run, count the work of all of them
+# -----------------------------------------------------------------------------
+
+def test_restarts_keep_the_best_run_and_count_every_restart():
+    X = blobs(n=500, k=6, seed=4)
+    model = quiet_fit(ch4.KMeansFromScratch(k=6, n_init=4, random_state=0, backend='numpy',
+                                            record_history=True), X)
+    assert model.inertia == min(model.restart_inertias)
+    assert model.inertia == pytest.approx(((X - model.centroids[model.labels]) ** 2).sum())
+
+    seeds = np.random.SeedSequence(0).generate_state(4)
+    singles = [quiet_fit(ch4.KMeansFromScratch(k=6, random_state=int(seed), backend='numpy'), X)
+               for seed in seeds]
+    assert model.n_distance_evaluations == sum(s.n_distance_evaluations for s in singles)
+    best = singles[int(np.argmin([s.inertia for s in singles]))]
+    assert len(model.history) == best.n_iterations + 1 == model.n_iterations + 1  # + initial snapshot
+
+
+# -----------------------------------------------------------------------------
+# Reported inertia (user-008): final labels against the FINAL centroids
+# -----------------------------------------------------------------------------
+
+def test_inertia_is_post_update_for_every_algorithm():
+    X = blobs(n=2000, k=8, seed=0)
+    inertias = {}
+    for algorithm in ch4.KMeansFromScratch.ALGORITHMS:
+        model = quiet_fit(ch4.KMeansFromScratch(k=8, max_iterations=3, random_state=0,
+                                                backend='numpy', algorithm=algorithm), X)
+        expected = ((X - model.centroids[model.labels]) ** 2).sum()
+        assert model.inertia == pytest.approx(expected)
+        inertias[algorithm] = model.inertia
+    python_model = quiet_fit(ch4.KMeansFromScratch(k=8, max_iterations=3, random_state=0),
+                             X.tolist())
+    assert python_model.inertia == pytest.approx(inertias['lloyd'])
+    assert len(set(np.round(list(inertias.values()), 6))) == 1
+
+
+# -----------------------------------------------------------------------------
+# KD-tree predict (user-010): same answers as brute force
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('k, d, leaf_size', [(1, 2, 8), (7, 2, 1), (200, 3, 8), (64, 6, 4)])
+def test_centroid_kdtree_matches_brute_force(k, d, leaf_size):
+    rng = np.random.default_rng(k)
+    centroids = rng.normal(size=(k, d))
+    X = rng.normal(scale=1.5, size=(2000, d))
+    tree = ch4.CentroidKDTree(centroids, leaf_size=leaf_size)
+    labels, distances_sq = tree.query(X)
+
+    expected_labels, expected_sq = ch4.nearest_centroids_numpy(X, centroids)
+    np.testing.assert_allclose(distances_sq, expected_sq, atol=1e-9)
+    np.testing.assert_array_equal(labels, expected_labels)
+
+
+def test_kdtree_predict_index_matches_default_predict():
+    X = blobs(n=1500, k=30, d=3, seed=6)
+    brute = quiet_fit(ch4.KMeansFromScratch(k=30, random_state=0, backend='numpy'), X)
+    indexed = quiet_fit(ch4.KMeansFromScratch(k=30, random_state=0, backend='numpy',
+                                              predict_index='kdtree'), X)
+    new_points = blobs(n=500, k=30, d=3, seed=7)
+    np.testing.assert_array_equal(indexed.predict(new_points), brute.predict(new_points))
+
+
+# -----------------------------------------------------------------------------
+# Out-of-core data (user-011): same result as in memory, chunk by chunk
+# -----------------------------------------------------------------------------
+
+def test_out_of_core_fit_and_predict_match_in_memory(tmp_path):
+    X = blobs(n=1000, k=4, seed=8)
+    path = str(tmp_path / 'points.npy')
+    np.save(path, X)
+    init = X[[0, 10, 20, 30]]
+
+    in_memory = quiet_fit(ch4.KMeansFromScratch(k=4, backend='numpy', init=init), X)
+    streamed = quiet_fit(ch4.KMeansFromScratch(k=4, backend='numpy', init=init,
+                                               chunk_size=128), path)
+    np.testing.assert_allclose(streamed.centroids, in_memory.centroids)
+    assert streamed.n_iterations == in_memory.n_iterations
+    assert streamed.inertia == pytest.approx(in_memory.inertia)
+
+    np.testing.assert_array_equal(streamed.predict(path), in_memory.labels)
+    out = np.full(len(X), -1, dtype=np.int32)
+    streamed.predict(iter(np.array_split(X, 7)), out=out)
+    np.testing.assert_array_equal(out, in_memory.labels)
+
+
+def test_python_backend_predicts_out_of_core_input(tmp_path):
+    X = blobs(n=300, k=3, seed=9)
+    path = str(tmp_path / 'points.npy')
+    np.save(path, X)
+    model = quiet_fit(ch4.KMeansFromScratch(k=3, random_state=0), X.tolist())
+
+    np.testing.assert_array_equal(model.predict(path), model.labels)
+    np.testing.assert_array_equal(model.predict(iter(np.array_split(X, 4))), model.labels)
+
+
+# -----------------------------------------------------------------------------
+# float32 mode (user-012): half the bytes, (almost) the same clustering
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('algorithm', ['lloyd', 'elkan', 'hamerly', 'yinyang'])
+def test_float32_matches_float64(algorithm):
+    X = blobs(n=2000, k=6, d=3, seed=11) * 20 + 128  # pixel-like values
+    params = dict(k=6, random_state=0, backend='numpy', init='k-means++', algorithm=algorithm)
+    model_64 = quiet_fit(ch4.KMeansFromScratch(**params), X)
+    model_32 = quiet_fit(ch4.KMeansFromScratch(dtype=np.float32, **params), X.astype(np.float32))
+
+    assert model_32.centroids.dtype == np.float32
+    assert isinstance(model_32.inertia, float)
+    assert model_32.inertia == pytest.approx(model_64.inertia, rel=1e-4)
+    np.testing.assert_allclose(model_32.centroids, model_64.centroids, rtol=1e-4)
+    assert (model_32.labels == model_64.labels).mean() > 0.999
+
+
+# -----------------------------------------------------------------------------
+# Elbow sweeps (user-013): warm starts agree with cold fits
+# -----------------------------------------------------------------------------
+
+def test_find_elbow_on_a_known_curve():
+    k_values = range(1, 11)
+    inertias = [1000, 500, 120, 100, 90, 82, 76, 71, 67, 64]
+    assert ch4.find_elbow(k_values, inertias) == 3
+    assert ch4.find_elbow([2, 3], [10, 5]) == 2
+    assert ch4.find_elbow([1, 2, 3], [5, 5, 5]) == 1  # flat curve: no bend
+
+
+def test_warm_elbow_sweep_matches_cold_sweep():
+    centers = np.array([[0.0, 0.0], [15.0, 0.0], [0.0, 15.0], [15.0, 15.0]])
+    rng = np.random.default_rng(0)
+    X = centers[rng.integers(4, size=1500)] + rng.normal(size=(1500, 2))
+    params = dict(backend='numpy', init='k-means++', random_state=0)
+    cold = ch4.elbow_sweep(X, range(1, 9), **params)
+    warm = ch4.elbow_sweep(X, range(1, 9), warm_start=True, **params)
+
+    assert cold['elbow_k'] == warm['elbow_k'] == 4
+    assert warm['inertias'][3] == pytest.approx(cold['inertias'][3])
+    # Warm fits may settle in another local optimum, but never a much worse one
+    assert np.all(np.array(warm['inertias']) < 1.5 * np.array(cold['inertias']))
+    assert sum(warm['n_iterations']) < sum(cold['n_iterations'])
+    assert [len(c) for c in warm['centroids']] == list(range(1, 9))
+
+
+# -----------------------------------------------------------------------------
+# Blocked silhouette (user-014): same score as the loop version
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('block_size', [None, 1, 7, 1000])
+def test_blocked_silhouette_matches_loop_version(block_size):
+    X = blobs(n=120, k=4, seed=13)
+    labels = quiet_fit(ch4.KMeansFromScratch(k=4, random_state=0, backend='numpy'), X).labels
+    labels[0] = 4  # a cluster of one point (a = 0 there)
+    centroids = np.zeros((5, 2))  # the loop version only needs len(centroids)
+
+    expected = ch4.calculate_silhouette_score(X.tolist(), labels.tolist(), centroids)
+    assert ch4.calculate_silhouette_score_numpy(X, labels, block_size) == pytest.approx(expected)
+
+    rows = np.array([0, 5, 50, 119])
+    all_values = ch4.silhouette_values_numpy(X, labels)
+    np.testing.assert_allclose(ch4.silhouette_values_numpy(X, labels, rows, block_size),
+                               all_values[rows])
+
+
+# -----------------------------------------------------------------------------
+# Cheap silhouette estimates (user-015)
+# -----------------------------------------------------------------------------
+
+def test_sampled_silhouette_interval_covers_the_exact_score():
+    X = blobs(n=2000, k=5, seed=14)
+    labels = quiet_fit(ch4.KMeansFromScratch(k=5, random_state=0, backend='numpy'), X).labels
+    exact = ch4.calculate_silhouette_score_numpy(X, labels)
+
+    covered = 0
+    for seed in range(100):
+        estimate, (low, high) = ch4.sampled_silhouette_score(X, labels, sample_size=200,
+                                                             random_state=seed)
+        assert low <= estimate <= high
+        covered += low <= exact <= high
+    assert covered >= 88  # nominal 95%
+
+    # Sampling every point is the exact score, with no uncertainty left
+    estimate, (low, high) = ch4.sampled_silhouette_score(X, labels, sample_size=len(X))
+    assert estimate == pytest.approx(exact)
+    assert high - low == pytest.approx(0)
+
+
+def test_simplified_silhouette_uses_own_and_nearest_other_centroid():
+    X = blobs(n=300, k=3, seed=15)
+    model = quiet_fit(ch4.KMeansFromScratch(k=3, random_state=0, backend='numpy'), X)
+    distances = np.sqrt(ch4.squared_distances_numpy(X, model.centroids))
+    a = distances[np.arange(len(X)), model.labels]
+    b = np.sort(distances, axis=1)[:, 1]  # labels are the nearest centroid
+    expected = ((b - a) / np.maximum(a, b)).mean()
+
+    assert ch4.simplified_silhouette_score(X, model.labels, model.centroids) == pytest.approx(expected)
+    assert ch4.simplified_silhouette_score(X, np.zeros(len(X), int), X[:1]) == 0.0
+
+
+# -----------------------------------------------------------------------------
+# Sample weights and color quantization (user-016)
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('algorithm', ['lloyd', 'elkan', 'hamerly', 'yinyang'])
+def test_integer_weights_equal_duplicated_points(algorithm):
+    X = blobs(n=300, k=4, seed=6)
+    weights = np.random.default_rng(6).integers(1, 4, size=len(X))
+    params = dict(k=4, backend='numpy', algorithm=algorithm, init=X[:4])
+    weighted = quiet_fit(ch4.KMeansFromScratch(**params), X, sample_weight=weights)
+    duplicated = quiet_fit(ch4.KMeansFromScratch(**params), np.repeat(X, weights, axis=0))
+
+    np.testing.assert_allclose(weighted.centroids, duplicated.centroids)
+    assert weighted.inertia == pytest.approx(duplicated.inertia)
+
+
+def test_too_few_positive_weights_is_a_clear_error():
+    X = blobs(n=200, seed=7)
+    weights = np.zeros(len(X))
+    weights[:2] = 1
+    with pytest.raises(ValueError, match='positive weight'):
+        quiet_fit(ch4.KMeansFromScratch(k=3, backend='numpy'), X, sample_weight=weights)
+
+
+@pytest.mark.parametrize('pixels', [[[-1, 0, 0]], [[0, 0, 256]], [[0.5, 10, 10]]])
+def test_pack_colors_rejects_invalid_rgb(pixels):
+    with pytest.raises(ValueError, match='RGB'):
+        ch4.pack_colors(pixels)
+
+
+@pytest.mark.parametrize('init', ['random', 'k-means++'])
+def test_quantize_colors_with_fewer_colors_than_palette(init):
+    image = np.zeros((6, 6, 3), dtype=np.uint8)
+    image[:2] = [200, 10, 10]
+    with contextlib.redirect_stdout(io.StringIO()):
+        palette, indices, _ = ch4.quantize_colors(image, 4, init=init)
+    assert palette.shape == (4, 3)
+    np.testing.assert_array_equal(palette[indices], image)
+
+
+# -----------------------------------------------------------------------------
+# Raw-image quantizer (user-017)
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('init', ['random', 'k-means++'])
+def test_quantize_raw_image_with_fewer_colors_than_palette(tmp_path, init):
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    image[:3] = [9, 200, 30]
+    input_path = tmp_path / 'image.rgb'
+    image.tofile(input_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = ch4.quantize_raw_image(str(input_path), 10, 10, 8, str(tmp_path / 'image.idx'),
+                                        init=init)
+    assert result['palette'].shape == (8, 3)
+    np.testing.assert_array_equal(result['palette'][np.asarray(result['indices'])], image)
+
+
+# -----------------------------------------------------------------------------
+# Spherical K-Means (user-018): sparse input gives the dense result
+# -----------------------------------------------------------------------------
+
+def term_counts(n=400, vocabulary=300, topics=4, seed=16):
+    """Bag-of-words counts: each topic uses its own slice of the vocabulary."""
+    rng = np.random.default_rng(seed)
+    counts = np.zeros((n, vocabulary))
+    topic = rng.integers(topics, size=n)
+    words = topic[:, np.newaxis] * (vocabulary // topics) + rng.integers(vocabulary // topics,
+                                                                         size=(n, 12))
+    np.add.at(counts, (np.arange(n)[:, np.newaxis], words), 1)
+    counts[:, :5] += rng.integers(0, 3, size=(n, 5))  # a few shared "stop words"
+    return counts * rng.integers(1, 5, size=(n, 1))   # documents of different lengths
+
+
+def test_spherical_kmeans_sparse_matches_dense():
+    sparse = pytest.importorskip('scipy.sparse')
+    counts = term_counts()
+    weights = np.random.default_rng(17).uniform(0.5, 2, size=len(counts))
+    for sample_weight in (None, weights):
+        dense = quiet_fit(ch4.SphericalKMeans(k=4, init='k-means++'), counts, sample_weight)
+        sparse_model = quiet_fit(ch4.SphericalKMeans(k=4, init='k-means++'),
+                                 sparse.csr_matrix(counts), sample_weight)
+
+        np.testing.assert_array_equal(sparse_model.labels, dense.labels)
+        np.testing.assert_allclose(sparse_model.centroids, dense.centroids, atol=1e-12)
+        assert sparse_model.inertia == pytest.approx(dense.inertia)
+        np.testing.assert_allclose(np.linalg.norm(dense.centroids, axis=1), 1.0)
+
+
+def test_spherical_kmeans_has_no_euclidean_entry_points():
+    assert not hasattr(ch4.SphericalKMeans(), 'partial_fit')
+    assert not hasattr(ch4.SphericalKMeans(), 'fit_shards')
+
+
+# -----------------------------------------------------------------------------
+# Sharded fit (user-019): map-reduce over .npy shards = in-memory Lloyd
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_fit_shards_matches_in_memory_lloyd(tmp_path, dtype):
+    X = blobs(n=900, k=4, seed=5)
+    paths = []
+    for shard_id, shard in enumerate(np.array_split(X, 3)):
+        paths.append(str(tmp_path / f'shard-{shard_id}.npy'))
+        np.save(paths[-1], shard)
+
+    params = dict(k=4, backend='numpy', init=X[[0, 1, 2, 3]], dtype=dtype)
+    in_memory = quiet_fit(ch4.KMeansFromScratch(**params), X.astype(dtype))
+    with contextlib.redirect_stdout(io.StringIO()):
+        sharded = ch4.KMeansFromScratch(chunk_size=100, **params).fit_shards(paths)
+
+    assert sharded.centroids.dtype == dtype
+    np.testing.assert_allclose(sharded.centroids, in_memory.centroids, rtol=1e-5)
+    assert sharded.inertia == pytest.approx(in_memory.inertia, rel=1e-5)
+
+
+# -----------------------------------------------------------------------------
+# Convergence options (user-020): incremental sums = full recomputation
+# -----------------------------------------------------------------------------
+
+@pytest.mark.parametrize('algorithm', ['lloyd', 'elkan', 'hamerly', 'yinyang'])
+@pytest.mark.parametrize('weighted', [False, True])
+def test_incremental_update_matches_full_update(algorithm, weighted):
+    X = blobs(n=3000, k=10, d=3, seed=18)
+    weights = np.random.default_rng(18).uniform(0.5, 2, size=len(X)) if weighted else None
+    params = dict(k=10, random_state=0, backend='numpy', algorithm=algorithm)
+    full = quiet_fit(ch4.KMeansFromScratch(**params), X, sample_weight=weights)
+    incremental = quiet_fit(ch4.KMeansFromScratch(incremental_update=True, **params), X,
+                            sample_weight=weights)
+
+    np.testing.assert_array_equal(incremental.labels, full.labels)
+    np.testing.assert_allclose(incremental.centroids, full.centroids, atol=1e-9)
+    assert incremental.n_iterations == full.n_iterations
+    assert incremental.inertia == pytest.approx(full.inertia)
+
+
+def test_max_label_changes_stops_early():
+    X = blobs(n=3000, k=10, d=3, seed=18)
+    params = dict(k=10, random_state=0, backend='numpy')
+    full = quiet_fit(ch4.KMeansFromScratch(**params), X)
+    early = quiet_fit(ch4.KMeansFromScratch(max_label_changes=30, **params), X)
+    assert early.n_iterations < full.n_iterations
+    assert early.inertia == pytest.approx(full.inertia, rel=0.01)
+
+
+# -----------------------------------------------------------------------------
+# Bisecting K-Means (user-022): a tree of 2-means splits
+# -----------------------------------------------------------------------------
+
+def test_bisecting_tree_predict_matches_fit_labels():
+    X = blobs(n=1500, k=12, seed=19)
+    weights = np.random.default_rng(19).uniform(0.5, 2, size=len(X))
+    model = quiet_fit(ch4.BisectingKMeans(k=12, random_state=0), X, sample_weight=weights)
+
+    assert len(model.centroids) == 12
+    assert np.count_nonzero(model.node_labels >= 0) == 12
+    expected = np.dot(weights, ((X - model.centroids[model.labels]) ** 2).sum(axis=1))
+    assert model.inertia == pytest.approx(expected)
+
+    # The tree walk reaches the leaf each training point was put in
+    np.testing.assert_array_equal(model.predict(X), model.labels)
+    assert np.ceil(np.log2(12)) <= model.tree_depth <= 11
+    assert model.n_predict_distance_evaluations <= 2 * model.tree_depth * len(X)
+
+
+def test_bisecting_kmeans_has_no_euclidean_entry_points():
+    assert not hasattr(ch4.BisectingKMeans(), 'partial_fit')
+    assert not hasattr(ch4.BisectingKMeans(), 'fit_shards')
+
+
+# -----------------------------------------------------------------------------
+# Coresets (user-023): weighted sample, unbiased cost
+# -----------------------------------------------------------------------------
+
+def test_kmeans_cost_with_weights():
+    X = blobs(n=1000, seed=9)
+    centroids = X[:3]
+    weights = np.arange(len(X), dtype=float)
+    expected = np.dot(weights, ch4.squared_distances_numpy(X, centroids).min(axis=1))
+    assert ch4.kmeans_cost(X, centroids, chunk_size=128, sample_weight=weights) == \
+        pytest.approx(expected)
+
+
+def test_lightweight_coreset_weights_and_cost_are_unbiased():
+    X = blobs(n=5000, k=5, seed=20)
+    centroids = X[:5]  # any fixed centroids, not fitted ones
+    full_cost = ch4.kmeans_cost(X, centroids)
+
+    weight_sums, costs = [], []
+    for seed in range(200):
+        points, weights = ch4.lightweight_coreset(X, 300, random_state=seed, chunk_size=700)
+        assert len(points) <= 300 and np.all(weights > 0)
+        weight_sums.append(weights.sum())
+        costs.append(ch4.kmeans_cost(points, centroids, sample_weight=weights))
+
+    # Each coreset stands in for n points; on average its cost IS the full cost
+    np.testing.assert_allclose(weight_sums, len(X), rtol=0.15)
+    assert np.mean(weight_sums) == pytest.approx(len(X), rel=0.02)
+    assert np.mean(costs) == pytest.approx(full_cost, rel=0.03)
+
+
+# -----------------------------------------------------------------------------
+# Kernel K-Means (user-024): Nyström features, curved clusters
+# -----------------------------------------------------------------------------
+
+def two_rings(n=600, seed=21):
+    """Points on two concentric rings (radius 1 and 4), and their ring."""
+    rng = np.random.default_rng(seed)
+    ring = rng.integers(2, size=n)
+    angle = rng.uniform(0, 2 * np.pi, size=n)
+    radius = np.where(ring == 0, 1.0, 4.0) + rng.normal(scale=0.1, size=n)
+    return np.c_[radius * np.cos(angle), radius * np.sin(angle)], ring
+
+
+def test_nystrom_features_reproduce_the_kernel_on_landmarks():
+    X, _ = two_rings()
+    model = quiet_fit(ch4.KernelKMeans(k=2, n_landmarks=40, gamma=0.5), X)
+    features = model.transform(model.landmarks)
+    kernel = np.exp(-0.5 * ch4.squared_distances_numpy(model.landmarks, model.landmarks))
+    np.testing.assert_allclose(features @ features.T, kernel, atol=1e-6)
+
+
+@pytest.mark.parametrize('random_state', range(3))
+def test_kernel_kmeans_separates_concentric_rings(random_state):
+    X, ring = two_rings()
+    weights = np.random.default_rng(random_state).uniform(0.5, 2, size=len(X))
+    model = quiet_fit(ch4.KernelKMeans(k=2, n_landmarks=100, random_state=random_state,
+                                       n_init=4), X, sample_weight=weights)
+    agreement = (model.labels == ring).mean()
+    assert max(agreement, 1 - agreement) == 1.0
+    np.testing.assert_array_equal(model.predict(X), model.labels)
+
+    # Plain K-Means cuts both rings with a straight line
+    flat = quiet_fit(ch4.KMeansFromScratch(k=2, random_state=random_state, backend='numpy'), X)
+    flat_agreement = (flat.labels == ring).mean()
+    assert max(flat_agreement, 1 - flat_agreement) < 0.9
+
+
+def test_kernel_kmeans_has_no_euclidean_entry_points():
+    assert not hasattr(ch4.KernelKMeans(), 'partial_fit')
+    assert not hasattr(ch4.KernelKMeans(), 'fit_shards')
+    with pytest.raises(ValueError, match='not fitted'):
+        ch4.KernelKMeans().predict([[0.0, 0.0]])
+
+
+# -----------------------------------------------------------------------------
+# k-medoids (user-025): FastPAM swaps against brute force
+# -----------------------------------------------------------------------------
+
+def total_distance(D, medoids):
+    """Sum of each point's distance to its nearest medoid."""
+    return D[:, list(medoids)].min(axis=1).sum()
+
+
+@pytest.mark.parametrize('metric', ['euclidean', 'manhattan'])
+@pytest.mark.parametrize('seed', range(6))
+def test_pam_result_has_no_improving_swap(metric, seed):
+    X = np.random.default_rng(seed).normal(size=(16, 2))
+    model = quiet_fit(ch4.KMedoids(k=3, metric=metric, random_state=seed, block_size=5), X)
+    D = ch4.pairwise_distances(X, X, metric)
+    medoids = list(model.medoid_indices)
+    cost = total_distance(D, medoids)
+    assert model.inertia == pytest.approx(cost)
+
+    # Brute force: try every single (medoid, non-medoid) swap
+    for slot, candidate in itertools.product(range(3), range(len(X))):
+        if candidate not in medoids:
+            swapped = medoids[:slot] + [candidate] + medoids[slot + 1:]
+            assert total_distance(D, swapped) >= cost - 1e-9
+
+
+def test_pam_finds_global_optimum_on_separated_clusters():
+    X = blobs(n=18, k=3, seed=11) * 5
+    model = quiet_fit(ch4.KMedoids(k=3, random_state=0), X)
+    D = ch4.pairwise_distances(X, X)
+    best = min(total_distance(D, medoids)
+               for medoids in itertools.combinations(range(len(X)), 3))
+    assert model.inertia == pytest.approx(best)
+
+
+def test_pam_single_medoid_is_the_best_point():
+    X = np.vstack([blobs(n=50, k=1, seed=12), [[500.0, 500.0]]])
+    model = quiet_fit(ch4.KMedoids(k=1, metric='manhattan'), X)
+    D = ch4.pairwise_distances(X, X, 'manhattan')
+    assert model.inertia == pytest.approx(D.sum(axis=0).min())
+
+
+@pytest.mark.parametrize('cache_blocks', [0, 1, 2, 100])
+def test_distance_cache_size_does_not_change_the_result(cache_blocks):
+    X = blobs(n=120, k=4, seed=13)
+    reference = quiet_fit(ch4.KMedoids(k=4, block_size=16, cache_blocks=100), X)
+    model = quiet_fit(ch4.KMedoids(k=4, block_size=16, cache_blocks=cache_blocks), X)
+    np.testing.assert_array_equal(model.medoid_indices, reference.medoid_indices)
+    if 0 < cache_blocks < model.cache.n_blocks and model.n_iterations > 0:
+        assert model.cache.hits > 0  # Alternating scans reuse a partial cache
+
+
+def test_clara_reports_its_full_data_cost():
+    X = blobs(n=2000, k=4, seed=14)
+    model = quiet_fit(ch4.KMedoids(k=4, method='clara', sample_size=100, n_samples=3), X)
+    D = ch4.pairwise_distances(X, X[model.medoid_indices])
+    assert model.inertia == pytest.approx(D.min(axis=1).sum())
+    np.testing.assert_array_equal(model.predict(X), model.labels)
+
+
+def test_kmedoids_rejects_unfitted_predict_and_too_few_points():
+    with pytest.raises(ValueError, match='not fitted'):
+        ch4.KMedoids(k=2).predict([[0.0, 0.0]])
+    with pytest.raises(ValueError, match='at least k=5 points'):
+        quiet_fit(ch4.KMedoids(k=5), np.zeros((4, 2)))
+    with pytest.raises(ValueError, match='sample_size must be at least k=5'):
+        ch4.KMedoids(k=5, method='clara', sample_size=3)